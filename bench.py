@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+
+#=================================#
+#        Plate Benchmarks         #
+#=================================#
+
+# Times the plate generator stage by stage: parse, render and DXF serialise, plus peak memory.
+# Runs every layout in test-data/ across the supported cutout, stab and acoustic types,
+# and a set of synthetic layouts scaled up to thousands of keys.
+
+# Results can be written out as json and compared against a previous run:
+#   python bench.py --output before.json
+#   (make changes)
+#   python bench.py --output after.json --compare before.json
+
+#=================================#
+#                                 #
+#=================================#
+
+import argparse
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import json5
+
+import kleparse
+import plategen
+
+CUTOUT_TYPES = ["mx", "mx-slightly-wider", "alps", "alps-skcp", "omron", "kailh-choc-CPG1350", "kailh-choc-mini-CPG1232"]
+STAB_TYPES = ["mx-simple", "large-cuts", "alps-aek", "alps-at101", "none"]
+ACOUSTICS_TYPES = ["none", "typical", "extreme"]
+
+SYNTHETIC_KEY_COUNTS = [1000, 2500, 5000, 10000]
+
+# Build a synthetic KLE layout with roughly key_count keys
+# Rows of 20 keys, mixing in wide keys so stabs and acoustic cuts get exercised,
+# with every fifth row sitting in a rotated zone.
+def synthetic_layout(key_count):
+
+	widths = [1, 1, 1, 1.5, 1, 1, 2, 1, 1, 1, 2.25, 1, 1, 1, 1.75, 1, 1, 2.75, 1, 6.25]
+	rows = []
+	rotated_rows = []
+	keys_left = key_count
+	row_index = 0
+
+	while (keys_left > 0):
+		row_keys = min(len(widths), keys_left)
+		if (row_index % 5 == 4):
+			# Rotated zones have to come after all the regular rows in KLE data
+			row = '{r:15,rx:' + str(row_index) + ',ry:' + str(row_index) + ',y:-0.5,x:-0.5},"R"'
+			row += ',"R"' * (row_keys - 1)
+			rotated_rows.append('[' + row + ']')
+		else:
+			row = ','.join('{w:' + str(width) + '},"K"' if width != 1 else '"K"' for width in widths[:row_keys])
+			rows.append('[' + row + ']')
+		keys_left -= row_keys
+		row_index += 1
+
+	return ',\n'.join(rows + rotated_rows)
+
+# Every (name, KLE data, option set) case to run
+def benchmark_cases(quick, engines, writers=('ezdxf',)):
+
+	cases = []
+	test_data_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'test-data')
+
+	for filename in sorted(os.listdir(test_data_dir)):
+		with open(os.path.join(test_data_dir, filename), 'r', encoding='utf-8') as input_file:
+			input_data = input_file.read()
+
+		for cutout_type in (CUTOUT_TYPES[:1] if quick else CUTOUT_TYPES):
+			for stab_type in (STAB_TYPES[:1] if quick else STAB_TYPES):
+				for acoustics_type in (ACOUSTICS_TYPES[-1:] if quick else ACOUSTICS_TYPES):
+					for engine in engines:
+						for writer in writers:
+							options = dict(plategen.DEFAULT_OPTIONS, cutout_type=cutout_type, stab_type=stab_type, acoustics_type=acoustics_type, engine=engine, dxf_writer=writer)
+							cases.append((filename, input_data, options))
+
+	for key_count in (SYNTHETIC_KEY_COUNTS[:1] if quick else SYNTHETIC_KEY_COUNTS):
+		input_data = synthetic_layout(key_count)
+		for engine in engines:
+			for writer in writers:
+				options = dict(plategen.DEFAULT_OPTIONS, acoustics_type='extreme', engine=engine, dxf_writer=writer)
+				cases.append(('synthetic-' + str(key_count), input_data, options))
+
+	return cases
+
+def make_generator(options):
+	return plategen.PlateGenerator(options['cutout_type'], options['cutout_radius'], options['stab_type'], options['stab_radius'],
+	options['acoustics_type'], options['acoustics_radius'], options['unit_width'], options['unit_height'], False, options['output_style'], options['engine'], None, options['dxf_writer'])
+
+# Run one case: best of `repeats` timed runs, then one more run under tracemalloc for peak memory
+def run_case(name, input_data, options, repeats):
+
+	best = None
+	for i in range(repeats):
+		gen = make_generator(options)
+		output_data = io.StringIO()
+		out_code = gen.generate_plate(output_data, input_data)
+		if (out_code != 0):
+			return None
+		stage_times = dict(gen.stage_times)
+		if (best is None or sum(stage_times.values()) < sum(best.values())):
+			best = stage_times
+		output_bytes = len(output_data.getvalue().encode('utf-8'))
+
+	gen = make_generator(options)
+	tracemalloc.start()
+	gen.generate_plate(io.StringIO(), input_data)
+	current_memory, peak_memory = tracemalloc.get_traced_memory()
+	tracemalloc.stop()
+
+	return {
+		'case': case_id(name, options),
+		'layout': name,
+		'cutout_type': options['cutout_type'],
+		'stab_type': options['stab_type'],
+		'acoustics_type': options['acoustics_type'],
+		'engine': options['engine'],
+		'dxf_writer': options['dxf_writer'],
+		'keys': len(plategen.parse_layout(input_data).keys),
+		'parse_s': best['parse'],
+		'render_s': best['render'],
+		'serialise_s': best['serialise'],
+		'total_s': best['parse'] + best['render'] + best['serialise'],
+		'peak_memory_bytes': peak_memory,
+		'output_bytes': output_bytes,
+	}
+
+# The default ezdxf writer is left out, so ids match results files from before there was a choice of writer
+def case_id(name, options):
+	parts = [name, options['cutout_type'], options['stab_type'], options['acoustics_type'], options['engine']]
+	if (options['dxf_writer'] != 'ezdxf'):
+		parts.append(options['dxf_writer'])
+	return '/'.join(parts)
+
+# Time reading the KLE data alone: the fast kleparse path against plain json5, plus full parse_layout
+def parse_benchmark(repeats):
+
+	test_data_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'test-data')
+	print("%-24s %12s %12s %8s %14s" % ("layout", "json5 ms", "kleparse ms", "speedup", "parse_layout ms"))
+
+	total_json5 = 0
+	total_kleparse = 0
+	for filename in sorted(os.listdir(test_data_dir)):
+		with open(os.path.join(test_data_dir, filename), 'r', encoding='utf-8') as input_file:
+			input_data = input_file.read()
+
+		json5_time = best_time(lambda: json5.loads('[' + input_data + ']'), repeats)
+		kleparse_time = best_time(lambda: kleparse.loads(input_data), repeats)
+		layout_time = best_time(lambda: plategen.parse_layout(input_data), repeats)
+		total_json5 += json5_time
+		total_kleparse += kleparse_time
+
+		print("%-24s %12.3f %12.3f %7.1fx %14.3f" % (filename, json5_time * 1000, kleparse_time * 1000, json5_time / kleparse_time, layout_time * 1000))
+
+	print("Overall speedup: %.1fx" % (total_json5 / total_kleparse))
+
+# Fastest of `repeats` runs of function, in seconds
+def best_time(function, repeats):
+	best = None
+	for i in range(repeats):
+		start = time.perf_counter()
+		function()
+		elapsed = time.perf_counter() - start
+		if (best is None or elapsed < best):
+			best = elapsed
+	return best
+
+def git_commit():
+	try:
+		return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL).decode('utf-8').strip()
+	except(OSError, subprocess.CalledProcessError):
+		return None
+
+# Print how each case moved against a previous results file
+def compare_results(results, baseline_path):
+
+	with open(baseline_path, 'r', encoding='utf-8') as baseline_file:
+		baseline = {result['case']: result for result in json.load(baseline_file)['results']}
+
+	print("")
+	print("Compared with " + baseline_path + " (ratio = now / before, lower is better):")
+	print("%-60s %8s %8s %8s %8s" % ("case", "parse", "render", "write", "total"))
+
+	total_now = 0
+	total_before = 0
+	for result in results:
+		before = baseline.get(result['case'])
+		if (before is None):
+			continue
+		ratios = [result[stage] / before[stage] if before[stage] else float('nan') for stage in ('parse_s', 'render_s', 'serialise_s', 'total_s')]
+		print("%-60s %8.2f %8.2f %8.2f %8.2f" % tuple([result['case']] + ratios))
+		total_now += result['total_s']
+		total_before += before['total_s']
+
+	if (total_before):
+		print("Overall total time ratio: %.2f" % (total_now / total_before))
+
+if __name__ == "__main__":
+
+	parser = argparse.ArgumentParser(description='Benchmark the plate generator stage by stage.')
+	parser.add_argument("--quick", help="Only run the default cutout/stab options and the smallest synthetic layout.", action="store_true", default=False)
+	parser.add_argument("--engines", help="Comma separated render engines to benchmark. Default: decimal", type=str, default='decimal')
+	parser.add_argument("--writers", help="Comma separated DXF writers to benchmark. Default: ezdxf", type=str, default='ezdxf')
+	parser.add_argument("--repeats", help="Timed runs per case; the fastest is kept. Default: 1", type=int, default=1)
+	parser.add_argument("--parse-only", help="Only benchmark reading KLE data, comparing the fast parser with json5.", action="store_true", default=False)
+	parser.add_argument("--output", help="Write results as json to this file.", type=str, default=None)
+	parser.add_argument("--compare", help="Compare against a previous json results file.", type=str, default=None)
+
+	args = parser.parse_args()
+
+	if (args.parse_only):
+		parse_benchmark(max(args.repeats, 5))
+		sys.exit(0)
+
+	results = []
+	print("%-60s %6s %8s %8s %8s %8s %10s" % ("case", "keys", "parse", "render", "write", "total", "peak MiB"))
+	for name, input_data, options in benchmark_cases(args.quick, args.engines.split(','), args.writers.split(',')):
+		result = run_case(name, input_data, options, args.repeats)
+		if (result is None):
+			print("%-60s failed" % case_id(name, options))
+			continue
+		results.append(result)
+		print("%-60s %6d %8.4f %8.4f %8.4f %8.4f %10.2f" % (result['case'], result['keys'], result['parse_s'], result['render_s'],
+		result['serialise_s'], result['total_s'], result['peak_memory_bytes'] / (1024 * 1024)))
+		sys.stdout.flush()
+
+	if (args.output):
+		with open(args.output, 'w', encoding='utf-8') as output_file:
+			json.dump({
+				'commit': git_commit(),
+				'python': platform.python_version(),
+				'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+				'results': results,
+			}, output_file, indent=1)
+
+	if (args.compare):
+		compare_results(results, args.compare)
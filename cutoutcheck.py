@@ -0,0 +1,142 @@
+#=================================#
+#       Cutout Validation         #
+#=================================#
+
+# Finds cutouts that overlap, or that leave too thin a web of plate between them.
+# Thin webs bend, snap or simply don't survive cutting, and overlaps merge two holes into one;
+# both turn up with flipped stabs (_rs), odd spacebars and acoustic cuts squeezed in beside keys.
+
+# Every cutout is a rounded rectangle, which is exactly the rectangle between its fillet centers
+# grown by the fillet radius. So the gap between two cutouts is the distance between those inner
+# rectangles minus both radii, with no approximation of the fillets needed.
+
+# Shapes are bucketed into a uniform grid by their bounding boxes, so only shapes sharing a cell
+# are ever compared, instead of every pair on the plate.
+
+# Coordinates are floats in mm; this is a check, not output, so float precision is plenty.
+
+#=================================#
+#                                 #
+#=================================#
+
+import math
+
+class CutoutShape(object):
+
+	__slots__ = ('corners', 'radius', 'min_x', 'min_y', 'max_x', 'max_y')
+
+	# corners: the inner rectangle's corners in order around it; radius: the fillet radius
+	def __init__(self, corners, radius):
+		self.corners = corners
+		self.radius = radius
+		self.min_x = min(corner[0] for corner in corners) - radius
+		self.min_y = min(corner[1] for corner in corners) - radius
+		self.max_x = max(corner[0] for corner in corners) + radius
+		self.max_y = max(corner[1] for corner in corners) + radius
+
+	def center(self):
+		return (sum(corner[0] for corner in self.corners) / len(self.corners), sum(corner[1] for corner in self.corners) / len(self.corners))
+
+# Closest point to p on the segment from a to b
+def closest_point_on_segment(p, a, b):
+	dx = b[0] - a[0]
+	dy = b[1] - a[1]
+	length_squared = dx * dx + dy * dy
+	if (length_squared == 0):
+		return a
+	t = max(0.0, min(1.0, ((p[0] - a[0]) * dx + (p[1] - a[1]) * dy) / length_squared))
+	return (a[0] + t * dx, a[1] + t * dy)
+
+# Whether two convex polygons overlap, by looking for a separating axis
+# Edge normals of both polygons are tried, plus the line between their centers for polygons
+# that have collapsed to a point or a segment.
+def polygons_overlap(a, b):
+
+	axes = []
+	for polygon in (a, b):
+		for i in range(len(polygon)):
+			start = polygon[i]
+			end = polygon[(i + 1) % len(polygon)]
+			if (start != end):
+				axes.append((start[1] - end[1], end[0] - start[0]))
+
+	center_a = (sum(point[0] for point in a) / len(a), sum(point[1] for point in a) / len(a))
+	center_b = (sum(point[0] for point in b) / len(b), sum(point[1] for point in b) / len(b))
+	if (center_a != center_b):
+		axes.append((center_b[0] - center_a[0], center_b[1] - center_a[1]))
+
+	for axis_x, axis_y in axes:
+		projections_a = [point[0] * axis_x + point[1] * axis_y for point in a]
+		projections_b = [point[0] * axis_x + point[1] * axis_y for point in b]
+		if (max(projections_a) < min(projections_b) or max(projections_b) < min(projections_a)):
+			return False
+
+	return True
+
+# Gap in mm between two cutouts, and the spot halfway across it
+# A negative or zero gap means the cutouts touch or overlap.
+def cutout_gap(shape_a, shape_b):
+
+	if (polygons_overlap(shape_a.corners, shape_b.corners)):
+		center_a = shape_a.center()
+		center_b = shape_b.center()
+		return (-(shape_a.radius + shape_b.radius), ((center_a[0] + center_b[0]) / 2, (center_a[1] + center_b[1]) / 2))
+
+	best_distance = None
+	best_points = None
+	for polygon, other in ((shape_a.corners, shape_b.corners), (shape_b.corners, shape_a.corners)):
+		for point in polygon:
+			for i in range(len(other)):
+				closest = closest_point_on_segment(point, other[i], other[(i + 1) % len(other)])
+				distance = math.hypot(point[0] - closest[0], point[1] - closest[1])
+				if (best_distance is None or distance < best_distance):
+					best_distance = distance
+					best_points = (point, closest)
+
+	midpoint = ((best_points[0][0] + best_points[1][0]) / 2, (best_points[0][1] + best_points[1][1]) / 2)
+	return (best_distance - shape_a.radius - shape_b.radius, midpoint)
+
+# Find every pair of cutouts closer than min_web
+# Returns [(index a, index b, gap, (x, y)), ...] with index a < index b, sorted by index.
+def find_thin_webs(shapes, min_web):
+
+	if (not shapes):
+		return []
+
+	# Cells about the size of a typical cutout, so each shape lands in only a few
+	cell_size = max(sum(max(shape.max_x - shape.min_x, shape.max_y - shape.min_y) for shape in shapes) / len(shapes), min_web, 1e-3)
+
+	grid = {}
+	for index, shape in enumerate(shapes):
+		# Pad each box by the web width, so shapes that close together always share a cell
+		first_x = int(math.floor((shape.min_x - min_web) / cell_size))
+		last_x = int(math.floor((shape.max_x + min_web) / cell_size))
+		first_y = int(math.floor((shape.min_y - min_web) / cell_size))
+		last_y = int(math.floor((shape.max_y + min_web) / cell_size))
+		for cell_x in range(first_x, last_x + 1):
+			for cell_y in range(first_y, last_y + 1):
+				grid.setdefault((cell_x, cell_y), []).append(index)
+
+	checked = set()
+	problems = []
+	for cell in grid.values():
+		for i in range(len(cell)):
+			for j in range(i + 1, len(cell)):
+				pair = (cell[i], cell[j]) if cell[i] < cell[j] else (cell[j], cell[i])
+				if (pair in checked):
+					continue
+				checked.add(pair)
+
+				shape_a = shapes[pair[0]]
+				shape_b = shapes[pair[1]]
+				# Boxes further apart than the web width can't be a problem
+				if (shape_a.min_x - min_web > shape_b.max_x or shape_b.min_x - min_web > shape_a.max_x
+					or shape_a.min_y - min_web > shape_b.max_y or shape_b.min_y - min_web > shape_a.max_y):
+					continue
+
+				gap, position = cutout_gap(shape_a, shape_b)
+				if (gap < min_web):
+					problems.append((pair[0], pair[1], gap, position))
+
+	problems.sort()
+	return problems
@@ -0,0 +1,233 @@
+#=================================#
+#       Minimal DXF Writer        #
+#=================================#
+
+# A lightweight stand-in for ezdxf's modelspace, and a writer that streams it out as an R12 (AC1009) DXF.
+# Plates only ever hold lines, arcs and closed polylines, so there's no need for ezdxf's entity objects,
+# handles, object tables and tag lists: each entity is a few floats in a slotted object, and writing
+# it out is one string formatting per entity, written to the stream in chunks as it goes.
+
+# The entities mimic the bits of the ezdxf entity API the generator uses (dxftype(), dxf.start, get_points() and so on),
+# so panel nesting, sessions and the tests don't need to know which writer is in use.
+# R12 has no LWPOLYLINE, so closed polylines are written as POLYLINE/VERTEX/SEQEND, which carries the same bulges.
+
+# Numbers can be rounded to a fixed number of decimal places on the way out, and are then written as short as they go:
+# 14 rather than 14.000000, 0.333333 rather than 0.3333333333333333. The native writer does that as it formats each entity.
+# ezdxf has no say over how it formats numbers, so for it RoundedLayout rounds values as they're handed over instead,
+# and ezdxf's shortest float repr then gives the short form (bar a trailing .0).
+
+#=================================#
+#                                 #
+#=================================#
+
+import math
+import re
+
+# Entities formatted per write() call on the output stream
+WRITE_CHUNK = 512
+
+# Exponent form numbers, which repr gives for anything under 1e-4
+EXPONENT_NUMBER = re.compile(r'^-?[0-9.]+e-[0-9]+$', re.MULTILINE)
+
+# Round a number to the nearest 1 / scale, e.g. scale = 1e6 for 6 decimal places
+# q / scale is the float closest to the decimal q * 10^-decimals, so its repr is that decimal or shorter.
+# This is quicker than round(value, decimals), and can only differ from it right on a tie, by float noise.
+def round_number(value, scale):
+	return math.floor(value * scale + 0.5) / scale
+
+# Rounded floats are formatted with repr, which already gives the shortest form of the rounded decimal.
+# This then goes over a whole chunk of DXF text at once to drop the trailing .0 off whole numbers, turn -0 into 0,
+# and write the odd tiny number out in full rather than in exponent form.
+# Only number lines can end in .0 or be -0: group codes have no point, and names and handles aren't written.
+def tidy_numbers(text, decimals):
+	text = text.replace('.0\n', '\n').replace('\n-0\n', '\n0\n')
+	if ('e-' in text):
+		text = EXPONENT_NUMBER.sub(lambda match: ('%.*f' % (decimals, float(match.group(0)))).rstrip('0').rstrip('.'), text)
+	return text
+
+# A LINE. dxf is the entity itself, so entity.dxf.start works as with ezdxf.
+class Line(object):
+
+	__slots__ = ('start', 'end')
+
+	def __init__(self, start, end):
+		self.start = (float(start[0]), float(start[1]))
+		self.end = (float(end[0]), float(end[1]))
+
+	@property
+	def dxf(self):
+		return self
+
+	def dxftype(self):
+		return 'LINE'
+
+	# Numbers rounded to the nearest 1 / scale (None = full precision), leaving the short form to tidy_numbers
+	# round_number is inlined here and below, as this runs for every number in the file
+	def to_dxf(self, scale=None):
+		if (scale is None):
+			return '  0\nLINE\n  8\n0\n 10\n%r\n 20\n%r\n 30\n0.0\n 11\n%r\n 21\n%r\n 31\n0.0\n' % (self.start[0], self.start[1], self.end[0], self.end[1])
+		floor = math.floor
+		return '  0\nLINE\n  8\n0\n 10\n%r\n 20\n%r\n 30\n0.0\n 11\n%r\n 21\n%r\n 31\n0.0\n' % (floor(self.start[0] * scale + 0.5) / scale, floor(self.start[1] * scale + 0.5) / scale,
+			floor(self.end[0] * scale + 0.5) / scale, floor(self.end[1] * scale + 0.5) / scale)
+
+# An ARC, counter-clockwise from start_angle to end_angle in degrees
+class Arc(object):
+
+	__slots__ = ('center', 'radius', 'start_angle', 'end_angle')
+
+	def __init__(self, center, radius, start_angle, end_angle):
+		self.center = (float(center[0]), float(center[1]))
+		self.radius = float(radius)
+		self.start_angle = float(start_angle)
+		self.end_angle = float(end_angle)
+
+	@property
+	def dxf(self):
+		return self
+
+	def dxftype(self):
+		return 'ARC'
+
+	def to_dxf(self, scale=None):
+		if (scale is None):
+			return '  0\nARC\n  8\n0\n 10\n%r\n 20\n%r\n 30\n0.0\n 40\n%r\n 50\n%r\n 51\n%r\n' % (self.center[0], self.center[1], self.radius, self.start_angle, self.end_angle)
+		floor = math.floor
+		return '  0\nARC\n  8\n0\n 10\n%r\n 20\n%r\n 30\n0.0\n 40\n%r\n 50\n%r\n 51\n%r\n' % (floor(self.center[0] * scale + 0.5) / scale, floor(self.center[1] * scale + 0.5) / scale,
+			floor(self.radius * scale + 0.5) / scale, floor(self.start_angle * scale + 0.5) / scale, floor(self.end_angle * scale + 0.5) / scale)
+
+# A closed polyline, as (x, y, start width, end width, bulge) points like ezdxf's LWPOLYLINE
+class Polyline(object):
+
+	__slots__ = ('points',)
+
+	def __init__(self, points):
+		self.set_points(points)
+
+	def dxftype(self):
+		return 'LWPOLYLINE'
+
+	def get_points(self):
+		return self.points
+
+	def set_points(self, points):
+		self.points = [(float(point[0]), float(point[1]), 0.0, 0.0, float(point[4]) if len(point) > 4 else 0.0) for point in points]
+
+	def to_dxf(self, scale=None):
+		parts = ['  0\nPOLYLINE\n  8\n0\n 66\n1\n 10\n0.0\n 20\n0.0\n 30\n0.0\n 70\n1\n']
+		for x, y, start_width, end_width, bulge in self.points:
+			if (scale is not None):
+				x = round_number(x, scale)
+				y = round_number(y, scale)
+				bulge = round_number(bulge, scale)
+			if (bulge == 0):
+				parts.append('  0\nVERTEX\n  8\n0\n 10\n%r\n 20\n%r\n 30\n0.0\n' % (x, y))
+			else:
+				parts.append('  0\nVERTEX\n  8\n0\n 10\n%r\n 20\n%r\n 30\n0.0\n 42\n%r\n' % (x, y, bulge))
+		parts.append('  0\nSEQEND\n  8\n0\n')
+		return ''.join(parts)
+
+# The plate's entities, in drawing order
+# Takes the same add_* calls as an ezdxf modelspace, for the entity types plates use.
+class PrimitiveSpace(object):
+
+	def __init__(self):
+		self.entities = []
+
+	def __len__(self):
+		return len(self.entities)
+
+	def __iter__(self):
+		return iter(self.entities)
+
+	def add_line(self, start, end):
+		entity = Line(start, end)
+		self.entities.append(entity)
+		return entity
+
+	def add_arc(self, center, radius, start_angle, end_angle):
+		entity = Arc(center, radius, start_angle, end_angle)
+		self.entities.append(entity)
+		return entity
+
+	# Polylines are always written closed, which is all plates use
+	def add_lwpolyline(self, points, dxfattribs=None):
+		entity = Polyline(points)
+		self.entities.append(entity)
+		return entity
+
+	def delete_entity(self, entity):
+		self.entities.remove(entity)
+
+	def delete_all_entities(self):
+		self.entities = []
+
+DXF_HEADER = ''.join([
+	'  0\nSECTION\n  2\nHEADER\n',
+	'  9\n$ACADVER\n  1\nAC1009\n',
+	'  9\n$INSBASE\n 10\n0.0\n 20\n0.0\n 30\n0.0\n',
+	'  0\nENDSEC\n',
+	'  0\nSECTION\n  2\nTABLES\n',
+	'  0\nTABLE\n  2\nLTYPE\n 70\n1\n',
+	'  0\nLTYPE\n  2\nCONTINUOUS\n 70\n0\n  3\nSolid line\n 72\n65\n 73\n0\n 40\n0.0\n',
+	'  0\nENDTAB\n',
+	'  0\nTABLE\n  2\nLAYER\n 70\n1\n',
+	'  0\nLAYER\n  2\n0\n 70\n0\n 62\n7\n  6\nCONTINUOUS\n',
+	'  0\nENDTAB\n',
+	'  0\nENDSEC\n',
+	'  0\nSECTION\n  2\nENTITIES\n',
+])
+
+DXF_FOOTER = '  0\nENDSEC\n  0\nEOF\n'
+
+# Stream entities out to a text stream as an R12 DXF, with numbers rounded to decimals places (None = full precision)
+# Only WRITE_CHUNK entities' worth of text is held at a time, so memory stays flat however big the plate is.
+def write_dxf(stream, entities, decimals=None):
+	scale = None if decimals is None else 10.0 ** decimals
+	stream.write(DXF_HEADER)
+	chunk = []
+	for entity in entities:
+		chunk.append(entity.to_dxf(scale))
+		if (len(chunk) >= WRITE_CHUNK):
+			stream.write(write_chunk(chunk, decimals))
+			chunk = []
+	stream.write(write_chunk(chunk, decimals))
+	stream.write(DXF_FOOTER)
+
+def write_chunk(chunk, decimals):
+	if (decimals is None):
+		return ''.join(chunk)
+	return tidy_numbers(''.join(chunk), decimals)
+
+# An ezdxf layout (the modelspace or a block) that rounds every number to decimals places as it's added
+# Takes the add_* calls the generator makes and passes everything else straight through.
+class RoundedLayout(object):
+
+	def __init__(self, layout, decimals):
+		self.layout = layout
+		self.scale = 10.0 ** decimals
+
+	def __len__(self):
+		return len(self.layout)
+
+	def __iter__(self):
+		return iter(self.layout)
+
+	def __getattr__(self, name):
+		return getattr(self.layout, name)
+
+	def round_point(self, point):
+		return (round_number(float(point[0]), self.scale), round_number(float(point[1]), self.scale))
+
+	def add_line(self, start, end):
+		return self.layout.add_line(self.round_point(start), self.round_point(end))
+
+	def add_arc(self, center, radius, start_angle, end_angle):
+		return self.layout.add_arc(self.round_point(center), round_number(float(radius), self.scale), round_number(float(start_angle), self.scale), round_number(float(end_angle), self.scale))
+
+	def add_lwpolyline(self, points, dxfattribs=None):
+		return self.layout.add_lwpolyline([self.round_point(point) + (0, 0, round_number(float(point[4]), self.scale)) for point in points], dxfattribs=dxfattribs)
+
+	def add_blockref(self, name, insert, dxfattribs=None):
+		if (dxfattribs and 'rotation' in dxfattribs):
+			dxfattribs = dict(dxfattribs, rotation=round_number(float(dxfattribs['rotation']), self.scale))
+		return self.layout.add_blockref(name, self.round_point(insert), dxfattribs=dxfattribs)
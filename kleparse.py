@@ -0,0 +1,221 @@
+#=================================#
+#         KLE Data Parser         #
+#=================================#
+
+# Fast parser for Keyboard-Layout-Editor raw data.
+# Raw data is the inside of a json5 array: rows of legends and key property objects,
+# optionally led by a metadata object, e.g.
+#   {name:"My board"},
+#   [{w:1.5},"Tab","Q","W"],
+#   ["Caps","A","S"]
+
+# json5 can read all of it, but as a pure python parser it's slow, and most of a small plate's time went into it.
+# KLE itself only ever emits a small subset of json5: unquoted keys, double quoted strings with
+# the usual escapes, plain decimal numbers, true/false/null and nested rows. That subset is read here
+# with one compiled regex and a small recursive parser.
+# Anything outside it (comments, single quotes, hex, ...) is handed to json5 instead.
+
+# Values come out exactly as json5 would give them: ints for plain integers, floats for anything else.
+
+#=================================#
+#                                 #
+#=================================#
+
+import json
+import re
+
+import json5
+
+# One token, with any whitespace before it:
+# 1 = punctuation, 2 = string contents, 3 = number, 4 = bare word (key or true/false/null)
+TOKEN_PATTERN = re.compile(r'''[ \t\r\n]*(?:
+	([\[\]{},:])
+	|"([^"\\\n]*(?:\\.[^"\\\n]*)*)"
+	|(-?(?:0|[1-9][0-9]*)(?:\.[0-9]+)?(?:[eE][-+]?[0-9]+)?)(?![A-Za-z0-9_$.])
+	|([A-Za-z_$][A-Za-z0-9_$]*)
+)''', re.VERBOSE)
+
+TRAILING_SPACE_PATTERN = re.compile(r'[ \t\r\n]*\Z')
+
+BARE_WORD_VALUES = {'true': True, 'false': False, 'null': None}
+
+# End of input marker
+END = ('end', None)
+
+# Invalid KLE data. Still a ValueError, so callers catching json5's errors keep working.
+class KLEParseError(ValueError):
+
+	def __init__(self, message, line, column):
+		ValueError.__init__(self, 'line ' + str(line) + ', column ' + str(column) + ': ' + message)
+		self.message = message
+		self.line = line
+		self.column = column
+
+# Raised inside the fast path for input it can't read, with the offset it gave up at
+class FastPathError(Exception):
+
+	def __init__(self, message, position):
+		Exception.__init__(self, message)
+		self.message = message
+		self.position = position
+
+# 1-based line and column of an offset into text
+def line_and_column(text, position):
+	line = text.count('\n', 0, position) + 1
+	column = position - (text.rfind('\n', 0, position) + 1) + 1
+	return (line, column)
+
+# Split text into (kind, value) tokens, plus the offset each token starts at
+def tokenize(text):
+
+	tokens = []
+	positions = []
+	position = 0
+	length = len(text)
+	match_token = TOKEN_PATTERN.match
+
+	while (True):
+		match = match_token(text, position)
+		if (match is None):
+			if (TRAILING_SPACE_PATTERN.match(text, position)):
+				break
+			# Point at the offending character, not the whitespace before it
+			while (position < length and text[position] in ' \t\r\n'):
+				position += 1
+			raise FastPathError('unexpected character ' + repr(text[position]), position)
+
+		punctuation, string, number, word = match.groups()
+		if (punctuation is not None):
+			tokens.append((punctuation, None))
+		elif (string is not None):
+			if ('\\' in string):
+				try:
+					string = json.loads('"' + string + '"', strict=False)
+				except(ValueError):
+					raise FastPathError('unsupported escape in string', match.start(2))
+			tokens.append(('string', string))
+		elif (number is not None):
+			if ('.' in number or 'e' in number or 'E' in number):
+				tokens.append(('value', float(number)))
+			else:
+				tokens.append(('value', int(number)))
+		else:
+			tokens.append(('word', word))
+
+		# Strings start at their opening quote
+		positions.append(match.start(match.lastindex) - (1 if string is not None else 0))
+		position = match.end()
+
+	positions.append(length)
+	return (tokens, positions)
+
+class FastParser(object):
+
+	def __init__(self, text):
+		self.tokens, self.positions = tokenize(text)
+		self.tokens.append(END)
+		self.index = 0
+
+	def fail(self, message):
+		raise FastPathError(message, self.positions[self.index])
+
+	# Parse the raw data: a comma separated run of rows, with an optional trailing comma
+	def parse(self):
+		return self.parse_sequence('end')
+
+	# Values separated by commas up to the closing token, which is consumed
+	def parse_sequence(self, closing_kind):
+
+		values = []
+		tokens = self.tokens
+
+		if (tokens[self.index][0] == closing_kind):
+			self.index += 1
+			return values
+
+		while (True):
+			values.append(self.parse_value())
+
+			kind = tokens[self.index][0]
+			if (kind == ','):
+				self.index += 1
+				if (tokens[self.index][0] == closing_kind):
+					self.index += 1
+					return values
+			elif (kind == closing_kind):
+				self.index += 1
+				return values
+			else:
+				self.fail('expected \',\' or ' + ('end of data' if closing_kind == 'end' else '\'' + closing_kind + '\''))
+
+	def parse_value(self):
+
+		kind, value = self.tokens[self.index]
+
+		if (kind == 'string' or kind == 'value'):
+			self.index += 1
+			return value
+		elif (kind == '['):
+			self.index += 1
+			return self.parse_sequence(']')
+		elif (kind == '{'):
+			self.index += 1
+			return self.parse_object()
+		elif (kind == 'word' and value in BARE_WORD_VALUES):
+			self.index += 1
+			return BARE_WORD_VALUES[value]
+		elif (kind == 'end'):
+			self.fail('unexpected end of data')
+		else:
+			self.fail('unexpected ' + (repr(value) if value is not None else '\'' + kind + '\''))
+
+	# Key/value pairs up to the closing brace, which is consumed
+	def parse_object(self):
+
+		result = {}
+		tokens = self.tokens
+
+		if (tokens[self.index][0] == '}'):
+			self.index += 1
+			return result
+
+		while (True):
+			kind, key = tokens[self.index]
+			if (kind != 'word' and kind != 'string'):
+				self.fail('expected a property name')
+			self.index += 1
+
+			if (tokens[self.index][0] != ':'):
+				self.fail('expected \':\'')
+			self.index += 1
+
+			result[key] = self.parse_value()
+
+			kind = tokens[self.index][0]
+			if (kind == ','):
+				self.index += 1
+				if (tokens[self.index][0] == '}'):
+					self.index += 1
+					return result
+			elif (kind == '}'):
+				self.index += 1
+				return result
+			else:
+				self.fail('expected \',\' or \'}\'')
+
+# Parse KLE raw data into a list of rows (and metadata objects)
+# Raises KLEParseError, with the line and column of the problem, on invalid data.
+def loads(text):
+
+	try:
+		return FastParser(text).parse()
+	except(FastPathError) as error:
+		fast_path_error = error
+
+	# Not something the fast path reads; let json5 have a go before giving up
+	# The closing bracket goes on its own line, so a comment on the last line can't swallow it.
+	try:
+		return json5.loads('[' + text + '\n]')
+	except(ValueError):
+		line, column = line_and_column(text, fast_path_error.position)
+		raise KLEParseError(fast_path_error.message, line, column) from None
@@ -0,0 +1,107 @@
+#=================================#
+#          Sheet Nesting          #
+#=================================#
+
+# Packs plate bounding rectangles onto a sheet, for cutting several plates from one panel.
+
+# Skyline bottom-left packing: the sheet is filled upwards from its bottom edge, and the top edge
+# of everything placed so far is kept as a "skyline" of horizontal segments.
+# Each rectangle, biggest first, goes wherever its top would end up lowest (leftmost on ties),
+# trying both orientations when rotation is allowed.
+
+# Sizes and positions are Decimals in mm, with (0, 0) at the bottom left corner of the sheet.
+
+#=================================#
+#                                 #
+#=================================#
+
+from decimal import Decimal
+
+# Find the best spot on the skyline for a w x h rectangle
+# Returns (top, x, y, segment index), or None if it doesn't fit anywhere.
+def find_position(skyline, width, height, sheet_width, sheet_height):
+
+	best = None
+	for i in range(len(skyline)):
+		x = skyline[i][0]
+		if (x + width > sheet_width):
+			break
+
+		# The rectangle rests on the highest segment under it
+		y = Decimal('0')
+		covered = Decimal('0')
+		j = i
+		while (covered < width):
+			segment_x, segment_y, segment_width = skyline[j]
+			y = max(y, segment_y)
+			covered = segment_x + segment_width - x
+			j += 1
+
+		if (y + height > sheet_height):
+			continue
+		if (best is None or (y + height, x) < (best[0], best[1])):
+			best = (y + height, x, y, i)
+
+	return best
+
+# Raise the skyline under a rectangle placed at (x, y)
+def add_to_skyline(skyline, x, y, width, height):
+
+	right = x + width
+	new_skyline = []
+	for segment_x, segment_y, segment_width in skyline:
+		segment_right = segment_x + segment_width
+		# Keep whatever sticks out either side of the rectangle
+		if (segment_x < x):
+			new_skyline.append((segment_x, segment_y, min(segment_right, x) - segment_x))
+		if (segment_right > right):
+			start = max(segment_x, right)
+			new_skyline.append((start, segment_y, segment_right - start))
+	new_skyline.append((x, y + height, width))
+	new_skyline.sort()
+
+	# Merge neighbours at the same height
+	merged = [new_skyline[0]]
+	for segment in new_skyline[1:]:
+		last = merged[-1]
+		if (last[1] == segment[1] and last[0] + last[2] == segment[0]):
+			merged[-1] = (last[0], last[1], last[2] + segment[2])
+		else:
+			merged.append(segment)
+
+	skyline[:] = merged
+
+# Pack rectangles onto a sheet, keeping at least spacing between them and from the sheet edges
+# sizes is a list of (width, height). Returns a list of (x, y, rotated) for each rectangle in the same order,
+# where (x, y) is the bottom left corner of the rectangle as placed and rotated means turned 90 degrees,
+# or None if they don't all fit.
+def pack_rectangles(sizes, sheet_width, sheet_height, spacing, allow_rotation=True):
+
+	# Pad every rectangle by the spacing on its right and top, and shrink the sheet to match,
+	# so rectangles packed edge to edge come out spacing apart and spacing in from the edges
+	usable_width = sheet_width - spacing
+	usable_height = sheet_height - spacing
+	skyline = [(Decimal('0'), Decimal('0'), usable_width)]
+
+	placements = [None] * len(sizes)
+	for index in sorted(range(len(sizes)), key=lambda i: (-max(sizes[i]), -min(sizes[i]), i)):
+		width, height = sizes[index]
+
+		options = [(width + spacing, height + spacing, False)]
+		if (allow_rotation and width != height):
+			options.append((height + spacing, width + spacing, True))
+
+		best = None
+		for padded_width, padded_height, rotated in options:
+			position = find_position(skyline, padded_width, padded_height, usable_width, usable_height)
+			if (position is not None and (best is None or position[:2] < best[0][:2])):
+				best = (position, padded_width, padded_height, rotated)
+
+		if (best is None):
+			return None
+
+		(top, x, y, segment_index), padded_width, padded_height, rotated = best
+		add_to_skyline(skyline, x, y, padded_width, padded_height)
+		placements[index] = (x + spacing, y + spacing, rotated)
+
+	return placements
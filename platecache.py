@@ -0,0 +1,176 @@
+#=================================#
+#        Plate Result Cache       #
+#=================================#
+
+# Content-addressed cache for generated plate DXFs.
+# The same KLE data with the same options always makes the same plate,
+# so finished DXF bytes are kept around and served straight back on repeat requests.
+
+# Two tiers, each an LRU bounded by the total size of the stored DXFs:
+# - In memory
+# - An optional directory on disk, which survives restarts and is shared between worker processes
+#   Each process keeps its own index of the files and prunes the least recently used ones past the budget;
+#   last use is kept in the files' mtimes, so the order carries over a restart.
+
+#=================================#
+#                                 #
+#=================================#
+
+import collections
+import hashlib
+import os
+import tempfile
+import threading
+
+# Normalise KLE raw data so trivially different pastes share a cache entry
+# KLE strings can't contain literal line breaks, so indentation and line endings never matter.
+def normalise_kle_data(kle_data):
+	return '\n'.join(line.strip() for line in kle_data.strip().splitlines())
+
+# Cache key for a plate: hash of the normalised KLE data plus every option that affects the output
+# Options are taken exactly as given, as PlateGenerator takes them: " mx " is an error, not mx.
+def make_cache_key(kle_data, options):
+	key_hash = hashlib.sha256()
+	for option in options:
+		key_hash.update(str(option).encode('utf-8'))
+		key_hash.update(b'\0')
+	key_hash.update(normalise_kle_data(kle_data).encode('utf-8'))
+	return key_hash.hexdigest()
+
+class PlateCache(object):
+
+	def __init__(self, max_bytes, cache_dir=None, max_disk_bytes=1024 * 1024 * 1024):
+
+		# Memory budget for stored DXFs, in bytes
+		self.max_bytes = max_bytes
+
+		# Optional directory for the on-disk tier, and its budget in bytes
+		self.cache_dir = cache_dir
+		self.max_disk_bytes = max_disk_bytes
+
+		# key -> DXF bytes, least recently used first
+		self.entries = collections.OrderedDict()
+		self.current_bytes = 0
+
+		# key -> size of its file on disk, least recently used first
+		self.disk_entries = collections.OrderedDict()
+		self.disk_bytes = 0
+
+		# Web workers may share the cache between threads
+		self.lock = threading.Lock()
+
+		if (self.cache_dir):
+			os.makedirs(self.cache_dir, exist_ok=True)
+			self.load_disk_entries()
+
+	def disk_path(self, key):
+		return os.path.join(self.cache_dir, key + '.dxf')
+
+	# Index the plates already on disk, e.g. from before a restart, least recently used first
+	def load_disk_entries(self):
+
+		found = []
+		for entry in os.scandir(self.cache_dir):
+			if (entry.name.endswith('.dxf') and entry.is_file()):
+				stat = entry.stat()
+				found.append((stat.st_mtime, entry.name[:-len('.dxf')], stat.st_size))
+
+		with self.lock:
+			for mtime, key, size in sorted(found):
+				self.disk_entries[key] = size
+				self.disk_bytes += size
+			self.prune_disk()
+
+	# Look up a plate. Returns the DXF bytes, or None on a miss.
+	def get(self, key):
+
+		with self.lock:
+			data = self.entries.get(key)
+			if (data is not None):
+				self.entries.move_to_end(key)
+				return data
+
+		if (not self.cache_dir):
+			return None
+
+		try:
+			with open(self.disk_path(key), 'rb') as cache_file:
+				data = cache_file.read()
+		except(OSError):
+			# Pruned, possibly by another process
+			with self.lock:
+				self.forget_disk_entry(key)
+			return None
+
+		# Note the use, both here and in the file's mtime for after a restart
+		with self.lock:
+			self.add_disk_entry(key, len(data))
+		try:
+			os.utime(self.disk_path(key))
+		except(OSError):
+			pass
+
+		# Promote to memory for next time
+		self.store_in_memory(key, data)
+		return data
+
+	# Store a finished plate in both tiers
+	def put(self, key, data):
+
+		self.store_in_memory(key, data)
+
+		if (not self.cache_dir or len(data) > self.max_disk_bytes):
+			return
+
+		# Write to a temporary file first, so other processes never see half a DXF
+		try:
+			file_handle, temp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+			with os.fdopen(file_handle, 'wb') as cache_file:
+				cache_file.write(data)
+			os.replace(temp_path, self.disk_path(key))
+		except(OSError):
+			return
+
+		with self.lock:
+			self.add_disk_entry(key, len(data))
+			self.prune_disk()
+
+	# Note a plate on disk as the most recently used. Call with the lock held.
+	def add_disk_entry(self, key, size):
+		self.forget_disk_entry(key)
+		self.disk_entries[key] = size
+		self.disk_bytes += size
+
+	def forget_disk_entry(self, key):
+		size = self.disk_entries.pop(key, None)
+		if (size is not None):
+			self.disk_bytes -= size
+
+	# Delete least recently used plates from disk until back under budget. Call with the lock held.
+	def prune_disk(self):
+		while (self.disk_bytes > self.max_disk_bytes):
+			evicted_key, evicted_size = self.disk_entries.popitem(last=False)
+			self.disk_bytes -= evicted_size
+			try:
+				os.remove(self.disk_path(evicted_key))
+			except(OSError):
+				pass
+
+	def store_in_memory(self, key, data):
+
+		# Anything bigger than the whole budget would only flush everything else out
+		if (len(data) > self.max_bytes):
+			return
+
+		with self.lock:
+			old_data = self.entries.pop(key, None)
+			if (old_data is not None):
+				self.current_bytes -= len(old_data)
+
+			self.entries[key] = data
+			self.current_bytes += len(data)
+
+			# Evict least recently used plates until back under budget
+			while (self.current_bytes > self.max_bytes):
+				evicted_key, evicted_data = self.entries.popitem(last=False)
+				self.current_bytes -= len(evicted_data)
@@ -24,124 +24,166 @@
 import ezdxf
 import sys
 import json5
+import kleparse
+import toolpath
+import nesting
+import cutoutcheck
+import dxfwriter
 import argparse
+import io
+import json
+import hashlib
+import math
+import time
+import os
+import concurrent.futures
+import zipfile
 
-from mpmath import *
-from decimal import *
+from mpmath import MPContext
+from decimal import Decimal, Context, localcontext
 
-class PlateGenerator(object):
+# numpy is optional, and only needed for the numpy render engine
+try:
+	import numpy
+except ImportError:
+	numpy = None
 
-	#init
-	def __init__(self, arg_ct, arg_cr, arg_st, arg_sr, arg_at, arg_ar, arg_uw, arg_uh, arg_db):
+# The numpy engine snaps every output coordinate to this many decimal places (mm),
+# which cleans up float noise such as 13.999999999999998 on unrotated cutouts.
+NUMPY_SNAP_DECIMALS = 9
 
-		# Set up decimal and mpmath
-		getcontext().prec = 50
-		mp.dps = 50
-		mp.pretty = True
+# Working precision in digits for Decimal and mpmath maths.
+# Every generation runs in its own contexts at this precision rather than touching the process-wide ones,
+# so several plates can be generated at once on different threads.
+DECIMAL_PRECISION = 50
 
-		# Create blank dxf workspace
-		self.plate = ezdxf.new(dxfversion='AC1024')
-		self.modelspace = self.plate.modelspace()
+# SVG previews: blank space around the plate and line width, in mm
+SVG_MARGIN = 5
+SVG_STROKE_WIDTH = 0.2
 
-		# Cutout type: mx, mx-slightly-wider, alps
-		self.cutout_type = arg_ct
+# Narrowest web of plate, in mm, left between two cutouts before validate_cutouts warns about it
+DEFAULT_MIN_WEB = 1
 
-		# Cutout radius: The fillet radius ( 0 <= x <= 1/2 cutout width or height )
-		try:
-			self.cutout_radius = Decimal(arg_cr)
-		except:
-			raise ValueError
+# Widest min_web validate_cutouts takes, in mm. Past this nearly every pair of neighbouring cutouts is a warning,
+# and the check tends towards comparing every cutout with every other.
+MAX_MIN_WEB = 10
 
-		# Stab type: mx-simple, large-cuts, alps-aek, alps-at101
-		self.stab_type = arg_st
+# Every number in the DXF is rounded to this, in mm: far finer than any plate is cut, far coarser than float noise
+DEFAULT_OUTPUT_PRECISION = '1e-6'
 
-		# Stab radius: The fillet radius for stab cutouts ( 0 <= x <= 1 )
-		try:
-			self.stab_radius = Decimal(arg_sr)
-		except:
-			raise ValueError
+# Switch cutout and stabilizer types PlateGenerator knows how to draw
+CUTOUT_TYPES = ("mx", "mx-slightly-wider", "alps", "alps-skcp", "omron", "kailh-choc-CPG1350", "kailh-choc-mini-CPG1232")
+STAB_TYPES = ("mx-simple", "large-cuts", "alps-aek", "alps-at101", "none")
 
-		# Acoustic cuts: The cutouts typically found on high end plates beside the switches.
-		# This script only handles the thin short cuts vertically beside each switch cut, not the large ones, i.e. between fn row and alphas.
-		# none = disabled, typical = 1.5-1.75U only, extreme = On 1.5-2.75U
-		self.acoustics_type = arg_at
+# What each cutout block is called in validation warnings
+CUTOUT_KINDS = {'SWITCH_CUTOUT': 'switch', 'STAB_CUTOUT': 'stab', 'ACOUSTIC_CUTOUT': 'acoustic'}
 
-		# Acoustic radius: Fillet radius for cuts mentioned above.
-		try:
-			self.acoustics_radius = Decimal(arg_ar)
-		except:
-			raise ValueError
+#=================================#
+#          Layout model           #
+#=================================#
 
-		# Unit size (i.e. 1U = 19.05mm). ( 0 <= x <= inf, cap at 1000 for now )
-		try:
-			self.unit_width = Decimal(arg_uw)
-		except:
-			raise ValueError
-		try:
-			self.unit_height = Decimal(arg_uh)
-		except:
-			raise ValueError
+# One key of a parsed layout, in KLE units
+# x/y is the upper left corner before rotation, with y growing downwards as negative values.
+# rx/ry/angle give the rotation anchor and angle (both 0 outside of rotated zones).
+# cutout_angle/stab_angle are the extra switch cutout and stabilizer rotations on top of angle.
+class KeyRecord(object):
+
+	__slots__ = ('x', 'y', 'w', 'h', 'w2', 'h2', 'rx', 'ry', 'angle', 'cutout_angle', 'stab_angle')
+	
+	def __init__(self, x, y, w, h, w2, h2, rx, ry, angle, cutout_angle, stab_angle):
+		self.x = x
+		self.y = y
+		self.w = w
+		self.h = h
+		self.w2 = w2
+		self.h2 = h2
+		self.rx = rx
+		self.ry = ry
+		self.angle = angle
+		self.cutout_angle = cutout_angle
+		self.stab_angle = stab_angle
+	
+	def as_tuple(self):
+		return (self.x, self.y, self.w, self.h, self.w2, self.h2, self.rx, self.ry, self.angle, self.cutout_angle, self.stab_angle)
+	
+	def __eq__(self, other):
+		return isinstance(other, KeyRecord) and self.as_tuple() == other.as_tuple()
+	
+	def __hash__(self):
+		return hash(self.as_tuple())
 		
+	def __repr__(self):
+		return "KeyRecord" + repr(tuple(str(value) for value in self.as_tuple()))
 
-		#== Debug parameters ==#
+# A parsed layout: the key records plus the plate bounds in KLE units
+# The layout doesn't depend on any cutout, stab or unit size options, so it can be kept and rendered again with different ones.
+class Layout(object):
 
-		# Tell user everything about what's going on and spam the console?
-		self.debug_log = arg_db
+	__slots__ = ('keys', 'width', 'height')
+	
+	def __init__(self, keys, width, height):
+		self.keys = keys
+		self.width = width
+		self.height = height
+		
+	def __eq__(self, other):
+		return isinstance(other, Layout) and self.to_data() == other.to_data()
+	
+	def __hash__(self):
+		return hash(self.digest())
+	
+	# Plain json-friendly form. Decimals are kept as strings so nothing is lost on the way through.
+	def to_data(self):
+		return {
+			'width': str(self.width),
+			'height': str(self.height),
+			'keys': [[str(value) for value in key.as_tuple()] for key in self.keys],
+		}
+	
+	@classmethod
+	def from_data(cls, data):
+		keys = [KeyRecord(*[Decimal(value) for value in key]) for key in data['keys']]
+		return cls(keys, Decimal(data['width']), Decimal(data['height']))
+	
+	# Keys grouped by rotation cluster: (rx, ry, angle) -> indices of its keys, in KLE order
+	# Keys outside of rotated zones all land in the (0, 0, 0) cluster.
+	def rotation_clusters(self):
+		clusters = {}
+		for index, key in enumerate(self.keys):
+			clusters.setdefault((key.rx, key.ry, key.angle), []).append(index)
+		return clusters
+	
+	# Content hash of the layout, for caching renders
+	def digest(self):
+		return hashlib.sha256(json.dumps(self.to_data(), separators=(',', ':')).encode('utf-8')).hexdigest()
 
-		# Runtime vars that are often systematically changed or reset
+# Turns KLE raw data into a Layout
+# Holds the KLE parsing state, which changes from key to key as data fields come and go.
+class LayoutParser(object):
 
+	def __init__(self, arg_db=False):
+	
+		# Tell user everything about what's going on and spam the console?
+		self.debug_log = arg_db
+		
 		# Current x/y coordinates
 		self.current_x = Decimal('0')
 		self.current_y = Decimal('0')
 		self.max_width = Decimal('0')
 		self.max_height = Decimal('0')
-
-		# Cutout sizes
-		self.cutout_width = Decimal('0')
-		self.cutout_height = Decimal('0')
-
+		
 		# Used for parsing
 		self.reset_key_parameters()
 		self.current_rotx = "NONE"
 		self.current_roty = "NONE"
 		self.current_angle = "NONE"
 		
-	#=================================#
-	#            Classes              #
-	#=================================#
-
-	class Switch:
-		
-		def __init__(self, x_var, y_var):
-			# These fields correspond to the respective kle data
-			self.x = x_var
-			self.y = y_var
-			self.width = 1
-			self.height = 1
-			self.width_secondary = 1
-			self.height_secondary = 1
-			self.rotx = 0
-			self.roty = 0
-			self.angle = 0
-			self.cutout_angle = 0
-			self.stab_angle = 0
-			self.offset_x = 0
-			self.offset_y = 0
-		
-	#=================================#
-	#           Functions             #
-	#=================================#
-		
-	# Check if string is valid number
-	# Credits to https://stackoverflow.com/questions/4138202/using-isdigit-for-floats
-	def is_a_number(self, s):
-		return_value = True
-		try:
-			test_float = float(s)
-		except ValueError:
-			return_value = False
-		return return_value
-				
+		# Values of the previous rotated key, which KLE carries over to the next one
+		self.previous_rotx = "NONE"
+		self.previous_roty = "NONE"
+		self.previous_angle = "NONE"
+		self.previous_offset_x = Decimal('0')
+	
 	# Reset key default parameters
 	def reset_key_parameters(self):
 		
@@ -168,418 +210,39 @@ class PlateGenerator(object):
 		self.current_rotx = "UNCHANGED"
 		self.current_roty = "UNCHANGED"
 		self.current_angle = "UNCHANGED"
-				
-	# Modifies a point with rotation
-	def rotate_point_around_anchor(self, x, y, anchor_x, anchor_y, angle):
-		radius_squared = ((x - anchor_x) ** Decimal('2')) + ((y-anchor_y) ** Decimal('2'))
-		radius = Decimal.sqrt(radius_squared)
-		anglefrac = angle.as_integer_ratio()
-		radian_qty = radians(anglefrac[0]/anglefrac[1])
-		cos_result = Decimal(str(cos(radian_qty)))
-		sin_result = Decimal(str(sin(radian_qty)))
-		
-		old_x = x - anchor_x
-		old_y = y - anchor_y
-		
-		coord = matrix([float(old_x), float(old_y)])
-		transform = matrix([[cos(radian_qty), -sin(radian_qty)], [sin(radian_qty), cos(radian_qty)]])
-		result = transform * coord
-		
-		new_x = Decimal(str(result[0]))
-		new_y = Decimal(str(result[1]))
-		
-		new_x += anchor_x
-		new_y += anchor_y
-		
-		return (new_x, new_y)
-		
-	# Draw line segment rotated with respect to an anchor
-	def draw_rotated_line(self, x1, y1, x2, y2, anchor_x, anchor_y, angle):
-		coords_1 = self.rotate_point_around_anchor(x1, y1, anchor_x, anchor_y, angle)
-		coords_2 = self.rotate_point_around_anchor(x2, y2, anchor_x, anchor_y, angle)
-		
-		self.modelspace.add_line((coords_1[0], coords_1[1]), (coords_2[0], coords_2[1]))
-		
-	# Draw arc rotated with respect to an anchor
-	def draw_rotated_arc(self, x, y, anchor_x, anchor_y, radius, angle_start, angle_end, rotation):
-		coords = self.rotate_point_around_anchor(x, y, anchor_x, anchor_y, rotation)
-		self.modelspace.add_arc((coords[0], coords[1]), radius, float(angle_start + rotation), float(angle_end + rotation))
-		
-	# Stab cutout maker
-	# The x and y are center, like this:
-	#
-	# -------
-	# |     |
-	# |  X  | -  -  -  Center Y of switch
-	# |     |
-	# |_   _|
-	#   |_|
-
-	def make_stab_cutout(self, x, y, anchor_x, anchor_y, angle):
-
-		line_segments = []
-		corners = []
-		
-		if (self.stab_type == "mx-simple"):
-			# Rectangular simplified mx cutout.
-			# A bit larger than stock to account for fillets.
-			
-			line_segments.append((Decimal('-3.375') + self.stab_radius, Decimal('6'), Decimal('3.375') - self.stab_radius, Decimal('6')))
-			line_segments.append((Decimal('-3.375') + self.stab_radius, Decimal('-8'), Decimal('3.375') - self.stab_radius, Decimal('-8')))
-			line_segments.append((Decimal('-3.375'), Decimal('6') - self.stab_radius, Decimal('-3.375'), Decimal('-8') + self.stab_radius))
-			line_segments.append((Decimal('3.375'), Decimal('6') - self.stab_radius, Decimal('3.375'), Decimal('-8') + self.stab_radius))
-			
-			corners.append((Decimal('-3.375') + self.stab_radius, Decimal('6') - self.stab_radius, 90, 180))
-			corners.append((Decimal('3.375') - self.stab_radius, Decimal('6') - self.stab_radius, 0, 90))
-			corners.append((Decimal('-3.375') + self.stab_radius, Decimal('-8') + self.stab_radius, 180, 270))
-			corners.append((Decimal('3.375') - self.stab_radius, Decimal('-8') + self.stab_radius, 270, 360))
-			
-		elif (self.stab_type == "large-cuts"):
-			# Large, spacious 15x7 cutouts; 1mm from mx switch cutout top
-			
-			line_segments.append((Decimal('-3.5') + self.stab_radius, Decimal('6'), Decimal('3.5') - self.stab_radius, Decimal('6')))
-			line_segments.append((Decimal('-3.5') + self.stab_radius, Decimal('-9'), Decimal('3.5') - self.stab_radius, Decimal('-9')))
-			line_segments.append((Decimal('-3.5'), Decimal('6') - self.stab_radius, Decimal('-3.5'), Decimal('-9') + self.stab_radius))
-			line_segments.append((Decimal('3.5'), Decimal('6') - self.stab_radius, Decimal('3.5'), Decimal('-9') + self.stab_radius))
-			
-			corners.append((Decimal('-3.5') + self.stab_radius, Decimal('6') - self.stab_radius, 90, 180))
-			corners.append((Decimal('3.5') - self.stab_radius, Decimal('6') - self.stab_radius, 0, 90))
-			corners.append((Decimal('-3.5') + self.stab_radius, Decimal('-9') + self.stab_radius, 180, 270))
-			corners.append((Decimal('3.5') - self.stab_radius, Decimal('-9') + self.stab_radius, 270, 360))
-			
-		elif (self.stab_type == "alps-aek" or self.stab_type == "alps-at101"):
-			# Rectangles 2.67 wide, 5.21 high.
-			
-			line_segments.append((Decimal('-1.335') + self.stab_radius, Decimal('-3.875'), Decimal('1.335') - self.stab_radius, Decimal('-3.875')))
-			line_segments.append((Decimal('-1.335') + self.stab_radius, Decimal('-9.085'), Decimal('1.335') - self.stab_radius, Decimal('-9.085')))
-			line_segments.append((Decimal('-1.335'), Decimal('-3.875') - self.stab_radius, Decimal('-1.335'), Decimal('-9.085') + self.stab_radius))
-			line_segments.append((Decimal('1.335'), Decimal('-3.875') - self.stab_radius, Decimal('1.335'), Decimal('-9.085') + self.stab_radius))
-			
-			corners.append((Decimal('-1.335') + self.stab_radius, Decimal('-3.875') - self.stab_radius, 90, 180))
-			corners.append((Decimal('1.335') - self.stab_radius, Decimal('-3.875') - self.stab_radius, 0, 90))
-			corners.append((Decimal('-1.335') + self.stab_radius, Decimal('-9.085') + self.stab_radius, 180, 270))
-			corners.append((Decimal('1.335') - self.stab_radius, Decimal('-9.085') + self.stab_radius, 270, 360))		
-		elif (self.stab_type == "none"):
-			pass
-
-		else:
-			print("Unsupported stab type.", file=sys.stderr)
-			print("Stab types: mx-simple, large-cuts, alps-aek, alps-at101, none", file=sys.stderr)
-			#exit(1)
-			return(2)
-			
-		for line in line_segments:
-			self.draw_rotated_line(x + Decimal(str(line[0])), y + Decimal(str(line[1])), x + Decimal(str(line[2])), y + Decimal(str(line[3])), anchor_x, anchor_y, angle)
-			
-		for arc in corners:
-			self.draw_rotated_arc(x + Decimal(str(arc[0])), y + Decimal(str(arc[1])), anchor_x, anchor_y, self.stab_radius, arc[2], arc[3], angle)
-			
-	# Acoustics cuts maker
+	
+	# Parse KLE data. Raises ValueError on invalid KLE data; kleparse.KLEParseError if it couldn't be read at all.
+	def parse(self, input_data):
+	
+		# Sanitize by removing \" (KLE's literal " for a label)
+		#input_data = input_data.replace('\n', '')
+		#input_data = input_data.replace(r'\"', '')
 
-	def make_acoustic_cutout(self, x, y, anchor_x, anchor_y, angle):
-			
-		line_segments = []
-		corners = []
-		
-		if (self.cutout_type == "mx" or self.cutout_type == "alps"):
-			
-			line_segments.append((Decimal('-1') + self.acoustics_radius, (self.cutout_height / Decimal('2')), Decimal('1') - self.acoustics_radius, (self.cutout_height / Decimal('2'))))
-			line_segments.append((Decimal('-1') + self.acoustics_radius, (self.cutout_height / -Decimal('2')), Decimal('1') - self.acoustics_radius, (self.cutout_height / -Decimal('2'))))
-			line_segments.append((Decimal('-1'), (self.cutout_height / Decimal('2')) - self.acoustics_radius, Decimal('-1'), (self.cutout_height / -Decimal('2')) + self.acoustics_radius))
-			line_segments.append((Decimal('1'), (self.cutout_height / Decimal('2')) - self.acoustics_radius, Decimal('1'), (self.cutout_height / -Decimal('2')) + self.acoustics_radius))
-			
-			corners.append((Decimal('-1') + self.acoustics_radius, (self.cutout_height / Decimal('2')) - self.acoustics_radius, 90, 180))
-			corners.append((Decimal('1') - self.acoustics_radius, (self.cutout_height / Decimal('2')) - self.acoustics_radius, 0, 90))
-			corners.append((Decimal('-1') + self.acoustics_radius, (self.cutout_height / -Decimal('2')) + self.acoustics_radius, 180, 270))
-			corners.append((Decimal('1') - self.acoustics_radius, (self.cutout_height / -Decimal('2')) + self.acoustics_radius, 270, 360))
-			
-		for line in line_segments:
-			self.draw_rotated_line(x + Decimal(str(line[0])), y + Decimal(str(line[1])), x + Decimal(str(line[2])), y + Decimal(str(line[3])), anchor_x, anchor_y, angle)
-			
-		for arc in corners:
-			self.draw_rotated_arc(x + Decimal(str(arc[0])), y + Decimal(str(arc[1])), anchor_x, anchor_y, self.acoustics_radius, arc[2], arc[3], angle)
-		
-			
-	# Calls make stab cutout based on unit width and style
-	def generate_stabs(self, center_x, center_y, angle, unitwidth):
+		# TODO: Filter out improper quotes from " being in a label!
 
-		if (self.stab_type == "mx-simple" or self.stab_type == "large-cuts"):
-			# Switch based on unit width
-			# These spacings are based on official mx datasheets and deskthority measurements
-			if (unitwidth >= 8): 
-				# self.make_stab_cutout(x, y, anchor_x, anchor_y, angle)
-				self.make_stab_cutout(center_x + Decimal('66.675'), center_y, center_x, center_y, angle)
-				self.make_stab_cutout(center_x - Decimal('66.675'), center_y, center_x, center_y, angle)
-			elif (unitwidth >= 7): 
-				self.make_stab_cutout(center_x + Decimal('57.15'), center_y, center_x, center_y, angle)
-				self.make_stab_cutout(center_x - Decimal('57.15'), center_y, center_x, center_y, angle)
-			elif (unitwidth == 6.25): 
-				self.make_stab_cutout(center_x + Decimal('50'), center_y, center_x, center_y, angle)
-				self.make_stab_cutout(center_x - Decimal('50'), center_y, center_x, center_y, angle)
-			elif (unitwidth == 6): 
-				self.make_stab_cutout(center_x + Decimal('38.1'), center_y, center_x, center_y, angle)
-				self.make_stab_cutout(center_x - Decimal('57.15'), center_y, center_x, center_y, angle)
-			elif (unitwidth >= 3): 
-				self.make_stab_cutout(center_x + Decimal('19.05'), center_y, center_x, center_y, angle)
-				self.make_stab_cutout(center_x - Decimal('19.05'), center_y, center_x, center_y, angle)
-			elif (unitwidth >= 2): 
-				self.make_stab_cutout(center_x + Decimal('11.938'), center_y, center_x, center_y, angle)
-				self.make_stab_cutout(center_x - Decimal('11.938'), center_y, center_x, center_y, angle)
-				if (self.acoustics_type == "extreme"):
-					self.make_acoustic_cutout(center_x + Decimal('18.25'), center_y, center_x, center_y, angle)
-					self.make_acoustic_cutout(center_x - Decimal('18.25'), center_y, center_x, center_y, angle)
-			elif (unitwidth >= 1.5):
-				if (self.acoustics_type == "typical" or (self.acoustics_type == "extreme")):
-					self.make_acoustic_cutout(center_x + Decimal('11.6'), center_y, center_x, center_y, angle)
-					self.make_acoustic_cutout(center_x - Decimal('11.6'), center_y, center_x, center_y, angle)
-		elif (self.stab_type == "alps-aek"):
-			# These are mostly based on measurements. 
-			# If someone has datasheets, please let me know
-			if (unitwidth >= 6.5): 
-				self.make_stab_cutout(center_x + Decimal('45.3'), center_y, center_x, center_y, angle)
-				self.make_stab_cutout(center_x - Decimal('45.3'), center_y, center_x, center_y, angle)
-			elif (unitwidth >= 6.25): 
-				self.make_stab_cutout(center_x + Decimal('41.86'), center_y, center_x, center_y, angle)
-				self.make_stab_cutout(center_x - Decimal('41.86'), center_y, center_x, center_y, angle)
-			elif (unitwidth >= 2): 
-				self.make_stab_cutout(center_x + Decimal('14'), center_y, center_x, center_y, angle)
-				self.make_stab_cutout(center_x - Decimal('14'), center_y, center_x, center_y, angle)
-			elif (unitwidth >= 1.75): 
-				self.make_stab_cutout(center_x + Decimal('12'), center_y, center_x, center_y, angle)
-				self.make_stab_cutout(center_x - Decimal('12'), center_y, center_x, center_y, angle)
-		elif (self.stab_type == "alps-at101"):
-			# These are mostly based on measurements. 
-			# If someone has datasheets, please let me know
-			if (unitwidth >= 6.5): 
-				self.make_stab_cutout(center_x + Decimal('45.3'), center_y, center_x, center_y, angle)
-				self.make_stab_cutout(center_x - Decimal('45.3'), center_y, center_x, center_y, angle)
-			elif (unitwidth >= 6.25): 
-				self.make_stab_cutout(center_x + Decimal('41.86'), center_y, center_x, center_y, angle)
-				self.make_stab_cutout(center_x - Decimal('41.86'), center_y, center_x, center_y, angle)
-			elif (unitwidth >= 2.75): 
-				self.make_stab_cutout(center_x + Decimal('20.5'), center_y, center_x, center_y, angle)
-				self.make_stab_cutout(center_x - Decimal('20.5'), center_y, center_x, center_y, angle)
-			elif (unitwidth >= 2): 
-				self.make_stab_cutout(center_x + Decimal('14'), center_y, center_x, center_y, angle)
-				self.make_stab_cutout(center_x - Decimal('14'), center_y, center_x, center_y, angle)
-			elif (unitwidth >= 1.75): 
-				self.make_stab_cutout(center_x + Decimal('12'), center_y, center_x, center_y, angle)
-				self.make_stab_cutout(center_x - Decimal('12'), center_y, center_x, center_y, angle)
+		if (self.debug_log):
+			print("Filtered input data:")
+			print(input_data)
+			print("")
 		
-
-	# Draw switch cutout
-	def draw_switch_cutout(self, x, y, angle):
-	
-		line_segments = []
-		corners = []
+		all_keys = []
+		rotation_zone = False
 		
-		anchor_x = x;
-		anchor_y = y;
+		json_data = kleparse.loads(input_data)
 
-		standard_cutout_types = ["mx", "mx-slightly-wider", "alps", "alps-skcp", "omron", "kailh-choc-CPG1350", "kailh-choc-mini-CPG1232"]			
-
-		if (self.cutout_type in standard_cutout_types):
-			line_segments.append(((self.cutout_width / -Decimal('2')) + self.cutout_radius, (self.cutout_height / Decimal('2')), (self.cutout_width / Decimal('2')) - self.cutout_radius, (self.cutout_height / Decimal('2'))))
-			line_segments.append(((self.cutout_width / -Decimal('2')) + self.cutout_radius, (self.cutout_height / -Decimal('2')), (self.cutout_width / Decimal('2')) - self.cutout_radius, (self.cutout_height / -Decimal('2'))))
-			line_segments.append(((self.cutout_width / -Decimal('2')), (self.cutout_height / Decimal('2')) - self.cutout_radius, (self.cutout_width / -Decimal('2')), (self.cutout_height / -Decimal('2')) + self.cutout_radius))
-			line_segments.append(((self.cutout_width / Decimal('2')), (self.cutout_height / Decimal('2')) - self.cutout_radius, (self.cutout_width / Decimal('2')), (self.cutout_height / -Decimal('2')) + self.cutout_radius))
-			
-			corners.append(((self.cutout_width / -Decimal('2')) + self.cutout_radius, (self.cutout_height / Decimal('2')) - self.cutout_radius, 90, 180))
-			corners.append(((self.cutout_width / Decimal('2')) - self.cutout_radius, (self.cutout_height / Decimal('2')) - self.cutout_radius, 0, 90))
-			corners.append(((self.cutout_width / -Decimal('2')) + self.cutout_radius, (self.cutout_height / -Decimal('2')) + self.cutout_radius, 180, 270))
-			corners.append(((self.cutout_width / Decimal('2')) - self.cutout_radius, (self.cutout_height / -Decimal('2')) + self.cutout_radius, 270, 360))
+		for row in json_data:
+			if (self.debug_log):
+				print (">>> ROW BEGIN")
+				print (str(row))
 			
-			for line in line_segments:
-				self.draw_rotated_line(x + Decimal(str(line[0])), y + Decimal(str(line[1])), x + Decimal(str(line[2])), y + Decimal(str(line[3])), anchor_x, anchor_y, angle)
-				
-			for arc in corners:
-				self.draw_rotated_arc(x + Decimal(str(arc[0])), y + Decimal(str(arc[1])), anchor_x, anchor_y, self.cutout_radius, arc[2], arc[3], angle)
-		
-		# TODO: Add switchtop removal cutouts, hardcoded radius to 0.5
-		#elif (self.cutout_type == "mx-topremoval-simple"):
-		#	line_segments.append((-Decimal('7.80') + self.cutout_radius, -Decimal('7')), (Decimal('7.80') - self.cutout_radius, -Decimal('7')))
-		
-	# Use the functions above to render an entire switch - Cutout, stabs, and all
-	def render_switch(self, switch):
-	
-		mm_x = Decimal('0')
-		mm_y = Decimal('0')
-		
-		if(self.debug_log):
-			print("RX: " + str(switch.rotx))
-			print("RY: " + str(switch.roty))
-			print("Angle: " + str(switch.angle))
-			print("Offset X: " + str(switch.offset_x))
-			print("Offset Y: " + str(switch.offset_y))
-			print("===")
-			
-		# Coord differs for regular vs rotated
-		if ((switch.rotx != "NONE") and (switch.roty != "NONE") or switch.angle != "NONE"):
-			# rotx and roty are the raw base coords for anchor
-			# Then, upper left is offset from there
-			mm_x = (switch.rotx + switch.offset_x) * self.unit_width
-			mm_y = (-switch.roty - switch.offset_y) * self.unit_height
-			
-			# Confirmed coords are correct at this point
-			# Something going haywire after this
-			
-		else:
-			# Otherwise, derive mm based on x and y in units
-			mm_x = switch.x * self.unit_width
-			mm_y = switch.y * self.unit_height
-			switch.angle = Decimal("0")
-			
-		# Then, derive the center of the switch based on width and height
-		mm_center_x = mm_x + ((switch.width / Decimal('2')) * self.unit_width)
-		mm_center_y = mm_y - ((switch.height / Decimal('2')) * self.unit_height)
-		
-		# Then, rotate the points if angle != 0
-		if (switch.angle != Decimal('0')):
-		
-			# This part is the issue
-		
-			rotated_upper_left_coords = self.rotate_point_around_anchor(mm_x, mm_y, (switch.rotx * self.unit_width), -(switch.roty * self.unit_height), switch.angle)
-			rotated_central_coords = self.rotate_point_around_anchor(mm_center_x, mm_center_y, (switch.rotx * self.unit_width), -(switch.roty * self.unit_height), switch.angle)
-			
-			mm_x = rotated_upper_left_coords[0]
-			mm_y = rotated_upper_left_coords[1]
-			
-			mm_center_x = rotated_central_coords[0]
-			mm_center_y = rotated_central_coords[1]
-			
-			# Do some calculations to see if a rotated switch exceeds current max boundaries
-			
-			unrotated_x = (switch.rotx + switch.offset_x) * self.unit_width
-			unrotated_y = (-switch.roty - switch.offset_y) * self.unit_height
-			
-			corners = []
-			corners.append((unrotated_x, unrotated_y))
-			corners.append((unrotated_x + (switch.width * self.unit_width), unrotated_y))
-			corners.append((unrotated_x, unrotated_y - (switch.height * self.unit_height)))
-			corners.append((unrotated_x + (switch.width * self.unit_width), unrotated_y - (switch.height * self.unit_height)))
-			
-			for corner in corners:
-				rotated_corner = self.rotate_point_around_anchor(corner[0], corner[1], mm_center_x, mm_center_y, switch.angle)
-				
-				if (rotated_corner[0] > self.max_width):
-					self.max_width = rotated_corner[0];
-				if (rotated_corner[1] < self.max_height):
-					self.max_height = rotated_corner[1];
-				
-		# Draw main switch cutout
-		self.draw_switch_cutout(mm_center_x, mm_center_y, switch.angle + switch.cutout_angle)
-		
-		# Adjust width for vertically tall keys, and generate stabs
-		apparent_width = switch.width;
-		if (switch.width < switch.height):
-			apparent_width = switch.height;
-		
-		self.generate_stabs(mm_center_x, mm_center_y, switch.angle + switch.stab_angle, apparent_width)
-		
-
-	# Generate switch cutout sizes
-	def initialize_variables(self):
-		if (self.cutout_type == "mx"):
-			self.cutout_width = Decimal('14');
-			self.cutout_height = Decimal('14');
-		elif (self.cutout_type == "mx-slightly-wider"):
-			self.cutout_width = Decimal('15');
-			self.cutout_height = Decimal('14');
-		elif (self.cutout_type == "alps"):
-			self.cutout_width = Decimal('15.50');
-			self.cutout_height = Decimal('12.80');
-		elif (self.cutout_type == "alps-skcp"):
-			self.cutout_width = Decimal('16');
-			self.cutout_height = Decimal('16');
-		elif (self.cutout_type == "omron"):
-			self.cutout_width = Decimal('13.50');
-			self.cutout_height = Decimal('13.50');
-		elif (self.cutout_type == "kailh-choc-CPG1350"):
-                        # Datasheet lists 13.8x13.8 with no tolerances, so
-                        # using tolerances off choc-mini datasheet
-			self.cutout_width = Decimal('13.82');
-			self.cutout_height = Decimal('13.82');
-		elif (self.cutout_type == "kailh-choc-mini-CPG1232"):
-			self.cutout_width = Decimal('13.52');
-			self.cutout_height = Decimal('12.52');
-		else:
-			print("Unsupported cutout type.", file=sys.stderr)
-			print("Supported: mx, alps, omron", file=sys.stderr)
-			#exit(1)
-			return 3
-		
-		# Check if values legal
-
-		# Cutout radius: The fillet radius ( 0 <= x <= 1/2 width or height)
-		if ((self.cutout_radius < 0) or (self.cutout_radius > (self.cutout_width/2)) or (self.cutout_radius > (self.cutout_height/2))) :
-			print("Radius must be between 0 and half the cutout width/height.", file=sys.stderr)
-			#exit(1)
-			return 4
-
-		# Unit size ( 0 <= x <= inf, cap at 1000 for now )
-		if (self.unit_width < 0 or self.unit_width > 1000):
-			print("Unit size must be between 0 and 1000", file=sys.stderr)
-			#exit(1)
-			return 5
-			
-		if (self.unit_height < 0 or self.unit_height > 1000):
-			print("Unit size must be between 0 and 1000", file=sys.stderr)
-			#exit(1)
-			return 5
-			
-		if (self.stab_radius < 0 or self.stab_radius > 5):
-			return 6
-		if (self.acoustics_radius < 0 or self.acoustics_radius > 5):
-			return 7
-		
-			
-		return 0
-			
-	def generate_plate(self, file, input_data=None):
-
-		# Init vars
-		init_code = self.initialize_variables()
-		if (init_code != 0):
-			return init_code
-		
-		# If debug matrix is on, make sth generic
-		if not input_data:
-			input_data = self.debug_matrix_data
-			
-		# Sanitize by removing \" (KLE's literal " for a label)
-		#input_data = input_data.replace('\n', '')
-		#input_data = input_data.replace(r'\"', '')
-
-		# TODO: Filter out improper quotes from " being in a label!
-
-		if (self.debug_log):
-			print("Filtered input data:")
-			print(input_data)
-			print("")
-
-		# Parse KLE data
-		all_switches = []
-		rotation_zone = False
-		
-		try:
-			json_data = json5.loads('[' + input_data + ']')
-		except(ValueError):
-			#print("Invalid KLE data", file=sys.stderr)
-			return(1)
-
-		for row in json_data:
-			if (self.debug_log):
-				print (">>> ROW BEGIN")
-				print (str(row))
-			
-			# KLE standard supports first row being metadata.
-			# If it is, ignore.
-			if isinstance(row, dict):
-				if (self.debug_log):
-					print ("!!! Row is metadata. Skip.")
-				continue
-			for key in row:
-				# The "key" can either be a legend (actual key) or dictionary of data (for succeeding key).
+			# KLE standard supports first row being metadata.
+			# If it is, ignore.
+			if isinstance(row, dict):
+				if (self.debug_log):
+					print ("!!! Row is metadata. Skip.")
+				continue
+			for key in row:
+				# The "key" can either be a legend (actual key) or dictionary of data (for succeeding key).
 				
 				# If it's just a string, it's just a key. Create one and add to list
 				if isinstance(key, str):
@@ -589,7 +252,10 @@ class PlateGenerator(object):
 						continue
 				
 					# First, we simply make the switch
-					current_switch = self.Switch(self.current_x, self.current_y)
+					key_x = self.current_x
+					key_y = self.current_y
+					key_offset_x = Decimal('0')
+					key_offset_y = Decimal('0')
 					
 					# For x and y offset, check if any rotation spec is set.
 					if (rotation_zone or self.current_rotx != "NONE" or self.current_roty != "NONE" or self.current_angle != "NONE"):
@@ -633,7 +299,7 @@ class PlateGenerator(object):
 							if (self.current_roty == "UNCHANGED"):
 								self.current_roty = Decimal("0")
 						else:
-							self.current_rotx = all_switches[-1].rotx
+							self.current_rotx = self.previous_rotx
 								
 						if (self.current_roty != "UNCHANGED"):
 							self.current_x = Decimal("0")
@@ -642,27 +308,27 @@ class PlateGenerator(object):
 							if (self.current_rotx == "UNCHANGED"):
 								self.current_rotx = Decimal("0")
 						else:
-							self.current_roty = all_switches[-1].roty
+							self.current_roty = self.previous_roty
 								
 						# Check for r changes
 						if (self.current_angle != "UNCHANGED"):
 							self.current_offset_y -= Decimal("1")
 							self.current_offset_x = Decimal("0")		
 						else:
-							self.current_angle = all_switches[-1].angle
+							self.current_angle = self.previous_angle
 					
 						# - If a y: is present, reset x offset
 						if (self.current_offset_y != 0):
 							self.current_offset_x = Decimal("0")
 							self.current_offset_y -= self.current_offset_y
-							current_switch.offset_y -= self.current_offset_y
+							key_offset_y -= self.current_offset_y
 						# Otherwise, obtain existing offset from previous switch
 						else:
-							current_switch.offset_x = all_switches[-1].offset_x + Decimal("1")
+							key_offset_x = self.previous_offset_x + Decimal("1")
 							
 						# Append data for x offset for current switch
 						# self.current_offset_x += self.current_offset_x
-						current_switch.offset_x += self.current_offset_x
+						key_offset_x += self.current_offset_x
 						
 						# Check and see if it's a y record
 						if (self.max_height > -self.current_roty - self.current_offset_y):
@@ -675,8 +341,8 @@ class PlateGenerator(object):
 						# Otherwise, append
 						self.current_x += self.current_offset_x
 						self.current_y -= self.current_offset_y
-						current_switch.x += self.current_offset_x
-						current_switch.y -= self.current_offset_y
+						key_x += self.current_offset_x
+						key_y -= self.current_offset_y
 						self.current_offset_x = Decimal('0')
 						self.current_offset_y = Decimal('0')
 						
@@ -694,16 +360,8 @@ class PlateGenerator(object):
 					
 					# And we adjust the fields as necessary.
 					# These default to 1, 0, etc unless edited by a data field preceding
-					current_switch.width = self.current_width
-					current_switch.height = self.current_height
-					current_switch.width_secondary = self.current_width_secondary
-					current_switch.height_secondary = self.current_height_secondary
-					current_switch.stab_angle = self.current_stab_angle
-					current_switch.cutout_angle = self.current_cutout_angle
-					current_switch.rotx = self.current_rotx
-					current_switch.roty = self.current_roty
-					current_switch.angle = self.current_angle
-					
+					cutout_angle = self.current_cutout_angle
+					stab_angle = self.current_stab_angle
 					
 					# Deal with some certain cases
 					
@@ -712,10 +370,23 @@ class PlateGenerator(object):
 					# This effectively transforms the key to a vertical
 					# This also handles ISO
 					if (self.current_width < self.current_height and self.current_height >= 1.75):
-						current_switch.cutout_angle -= Decimal('90')
-						current_switch.stab_angle -= Decimal('90')
+						cutout_angle -= Decimal('90')
+						stab_angle -= Decimal('90')
+					
+					# Rotated keys are placed relative to their rotation anchor; the rest sit on the plain x/y grid
+					if (rotation_zone):
+						record = KeyRecord(self.current_rotx + key_offset_x, -self.current_roty - key_offset_y, self.current_width, self.current_height, 
+						self.current_width_secondary, self.current_height_secondary, self.current_rotx, self.current_roty, self.current_angle, cutout_angle, stab_angle)
+						
+						self.previous_rotx = self.current_rotx
+						self.previous_roty = self.current_roty
+						self.previous_angle = self.current_angle
+					else:
+						record = KeyRecord(key_x, key_y, self.current_width, self.current_height, 
+						self.current_width_secondary, self.current_height_secondary, Decimal('0'), Decimal('0'), Decimal('0'), cutout_angle, stab_angle)
 					
-					all_switches.append(current_switch)
+					self.previous_offset_x = key_offset_x
+					all_keys.append(record)
 					
 					# Reset the fields to their defaults
 					if (rotation_zone):
@@ -787,59 +458,1767 @@ class PlateGenerator(object):
 				self.current_y -= Decimal('1')
 				self.current_x = Decimal('0')
 			
+		return Layout(all_keys, self.max_width, self.max_height)
+
+# Parse KLE raw data into a Layout, ready to be rendered by any PlateGenerator
+# Raises ValueError on invalid KLE data.
+def parse_layout(input_data, debug_log=False):
+	with localcontext(Context(prec=DECIMAL_PRECISION)):
+		return LayoutParser(debug_log).parse(input_data)
+
+class PlateGenerator(object):
 
-		# At this point, the keys are built.
+	#init
+	def __init__(self, arg_ct, arg_cr, arg_st, arg_sr, arg_at, arg_ar, arg_uw, arg_uh, arg_db, arg_os='entities', arg_en='decimal', arg_tp=None, arg_wr='ezdxf', arg_op=DEFAULT_OUTPUT_PRECISION):
+
+		# Set up decimal and mpmath contexts private to this generator
+		self.decimal_context = Context(prec=DECIMAL_PRECISION)
+		self.mp = MPContext()
+		self.mp.dps = DECIMAL_PRECISION
+		self.mp.pretty = True
+
+		# The dxf workspace is only made on the first DXF render (see start_document)
+		self.plate = None
+		self.modelspace = None
+
+		# Cutout type: mx, mx-slightly-wider, alps
+		self.cutout_type = arg_ct
+
+		# Cutout radius: The fillet radius ( 0 <= x <= 1/2 cutout width or height )
+		try:
+			self.cutout_radius = Decimal(arg_cr)
+		except:
+			raise ValueError
+
+		# Stab type: mx-simple, large-cuts, alps-aek, alps-at101
+		self.stab_type = arg_st
+
+		# Stab radius: The fillet radius for stab cutouts ( 0 <= x <= 1 )
+		try:
+			self.stab_radius = Decimal(arg_sr)
+		except:
+			raise ValueError
+
+		# Acoustic cuts: The cutouts typically found on high end plates beside the switches.
+		# This script only handles the thin short cuts vertically beside each switch cut, not the large ones, i.e. between fn row and alphas.
+		# none = disabled, typical = 1.5-1.75U only, extreme = On 1.5-2.75U
+		self.acoustics_type = arg_at
+
+		# Acoustic radius: Fillet radius for cuts mentioned above.
+		try:
+			self.acoustics_radius = Decimal(arg_ar)
+		except:
+			raise ValueError
+
+		# Unit size (i.e. 1U = 19.05mm). ( 0 <= x <= inf, cap at 1000 for now )
+		try:
+			self.unit_width = Decimal(arg_uw)
+		except:
+			raise ValueError
+		try:
+			self.unit_height = Decimal(arg_uh)
+		except:
+			raise ValueError
 		
-		# Adjust max width/height from units to mm
+
+		#== Debug parameters ==#
+
+		# Tell user everything about what's going on and spam the console?
+		self.debug_log = arg_db
 		
-		self.max_width = self.max_width * self.unit_width
-		self.max_height = self.max_height * self.unit_height
+		#== Output parameters ==#
 		
-		# Render each one by one. 
-		for switch in all_switches:
-			self.render_switch(switch)
+		# Output style: entities = every line and arc written out per cutout,
+		# polylines = each cutout written as one closed LWPOLYLINE, with bulges for the fillets,
+		# blocks = each cutout shape defined once and stamped with one INSERT per cutout,
+		# blocks-exploded = stamped as blocks, then exploded back into flat lines and arcs
+		self.output_style = arg_os
+		
+		# Render engine: decimal = exact Decimal maths for every point (default, production output),
+		# numpy = float64 maths batched over the whole plate, snapped to a fine grid at the end
+		self.engine = arg_en
+		
+		# Toolpath ordering: None = cutouts drawn in KLE order,
+		# otherwise "x,y" in mm, where the laser head starts; cutouts are then ordered to cut down on travel from there
+		if (arg_tp is None):
+			self.toolpath_origin = None
+		else:
+			try:
+				self.toolpath_origin = tuple(float(value) for value in str(arg_tp).split(','))
+			except:
+				raise ValueError
+			if (len(self.toolpath_origin) != 2):
+				raise ValueError
+		
+		# DXF writer: ezdxf = a full AC1024 document built with ezdxf (default),
+		# native = plain primitives streamed straight out as an R12 DXF (see dxfwriter.py), for entities and polylines
+		self.dxf_writer = arg_wr
+		
+		# Output precision in mm, a power of ten such as 1e-6: every number in the DXF is rounded to it once, on the way out,
+		# and written without trailing zeros. 0 writes numbers at full float precision.
+		try:
+			output_precision = Decimal(arg_op)
+		except:
+			raise ValueError
+		if (output_precision == 0):
+			self.output_decimals = None
+		else:
+			output_precision = output_precision.normalize()
+			if (output_precision < 0 or output_precision > 1 or output_precision.as_tuple().digits != (1,)):
+				raise ValueError
+			self.output_decimals = -output_precision.as_tuple().exponent
+		
+		# Runtime vars that are often systematically changed or reset
+		self.reset_plate()
 
-		# Draw outer bounds - top, bottom, left, right
-		self.modelspace.add_line((0, 0), (self.max_width, 0))
-		self.modelspace.add_line((0, self.max_height), (self.max_width, self.max_height))
-		self.modelspace.add_line((0, 0), (0, self.max_height))
-		self.modelspace.add_line((self.max_width, 0), (self.max_width, self.max_height))
-			
-		if (self.debug_log):
-			print("Complete!")
-			return 0
-			
+		# Cutout sizes
+		self.cutout_width = Decimal('0')
+		self.cutout_height = Decimal('0')
+		
+		# Result of initialize_variables, worked out once per generator since the options never change
+		self.init_code = None
+		
+		# Cutout profiles, built once initialize_variables has validated the options
+		self.switch_profile = None
+		self.stab_profile = None
+		self.acoustic_profile = None
+		
+		# Closed polyline outlines of the profiles above, by cutout block name, for the polylines output style
+		self.cutout_outlines = {}
+		
+		# While rendering an SVG preview, cutouts are only recorded, never drawn
+		self.preview_only = False
 
-		if (file == "stdout"):
-			self.plate.write(sys.stdout)
-		else:
-			self.plate.write(file)
-		return 0
-			
+		# Rotation engine: (cos, sin) for each distinct angle seen during the plate run
+		self.trig_table = {}
+		self.quarter_turn_factors = (
+			(Decimal('1'), Decimal('0')),
+			(Decimal('0'), Decimal('1')),
+			(Decimal('-1'), Decimal('0')),
+			(Decimal('0'), Decimal('-1')),
+		)
 		
-			
-if __name__ == "__main__":
+		# Affine transforms of rotated zones, by (rx, ry, angle) in KLE units, from unrotated mm to plate mm
+		self.cluster_transforms = {}
 
-	parser = argparse.ArgumentParser(description='Create a plate DXF based on KLE raw data.')
-	
-	# Note: The args will be fed into Decimal(), which takes strings
-	
-	parser.add_argument("-ct", "--cutout-type", help="Switch cutout type. Supported: mx, mx-slightly-wider, alps, alps-skcp, omron; Default: mx", type=str, default='mx')
-	parser.add_argument("-cr", "--cutout-radius", help="Switch cutout fillet radius. Default: 0.5", type=str, default='0.5')
-	parser.add_argument("-st", "--stab-type", help="Stabilizer type. Supported: mx-simple, large-cuts, alps-aek, alps-at101; Default: mx-simple", type=str, default='mx-simple')
-	parser.add_argument("-sr", "--stab-radius", help="Stabilizer cutout fillet radius. Default: 0.5", type=str, default='0.5')
-	parser.add_argument("-at", "--acoustics-type", help="Acoustic cutouts type. Supported: none, typical, extreme; Default: none", type=str, default='none')
-	parser.add_argument("-ar", "--acoustics-radius", help="Acoustic cutouts fillet radius. Default: 0.5", type=str, default='0.5')
-	parser.add_argument("-uw", "--unit-width", help="Key unit width. Default: 19.05", type=str, default='19.05')
-	parser.add_argument("-uh", "--unit-height", help="Key unit height. Default: 19.05", type=str, default='19.05')
-	#parser.add_argument("-om", "--output-method", help="The save method for data. Supported: stdout, file; Default: stdout", type=str, default='stdout')
-	#parser.add_argument("-of", "--output-file", help="Output file name if using file output-method. Default: plate.dxf", type=str, default='plate.dxf')	
-	parser.add_argument("--debug-log", help="Spam output with useless info.", action="store_true", default = False)
+	#=================================#
+	#           Functions             #
+	#=================================#
+		
+	# Check if string is valid number
+	# Credits to https://stackoverflow.com/questions/4138202/using-isdigit-for-floats
+	def is_a_number(self, s):
+		return_value = True
+		try:
+			test_float = float(s)
+		except ValueError:
+			return_value = False
+		return return_value
+				
+	# Make the blank dxf workspace, unless there is one already
+	# Left until something is drawn into it, so a generator that only makes previews never builds a document.
+	def start_document(self):
+		if (self.modelspace is not None):
+			return
+		
+		if (self.dxf_writer == "native"):
+			self.modelspace = dxfwriter.PrimitiveSpace()
+		else:
+			self.plate = ezdxf.new(dxfversion='AC1024')
+			self.modelspace = self.plate.modelspace()
+			if (self.output_decimals is not None):
+				self.modelspace = dxfwriter.RoundedLayout(self.modelspace, self.output_decimals)
 	
-	args = parser.parse_args()
+	# Reset the render state so the generator can start on a fresh plate
+	# The dxf document itself is kept as a template; only the modelspace contents are dropped.
+	def reset_plate(self):
+		
+		if (self.modelspace is not None):
+			self.modelspace.delete_all_entities()
+		
+		# Blocks stamped so far, kept for the explode pass
+		self.stamped_blocks = []
+		
+		# Cutouts waiting to be drawn in one go, by the numpy engine or after toolpath ordering
+		# Each is (switch index, block name, profile, x, y, anchor x, anchor y, angle)
+		self.pending_cutouts = []
+		
+		# Index of the switch being rendered, so its cutouts can be kept together
+		self.current_group = 0
+		
+		# Every cutout placed on the plate, for validate_cutouts
+		# Same layout as the pending cutouts.
+		self.placed_cutouts = []
+		
+		# Head travel in mm between cutouts (before, after) toolpath ordering, when it's on
+		self.toolpath_travel = None
+		
+		# Where generate_panel put each plate on the sheet: (x, y, rotated)
+		self.panel_placements = None
+		
+		# Plate bounds in mm
+		self.max_width = Decimal('0')
+		self.max_height = Decimal('0')
+		
+		# Seconds spent in each stage of the last generate_plate: parse, render, serialise
+		self.stage_times = {}
+		
+		# Keys on the last rendered plate
+		self.key_count = 0
+		
+		# Why the last KLE data was rejected (a KLEParseError), when generate_plate returned 1
+		self.parse_error = None
 	
-	gen = PlateGenerator(args.cutout_type, args.cutout_radius, args.stab_type, args.stab_radius, args.acoustics_type, args.acoustics_radius, 
-	args.unit_width, args.unit_height, args.debug_log)
+	# Look up (cos, sin) for an angle in degrees
+	# Multiples of 90 degrees are exact and never go near a transcendental function.
+	# Anything else is evaluated once at 50 digits and cached for the rest of the plate run.
+	def get_rotation_factors(self, angle):
+		
+		factors = self.trig_table.get(angle)
+		if (factors is not None):
+			return factors
+		
+		quarter_turns, remainder = divmod(angle, Decimal('90'))
+		if (remainder == 0):
+			factors = self.quarter_turn_factors[int(quarter_turns) % 4]
+		else:
+			radian_qty = self.mp.radians(self.mp.mpf(str(angle)))
+			factors = (Decimal(str(self.mp.cos(radian_qty))), Decimal(str(self.mp.sin(radian_qty))))
+		
+		self.trig_table[angle] = factors
+		return factors
+	
+	# Modifies a point with rotation
+	def rotate_point_around_anchor(self, x, y, anchor_x, anchor_y, angle):
+		cos_result, sin_result = self.get_rotation_factors(angle)
+		
+		# Unrotated points come back untouched, so they stay exact
+		if (sin_result == 0 and cos_result == 1):
+			return (x, y)
+		
+		old_x = x - anchor_x
+		old_y = y - anchor_y
+		
+		new_x = anchor_x + (old_x * cos_result) - (old_y * sin_result)
+		new_y = anchor_y + (old_x * sin_result) + (old_y * cos_result)
+		
+		return (new_x, new_y)
+		
+	# Affine transform for points relative to (x, y), rotated with respect to an anchor, as (cos, sin, offset x, offset y)
+	# Worked out once per cutout or rotated zone, then applied to every point with apply_transform,
+	# which gives the same point as rotate_point_around_anchor(x + point_x, y + point_y, anchor_x, anchor_y, angle).
+	def affine_transform(self, x, y, anchor_x, anchor_y, angle):
+		cos_result, sin_result = self.get_rotation_factors(angle)
+		
+		if (sin_result == 0 and cos_result == 1):
+			return (cos_result, sin_result, x, y)
+		
+		old_x = x - anchor_x
+		old_y = y - anchor_y
+		
+		return (cos_result, sin_result, anchor_x + (old_x * cos_result) - (old_y * sin_result), anchor_y + (old_x * sin_result) + (old_y * cos_result))
+	
+	# Apply an affine transform to a point
+	def apply_transform(self, transform, x, y):
+		cos_result, sin_result, offset_x, offset_y = transform
+		
+		# Unrotated points are only moved, so they stay exact
+		if (sin_result == 0 and cos_result == 1):
+			return (offset_x + x, offset_y + y)
+		
+		return (offset_x + (x * cos_result) - (y * sin_result), offset_y + (x * sin_result) + (y * cos_result))
+	
+	# Transform of a KLE rotated zone: unrotated mm around the rx/ry anchor to plate mm
+	# Every key of the zone shares it, so it's worked out once per zone for the generator's lifetime.
+	def cluster_transform(self, rx, ry, angle):
+		cluster = (rx, ry, angle)
+		transform = self.cluster_transforms.get(cluster)
+		if (transform is None):
+			transform = self.affine_transform(Decimal('0'), Decimal('0'), rx * self.unit_width, -(ry * self.unit_height), angle)
+			self.cluster_transforms[cluster] = transform
+		return transform
+		
+	# Rounded rectangle cutout profile: 4 straight edges and 4 filleted corners, relative to the cutout center
+	# Lines are (x1, y1, x2, y2); corners are (center x, center y, radius, start angle, end angle).
+	# Built once per generator as immutable tuples, then only ever translated and rotated.
+	def rounded_rectangle_profile(self, left, right, top, bottom, radius):
+		
+		line_segments = (
+			(left + radius, top, right - radius, top),
+			(left + radius, bottom, right - radius, bottom),
+			(left, top - radius, left, bottom + radius),
+			(right, top - radius, right, bottom + radius),
+		)
+		
+		corners = (
+			(left + radius, top - radius, radius, Decimal('90'), Decimal('180')),
+			(right - radius, top - radius, radius, Decimal('0'), Decimal('90')),
+			(left + radius, bottom + radius, radius, Decimal('180'), Decimal('270')),
+			(right - radius, bottom + radius, radius, Decimal('270'), Decimal('360')),
+		)
+		
+		return (line_segments, corners)
+		
+	# Draw a cutout profile as flat lines and arcs, rotated with respect to an anchor
+	# The profile is precomputed, so all that's left here is one transform for the cutout, applied to each of its points.
+	def draw_profile(self, profile, x, y, anchor_x, anchor_y, angle):
+		line_segments, corners = profile
+		transform = self.affine_transform(x, y, anchor_x, anchor_y, angle)
+		
+		for x1, y1, x2, y2 in line_segments:
+			self.modelspace.add_line(self.apply_transform(transform, x1, y1), self.apply_transform(transform, x2, y2))
+			
+		for center_x, center_y, radius, angle_start, angle_end in corners:
+			self.modelspace.add_arc(self.apply_transform(transform, center_x, center_y), radius, float(angle_start + angle), float(angle_end + angle))
+	
+	# Closed outline of a rounded rectangle profile, as (x, y, bulge) vertices running counter-clockwise
+	# Each bulge applies to the segment from its vertex to the next: 0 along the straight edges,
+	# tan(sweep / 4) around the fillets, i.e. tan(22.5 degrees) for the 90 degree corners.
+	# Zero-length segments, left by unfilleted corners or fillets meeting in the middle, are dropped.
+	def profile_outline(self, profile):
+		line_segments, corners = profile
+		if (not corners):
+			return ()
+		top_left, top_right, bottom_left, bottom_right = corners
+		
+		vertices = []
+		for center_x, center_y, radius, angle_start, angle_end in (bottom_left, bottom_right, top_right, top_left):
+			cos_start, sin_start = self.get_rotation_factors(angle_start)
+			cos_end, sin_end = self.get_rotation_factors(angle_end)
+			bulge = math.tan(math.radians(angle_end - angle_start) / 4)
+			vertices.append((center_x + radius * cos_start, center_y + radius * sin_start, bulge))
+			vertices.append((center_x + radius * cos_end, center_y + radius * sin_end, 0.0))
+		
+		outline = []
+		for i, vertex in enumerate(vertices):
+			next_vertex = vertices[(i + 1) % len(vertices)]
+			if (vertex[0] != next_vertex[0] or vertex[1] != next_vertex[1]):
+				outline.append(vertex)
+		
+		return tuple(outline)
+	
+	# Look up the outline for a cutout block, working it out the first time it's needed
+	def cutout_outline(self, block_name, profile):
+		outline = self.cutout_outlines.get(block_name)
+		if (outline is None):
+			outline = self.profile_outline(profile)
+			self.cutout_outlines[block_name] = outline
+		return outline
+	
+	# Draw a cutout outline as one closed polyline, rotated with respect to an anchor
+	# A rotation doesn't change how far an arc sweeps, so the bulges carry over as they are.
+	def draw_outline(self, outline, x, y, anchor_x, anchor_y, angle):
+		transform = self.affine_transform(x, y, anchor_x, anchor_y, angle)
+		points = []
+		for vertex_x, vertex_y, bulge in outline:
+			coords = self.apply_transform(transform, vertex_x, vertex_y)
+			points.append((coords[0], coords[1], 0, 0, bulge))
+		self.modelspace.add_lwpolyline(points, dxfattribs={'closed': True})
+	
+	# Define a cutout profile once as a block, centered on the block origin
+	def define_cutout_block(self, block_name, profile):
+		line_segments, corners = profile
+		block = self.plate.blocks.new(name=block_name)
+		if (self.output_decimals is not None):
+			block = dxfwriter.RoundedLayout(block, self.output_decimals)
+		
+		for x1, y1, x2, y2 in line_segments:
+			block.add_line((x1, y1), (x2, y2))
+			
+		for center_x, center_y, radius, angle_start, angle_end in corners:
+			block.add_arc((center_x, center_y), radius, angle_start, angle_end)
+	
+	# Stamp a cutout block with a single INSERT, rotated with respect to an anchor
+	# Only the insertion point goes through the rotation maths; the block carries the rest.
+	def insert_cutout_block(self, block_name, profile, x, y, anchor_x, anchor_y, angle):
+		if (block_name not in self.plate.blocks):
+			self.define_cutout_block(block_name, profile)
+		
+		coords = self.rotate_point_around_anchor(x, y, anchor_x, anchor_y, angle)
+		blockref = self.modelspace.add_blockref(block_name, (coords[0], coords[1]), dxfattribs={
+			'rotation': float(angle)
+		})
+		self.stamped_blocks.append((blockref, block_name, profile, x, y, anchor_x, anchor_y, angle))
+	
+	# Place one cutout, or hold on to it if cutouts are drawn in one go at the end
+	def place_cutout(self, block_name, profile, x, y, anchor_x, anchor_y, angle):
+		line_segments, corners = profile
+		if (not line_segments and not corners):
+			return
+		
+		self.placed_cutouts.append((self.current_group, block_name, profile, x, y, anchor_x, anchor_y, angle))
+		if (self.preview_only):
+			return
+		
+		if (self.toolpath_origin is not None or (self.engine == "numpy" and not self.output_style.startswith("blocks"))):
+			self.pending_cutouts.append((self.current_group, block_name, profile, x, y, anchor_x, anchor_y, angle))
+		else:
+			self.draw_cutout(block_name, profile, x, y, anchor_x, anchor_y, angle)
+	
+	# Draw one cutout: entity by entity, as one polyline, or stamped as a block
+	def draw_cutout(self, block_name, profile, x, y, anchor_x, anchor_y, angle):
+		if (self.output_style == "blocks" or self.output_style == "blocks-exploded"):
+			self.insert_cutout_block(block_name, profile, x, y, anchor_x, anchor_y, angle)
+		elif (self.output_style == "polylines"):
+			self.draw_outline(self.cutout_outline(block_name, profile), x, y, anchor_x, anchor_y, angle)
+		else:
+			self.draw_profile(profile, x, y, anchor_x, anchor_y, angle)
+	
+	# Draw every held back cutout, in toolpath order if that's on
+	def draw_pending_cutouts(self):
+		
+		if (self.toolpath_origin is not None):
+			self.order_pending_cutouts()
+		
+		if (self.engine == "numpy" and not self.output_style.startswith("blocks")):
+			self.draw_pending_cutouts_numpy()
+		else:
+			for switch_index, block_name, profile, x, y, anchor_x, anchor_y, angle in self.pending_cutouts:
+				self.draw_cutout(block_name, profile, x, y, anchor_x, anchor_y, angle)
+		
+		self.pending_cutouts = []
+	
+	# Reorder the held back cutouts to cut down on laser head travel between them
+	# Each switch's cutouts stay together; see toolpath.py for how the order is picked.
+	def order_pending_cutouts(self):
+		
+		groups = {}
+		for cutout in self.pending_cutouts:
+			groups.setdefault(cutout[0], []).append(cutout)
+		group_keys = list(groups)
+		
+		# Where the head goes to cut each cutout: its center, once rotated into place
+		group_points = []
+		for group_key in group_keys:
+			points = []
+			for switch_index, block_name, profile, x, y, anchor_x, anchor_y, angle in groups[group_key]:
+				coords = self.rotate_point_around_anchor(x, y, anchor_x, anchor_y, angle)
+				points.append((float(coords[0]), float(coords[1])))
+			group_points.append(points)
+		
+		ordered_cutouts = []
+		ordered_points = []
+		for group_index, point_order in toolpath.order_groups(group_points, self.toolpath_origin):
+			for i in point_order:
+				ordered_cutouts.append(groups[group_keys[group_index]][i])
+				ordered_points.append(group_points[group_index][i])
+		
+		original_points = [point for points in group_points for point in points]
+		self.toolpath_travel = (toolpath.travel_distance(original_points, self.toolpath_origin), toolpath.travel_distance(ordered_points, self.toolpath_origin))
+		self.pending_cutouts = ordered_cutouts
+	
+	# numpy engine: draw every pending cutout in a few batched array operations
+	# Cutouts sharing a profile are transformed together: each line endpoint and arc center
+	# (or each outline vertex, for polylines) is translated to the cutout position
+	# and rotated about its anchor for all cutouts at once.
+	# Entities still come out in the same order as the decimal engine would draw them.
+	def draw_pending_cutouts_numpy(self):
+		
+		# Group cutouts by profile, remembering where each one landed
+		groups = {}
+		order = []
+		for switch_index, block_name, profile, x, y, anchor_x, anchor_y, angle in self.pending_cutouts:
+			group = groups.setdefault(block_name, (profile, []))
+			order.append((block_name, len(group[1])))
+			group[1].append((float(x), float(y), float(anchor_x), float(anchor_y), float(angle)))
+		
+		results = {}
+		for group_id, (profile, placements) in groups.items():
+			line_segments, corners = profile
+			outline = self.cutout_outline(group_id, profile)
+			
+			placement_array = numpy.array(placements, dtype=numpy.float64)
+			pos_x = placement_array[:, 0:1]
+			pos_y = placement_array[:, 1:2]
+			anchor_x = placement_array[:, 2:3]
+			anchor_y = placement_array[:, 3:4]
+			angles = placement_array[:, 4:5]
+			radians_array = numpy.radians(angles)
+			cos_array = numpy.cos(radians_array)
+			sin_array = numpy.sin(radians_array)
+			
+			# Every profile vertex: both ends of each line, then each arc center; or the outline vertices
+			if (self.output_style == "polylines"):
+				vertices = [(vertex[0], vertex[1]) for vertex in outline]
+			else:
+				vertices = [(x1, y1) for x1, y1, x2, y2 in line_segments] + [(x2, y2) for x1, y1, x2, y2 in line_segments] + [(arc[0], arc[1]) for arc in corners]
+			vertex_array = numpy.array(vertices, dtype=numpy.float64).reshape(-1, 2)
+			
+			# (cutouts, vertices) arrays of offsets from each anchor
+			offset_x = (pos_x + vertex_array[:, 0]) - anchor_x
+			offset_y = (pos_y + vertex_array[:, 1]) - anchor_y
+			
+			new_x = numpy.round(anchor_x + (offset_x * cos_array) - (offset_y * sin_array), NUMPY_SNAP_DECIMALS)
+			new_y = numpy.round(anchor_y + (offset_x * sin_array) + (offset_y * cos_array), NUMPY_SNAP_DECIMALS)
+			
+			results[group_id] = (profile, outline, new_x.tolist(), new_y.tolist(), angles[:, 0].tolist())
+		
+		for group_id, row in order:
+			profile, outline, new_x, new_y, angles = results[group_id]
+			line_segments, corners = profile
+			line_count = len(line_segments)
+			row_x = new_x[row]
+			row_y = new_y[row]
+			rotation = angles[row]
+			
+			if (self.output_style == "polylines"):
+				self.modelspace.add_lwpolyline([(row_x[i], row_y[i], 0, 0, vertex[2]) for i, vertex in enumerate(outline)], dxfattribs={'closed': True})
+				continue
+			
+			for i in range(line_count):
+				self.modelspace.add_line((row_x[i], row_y[i]), (row_x[line_count + i], row_y[line_count + i]))
+				
+			for i, arc in enumerate(corners):
+				self.modelspace.add_arc((row_x[2 * line_count + i], row_y[2 * line_count + i]), float(arc[2]), float(arc[3]) + rotation, float(arc[4]) + rotation)
+	
+	# Explode pass: swap every stamped block for the flat geometry it stands for
+	# Gives the same lines and arcs as the entities output style, for fabs that can't take INSERTs.
+	def explode_cutout_blocks(self):
+		for blockref, block_name, profile, x, y, anchor_x, anchor_y, angle in self.stamped_blocks:
+			self.modelspace.delete_entity(blockref)
+			self.draw_profile(profile, x, y, anchor_x, anchor_y, angle)
+		
+		for block_name in ("SWITCH_CUTOUT", "STAB_CUTOUT", "ACOUSTIC_CUTOUT"):
+			if (block_name in self.plate.blocks):
+				self.plate.blocks.delete_block(block_name)
+		
+		self.stamped_blocks = []
+		
+	# Stab cutout maker
+	# The x and y are center, like this:
+	#
+	# -------
+	# |     |
+	# |  X  | -  -  -  Center Y of switch
+	# |     |
+	# |_   _|
+	#   |_|
+
+	def stab_cutout_profile(self):
+		
+		if (self.stab_type == "mx-simple"):
+			# Rectangular simplified mx cutout.
+			# A bit larger than stock to account for fillets.
+			return self.rounded_rectangle_profile(Decimal('-3.375'), Decimal('3.375'), Decimal('6'), Decimal('-8'), self.stab_radius)
+			
+		elif (self.stab_type == "large-cuts"):
+			# Large, spacious 15x7 cutouts; 1mm from mx switch cutout top
+			return self.rounded_rectangle_profile(Decimal('-3.5'), Decimal('3.5'), Decimal('6'), Decimal('-9'), self.stab_radius)
+			
+		elif (self.stab_type == "alps-aek" or self.stab_type == "alps-at101"):
+			# Rectangles 2.67 wide, 5.21 high.
+			return self.rounded_rectangle_profile(Decimal('-1.335'), Decimal('1.335'), Decimal('-3.875'), Decimal('-9.085'), self.stab_radius)
+			
+		elif (self.stab_type == "none"):
+			return ((), ())
+
+		else:
+			print("Unsupported stab type.", file=sys.stderr)
+			print("Stab types: mx-simple, large-cuts, alps-aek, alps-at101, none", file=sys.stderr)
+			#exit(1)
+			return None
+		
+	def make_stab_cutout(self, x, y, anchor_x, anchor_y, angle):
+	
+		if (self.stab_profile is None):
+			return(2)
+		
+		self.place_cutout("STAB_CUTOUT", self.stab_profile, x, y, anchor_x, anchor_y, angle)
+			
+	# Acoustics cuts maker
+
+	def acoustic_cutout_profile(self):
+		
+		if (self.cutout_type == "mx" or self.cutout_type == "alps"):
+			return self.rounded_rectangle_profile(Decimal('-1'), Decimal('1'), (self.cutout_height / Decimal('2')), (self.cutout_height / -Decimal('2')), self.acoustics_radius)
+			
+		return ((), ())
+	
+	def make_acoustic_cutout(self, x, y, anchor_x, anchor_y, angle):
+		self.place_cutout("ACOUSTIC_CUTOUT", self.acoustic_profile, x, y, anchor_x, anchor_y, angle)
+		
+			
+	# Calls make stab cutout based on unit width and style
+	def generate_stabs(self, center_x, center_y, angle, unitwidth):
+
+		if (self.stab_type == "mx-simple" or self.stab_type == "large-cuts"):
+			# Switch based on unit width
+			# These spacings are based on official mx datasheets and deskthority measurements
+			if (unitwidth >= 8): 
+				# self.make_stab_cutout(x, y, anchor_x, anchor_y, angle)
+				self.make_stab_cutout(center_x + Decimal('66.675'), center_y, center_x, center_y, angle)
+				self.make_stab_cutout(center_x - Decimal('66.675'), center_y, center_x, center_y, angle)
+			elif (unitwidth >= 7): 
+				self.make_stab_cutout(center_x + Decimal('57.15'), center_y, center_x, center_y, angle)
+				self.make_stab_cutout(center_x - Decimal('57.15'), center_y, center_x, center_y, angle)
+			elif (unitwidth == 6.25): 
+				self.make_stab_cutout(center_x + Decimal('50'), center_y, center_x, center_y, angle)
+				self.make_stab_cutout(center_x - Decimal('50'), center_y, center_x, center_y, angle)
+			elif (unitwidth == 6): 
+				self.make_stab_cutout(center_x + Decimal('38.1'), center_y, center_x, center_y, angle)
+				self.make_stab_cutout(center_x - Decimal('57.15'), center_y, center_x, center_y, angle)
+			elif (unitwidth >= 3): 
+				self.make_stab_cutout(center_x + Decimal('19.05'), center_y, center_x, center_y, angle)
+				self.make_stab_cutout(center_x - Decimal('19.05'), center_y, center_x, center_y, angle)
+			elif (unitwidth >= 2): 
+				self.make_stab_cutout(center_x + Decimal('11.938'), center_y, center_x, center_y, angle)
+				self.make_stab_cutout(center_x - Decimal('11.938'), center_y, center_x, center_y, angle)
+				if (self.acoustics_type == "extreme"):
+					self.make_acoustic_cutout(center_x + Decimal('18.25'), center_y, center_x, center_y, angle)
+					self.make_acoustic_cutout(center_x - Decimal('18.25'), center_y, center_x, center_y, angle)
+			elif (unitwidth >= 1.5):
+				if (self.acoustics_type == "typical" or (self.acoustics_type == "extreme")):
+					self.make_acoustic_cutout(center_x + Decimal('11.6'), center_y, center_x, center_y, angle)
+					self.make_acoustic_cutout(center_x - Decimal('11.6'), center_y, center_x, center_y, angle)
+		elif (self.stab_type == "alps-aek"):
+			# These are mostly based on measurements. 
+			# If someone has datasheets, please let me know
+			if (unitwidth >= 6.5): 
+				self.make_stab_cutout(center_x + Decimal('45.3'), center_y, center_x, center_y, angle)
+				self.make_stab_cutout(center_x - Decimal('45.3'), center_y, center_x, center_y, angle)
+			elif (unitwidth >= 6.25): 
+				self.make_stab_cutout(center_x + Decimal('41.86'), center_y, center_x, center_y, angle)
+				self.make_stab_cutout(center_x - Decimal('41.86'), center_y, center_x, center_y, angle)
+			elif (unitwidth >= 2): 
+				self.make_stab_cutout(center_x + Decimal('14'), center_y, center_x, center_y, angle)
+				self.make_stab_cutout(center_x - Decimal('14'), center_y, center_x, center_y, angle)
+			elif (unitwidth >= 1.75): 
+				self.make_stab_cutout(center_x + Decimal('12'), center_y, center_x, center_y, angle)
+				self.make_stab_cutout(center_x - Decimal('12'), center_y, center_x, center_y, angle)
+		elif (self.stab_type == "alps-at101"):
+			# These are mostly based on measurements. 
+			# If someone has datasheets, please let me know
+			if (unitwidth >= 6.5): 
+				self.make_stab_cutout(center_x + Decimal('45.3'), center_y, center_x, center_y, angle)
+				self.make_stab_cutout(center_x - Decimal('45.3'), center_y, center_x, center_y, angle)
+			elif (unitwidth >= 6.25): 
+				self.make_stab_cutout(center_x + Decimal('41.86'), center_y, center_x, center_y, angle)
+				self.make_stab_cutout(center_x - Decimal('41.86'), center_y, center_x, center_y, angle)
+			elif (unitwidth >= 2.75): 
+				self.make_stab_cutout(center_x + Decimal('20.5'), center_y, center_x, center_y, angle)
+				self.make_stab_cutout(center_x - Decimal('20.5'), center_y, center_x, center_y, angle)
+			elif (unitwidth >= 2): 
+				self.make_stab_cutout(center_x + Decimal('14'), center_y, center_x, center_y, angle)
+				self.make_stab_cutout(center_x - Decimal('14'), center_y, center_x, center_y, angle)
+			elif (unitwidth >= 1.75): 
+				self.make_stab_cutout(center_x + Decimal('12'), center_y, center_x, center_y, angle)
+				self.make_stab_cutout(center_x - Decimal('12'), center_y, center_x, center_y, angle)
+		
+
+	# Switch cutout profile, relative to the switch center
+	def switch_cutout_profile(self):
+
+		if (self.cutout_type in CUTOUT_TYPES):
+			return self.rounded_rectangle_profile((self.cutout_width / -Decimal('2')), (self.cutout_width / Decimal('2')), (self.cutout_height / Decimal('2')), (self.cutout_height / -Decimal('2')), self.cutout_radius)
+		
+		# TODO: Add switchtop removal cutouts, hardcoded radius to 0.5
+		#elif (self.cutout_type == "mx-topremoval-simple"):
+		#	line_segments.append((-Decimal('7.80') + self.cutout_radius, -Decimal('7')), (Decimal('7.80') - self.cutout_radius, -Decimal('7')))
+		
+		return ((), ())
+	
+	# Draw switch cutout
+	def draw_switch_cutout(self, x, y, angle):
+		self.place_cutout("SWITCH_CUTOUT", self.switch_profile, x, y, x, y, angle)
+		
+	# Use the functions above to render an entire switch - Cutout, stabs, and all
+	def render_switch(self, key):
+		
+		if(self.debug_log):
+			print("X: " + str(key.x))
+			print("Y: " + str(key.y))
+			print("RX: " + str(key.rx))
+			print("RY: " + str(key.ry))
+			print("Angle: " + str(key.angle))
+			print("===")
+			
+		# Upper left in mm. For rotated keys this is still relative to the unrotated rotation anchor.
+		mm_x = key.x * self.unit_width
+		mm_y = key.y * self.unit_height
+			
+		# Then, derive the center of the switch based on width and height
+		mm_center_x = mm_x + ((key.w / Decimal('2')) * self.unit_width)
+		mm_center_y = mm_y - ((key.h / Decimal('2')) * self.unit_height)
+		
+		# Then, rotate the points if angle != 0
+		if (key.angle != Decimal('0')):
+		
+			# This part is the issue
+			
+			# The rotated zone's transform is shared by all of its keys
+			mm_center_x, mm_center_y = self.apply_transform(self.cluster_transform(key.rx, key.ry, key.angle), mm_center_x, mm_center_y)
+			
+			# Do some calculations to see if a rotated switch exceeds current max boundaries
+			
+			corners = []
+			corners.append((mm_x, mm_y))
+			corners.append((mm_x + (key.w * self.unit_width), mm_y))
+			corners.append((mm_x, mm_y - (key.h * self.unit_height)))
+			corners.append((mm_x + (key.w * self.unit_width), mm_y - (key.h * self.unit_height)))
+			
+			corner_transform = self.affine_transform(Decimal('0'), Decimal('0'), mm_center_x, mm_center_y, key.angle)
+			for corner in corners:
+				rotated_corner = self.apply_transform(corner_transform, corner[0], corner[1])
+				
+				if (rotated_corner[0] > self.max_width):
+					self.max_width = rotated_corner[0];
+				if (rotated_corner[1] < self.max_height):
+					self.max_height = rotated_corner[1];
+				
+		# Draw main switch cutout
+		self.draw_switch_cutout(mm_center_x, mm_center_y, key.angle + key.cutout_angle)
+		
+		# Adjust width for vertically tall keys, and generate stabs
+		apparent_width = key.w;
+		if (key.w < key.h):
+			apparent_width = key.h;
+		
+		self.generate_stabs(mm_center_x, mm_center_y, key.angle + key.stab_angle, apparent_width)
+		
+
+	# Generate switch cutout sizes
+	def initialize_variables(self):
+		if (self.cutout_type == "mx"):
+			self.cutout_width = Decimal('14');
+			self.cutout_height = Decimal('14');
+		elif (self.cutout_type == "mx-slightly-wider"):
+			self.cutout_width = Decimal('15');
+			self.cutout_height = Decimal('14');
+		elif (self.cutout_type == "alps"):
+			self.cutout_width = Decimal('15.50');
+			self.cutout_height = Decimal('12.80');
+		elif (self.cutout_type == "alps-skcp"):
+			self.cutout_width = Decimal('16');
+			self.cutout_height = Decimal('16');
+		elif (self.cutout_type == "omron"):
+			self.cutout_width = Decimal('13.50');
+			self.cutout_height = Decimal('13.50');
+		elif (self.cutout_type == "kailh-choc-CPG1350"):
+                        # Datasheet lists 13.8x13.8 with no tolerances, so
+                        # using tolerances off choc-mini datasheet
+			self.cutout_width = Decimal('13.82');
+			self.cutout_height = Decimal('13.82');
+		elif (self.cutout_type == "kailh-choc-mini-CPG1232"):
+			self.cutout_width = Decimal('13.52');
+			self.cutout_height = Decimal('12.52');
+		else:
+			print("Unsupported cutout type.", file=sys.stderr)
+			print("Supported: mx, alps, omron", file=sys.stderr)
+			#exit(1)
+			return 3
+		
+		# Check if values legal
+
+		# Cutout radius: The fillet radius ( 0 <= x <= 1/2 width or height)
+		if ((self.cutout_radius < 0) or (self.cutout_radius > (self.cutout_width/2)) or (self.cutout_radius > (self.cutout_height/2))) :
+			print("Radius must be between 0 and half the cutout width/height.", file=sys.stderr)
+			#exit(1)
+			return 4
+
+		# Unit size ( 0 <= x <= inf, cap at 1000 for now )
+		if (self.unit_width < 0 or self.unit_width > 1000):
+			print("Unit size must be between 0 and 1000", file=sys.stderr)
+			#exit(1)
+			return 5
+			
+		if (self.unit_height < 0 or self.unit_height > 1000):
+			print("Unit size must be between 0 and 1000", file=sys.stderr)
+			#exit(1)
+			return 5
+			
+		if (self.stab_radius < 0 or self.stab_radius > 5):
+			return 6
+		if (self.acoustics_radius < 0 or self.acoustics_radius > 5):
+			return 7
+			
+		if (self.output_style not in ["entities", "polylines", "blocks", "blocks-exploded"]):
+			print("Unsupported output style.", file=sys.stderr)
+			print("Output styles: entities, polylines, blocks, blocks-exploded", file=sys.stderr)
+			return 9
+			
+		if (self.engine not in ["decimal", "numpy"]):
+			print("Unsupported engine.", file=sys.stderr)
+			print("Engines: decimal, numpy", file=sys.stderr)
+			return 12
+		if (self.engine == "numpy" and numpy is None):
+			print("The numpy engine needs numpy to be installed.", file=sys.stderr)
+			return 12
+		
+		if (self.dxf_writer not in ["ezdxf", "native"]):
+			print("Unsupported DXF writer.", file=sys.stderr)
+			print("DXF writers: ezdxf, native", file=sys.stderr)
+			return 15
+		if (self.dxf_writer == "native" and self.output_style not in ["entities", "polylines"]):
+			print("The native DXF writer only writes the entities and polylines output styles.", file=sys.stderr)
+			return 15
+		
+		# Options are good, so the cutout shapes can be built once for every plate this generator makes
+		self.switch_profile = self.switch_cutout_profile()
+		self.stab_profile = self.stab_cutout_profile()
+		self.acoustic_profile = self.acoustic_cutout_profile()
+			
+		return 0
+			
+	# Shape of a placed cutout for cutoutcheck: its fillet centers, rotated into place, and the fillet radius
+	def cutout_shape(self, profile, x, y, anchor_x, anchor_y, angle):
+		line_segments, corners = profile
+		top_left, top_right, bottom_left, bottom_right = corners
+		transform = self.affine_transform(x, y, anchor_x, anchor_y, angle)
+		shape_corners = []
+		for center_x, center_y, radius, angle_start, angle_end in (bottom_left, bottom_right, top_right, top_left):
+			coords = self.apply_transform(transform, center_x, center_y)
+			shape_corners.append((float(coords[0]), float(coords[1])))
+		return cutoutcheck.CutoutShape(shape_corners, float(top_left[2]))
+	
+	# Check the last rendered plate for cutouts that overlap or leave less than min_web mm of plate between them
+	# Returns a list of warnings, one dict per pair of cutouts:
+	# type ('overlap' or 'thin-web'), gap (mm, 0 for overlaps), x and y (mm, where on the plate),
+	# and cutouts: for each of the two, the key (its index in the KLE data) and kind (switch, stab or acoustic).
+	# Raises ValueError for a min_web read_min_web won't take.
+	def validate_cutouts(self, min_web=DEFAULT_MIN_WEB):
+		min_web = read_min_web(min_web)
+		with localcontext(self.decimal_context):
+			return self.validate_cutouts_in_context(min_web)
+	
+	def validate_cutouts_in_context(self, min_web):
+		
+		placed = [cutout for cutout in self.placed_cutouts if cutout[2][1]]
+		shapes = [self.cutout_shape(profile, x, y, anchor_x, anchor_y, angle) for group, block_name, profile, x, y, anchor_x, anchor_y, angle in placed]
+		
+		warnings = []
+		for index_a, index_b, gap, position in cutoutcheck.find_thin_webs(shapes, min_web):
+			warnings.append({
+				'type': 'overlap' if gap <= 0 else 'thin-web',
+				'gap': round(max(gap, 0.0), 6),
+				'x': round(position[0], 6),
+				'y': round(position[1], 6),
+				'cutouts': [{'key': placed[index][0], 'kind': CUTOUT_KINDS.get(placed[index][1], placed[index][1])} for index in (index_a, index_b)],
+			})
+		return warnings
+	
+	# Generate a plate from KLE data and write it to file
+	# All Decimal maths runs in a local copy of this generator's context, never the thread's own.
+	def generate_plate(self, file, input_data=None):
+		with localcontext(self.decimal_context):
+			return self.generate_plate_in_context(file, input_data)
+	
+	def generate_plate_in_context(self, file, input_data):
+
+		# Init vars
+		if (self.init_code is None):
+			self.init_code = self.initialize_variables()
+		if (self.init_code != 0):
+			return self.init_code
+		
+		# Start from a clean slate, so one generator can be reused for many plates
+		self.reset_plate()
+		
+		# Nothing to parse
+		if not input_data:
+			return(1)
+		
+		# Parse KLE data
+		stage_start = time.perf_counter()
+		try:
+			layout = parse_layout(input_data, self.debug_log)
+		except(ValueError) as error:
+			self.parse_error = error
+			return(1)
+		self.stage_times['parse'] = time.perf_counter() - stage_start
+			
+		stage_start = time.perf_counter()
+		self.render_layout(layout)
+		self.stage_times['render'] = time.perf_counter() - stage_start
+		
+		if (self.debug_log):
+			print("Complete!")
+			return 0
+		
+		# No file to write to: just render, e.g. to validate the cutouts
+		if (file is None):
+			return 0
+
+		stage_start = time.perf_counter()
+		self.write_plate(file)
+		self.stage_times['serialise'] = time.perf_counter() - stage_start
+		return 0
+	
+	# Generate a plate from cutouts placed by place_layout and write it to file (None = just render)
+	# Returns the same codes as generate_plate, bar 1 since there's no KLE data to parse.
+	def generate_placed_plate(self, file, placement):
+		with localcontext(self.decimal_context):
+			return self.generate_placed_plate_in_context(file, placement)
+	
+	def generate_placed_plate_in_context(self, file, placement):
+		
+		if (self.init_code is None):
+			self.init_code = self.initialize_variables()
+		if (self.init_code != 0):
+			return self.init_code
+		
+		self.reset_plate()
+		
+		stage_start = time.perf_counter()
+		self.render_placement(placement)
+		self.stage_times['render'] = time.perf_counter() - stage_start
+		
+		if (file is None):
+			return 0
+		
+		stage_start = time.perf_counter()
+		self.write_plate(file)
+		self.stage_times['serialise'] = time.perf_counter() - stage_start
+		return 0
+	
+	# Render a plate from KLE data as an SVG preview and write it to file
+	# Cutouts are only positioned, not drawn, so no DXF entities are built at all.
+	# Returns the same codes as generate_plate.
+	def generate_preview(self, file, input_data=None):
+		with localcontext(self.decimal_context):
+			return self.generate_preview_in_context(file, input_data)
+	
+	def generate_preview_in_context(self, file, input_data):
+		
+		if (self.init_code is None):
+			self.init_code = self.initialize_variables()
+		if (self.init_code != 0):
+			return self.init_code
+		
+		self.reset_plate()
+		
+		if not input_data:
+			return(1)
+		
+		stage_start = time.perf_counter()
+		try:
+			layout = parse_layout(input_data, self.debug_log)
+		except(ValueError) as error:
+			self.parse_error = error
+			return(1)
+		self.stage_times['parse'] = time.perf_counter() - stage_start
+		
+		stage_start = time.perf_counter()
+		self.preview_only = True
+		try:
+			self.render_layout(layout)
+		finally:
+			self.preview_only = False
+		self.stage_times['render'] = time.perf_counter() - stage_start
+		
+		stage_start = time.perf_counter()
+		self.write_preview(file)
+		self.stage_times['serialise'] = time.perf_counter() - stage_start
+		return 0
+	
+	# Generate a panel: several plates nested onto one sheet and written out as one DXF
+	# layouts is a list of KLE raw data, one entry per plate; repeat an entry for copies.
+	# Sheet width, height and the spacing between plates are in mm. Plates may be turned 90 degrees to fit.
+	# panel_placements records where each plate's extents went: (x, y of the bottom left corner, rotated).
+	# Returns 0, 1 for invalid KLE data, 13 if the plates don't all fit on the sheet, or 14 for an invalid sheet size or spacing.
+	def generate_panel(self, file, layouts, sheet_width, sheet_height, spacing):
+		with localcontext(self.decimal_context):
+			return self.generate_panel_in_context(file, layouts, sheet_width, sheet_height, spacing)
+	
+	def generate_panel_in_context(self, file, layouts, sheet_width, sheet_height, spacing):
+		
+		if (self.init_code is None):
+			self.init_code = self.initialize_variables()
+		if (self.init_code != 0):
+			return self.init_code
+		
+		try:
+			sheet_width = Decimal(sheet_width)
+			sheet_height = Decimal(sheet_height)
+			spacing = Decimal(spacing)
+		except:
+			return 14
+		if (sheet_width <= 0 or sheet_height <= 0 or spacing < 0):
+			return 14
+		
+		self.reset_plate()
+		
+		# Parse each distinct layout once, however many copies there are
+		stage_start = time.perf_counter()
+		parsed_layouts = {}
+		try:
+			for input_data in layouts:
+				if (input_data not in parsed_layouts):
+					parsed_layouts[input_data] = parse_layout(input_data, self.debug_log)
+		except(ValueError) as error:
+			self.parse_error = error
+			return 1
+		self.stage_times['parse'] = time.perf_counter() - stage_start
+		
+		self.start_document()
+		
+		# Render each distinct plate where it is first, and copy what it drew for any more of it; cutouts can poke out
+		# past a plate's outline, so plates are nested by the extents of everything they actually drew
+		stage_start = time.perf_counter()
+		plates = []
+		plate_sizes = []
+		rendered_plates = {}
+		for input_data in layouts:
+			if (input_data in rendered_plates):
+				entities, min_x, min_y, plate_size = rendered_plates[input_data]
+				plates.append((self.copy_entities(entities), min_x, min_y))
+				plate_sizes.append(plate_size)
+				continue
+			
+			entity_count = len(self.modelspace)
+			self.render_layout(parsed_layouts[input_data])
+			entities = list(self.modelspace)[entity_count:]
+			
+			points = [point for entity in entities for point in self.entity_extent_points(entity)]
+			min_x = Decimal(repr(min(point[0] for point in points)))
+			min_y = Decimal(repr(min(point[1] for point in points)))
+			max_x = Decimal(repr(max(point[0] for point in points)))
+			max_y = Decimal(repr(max(point[1] for point in points)))
+			
+			rendered_plates[input_data] = (entities, min_x, min_y, (max_x - min_x, max_y - min_y))
+			plates.append((entities, min_x, min_y))
+			plate_sizes.append((max_x - min_x, max_y - min_y))
+		
+		self.panel_placements = nesting.pack_rectangles(plate_sizes, sheet_width, sheet_height, spacing)
+		if (self.panel_placements is None):
+			return 13
+		
+		# Then move everything each plate drew into its spot on the sheet
+		for (entities, min_x, min_y), (plate_width, plate_height), (x, y, rotated) in zip(plates, plate_sizes, self.panel_placements):
+			self.move_to_panel(entities, min_x, min_y, plate_height, x, y, rotated)
+		self.stage_times['render'] = time.perf_counter() - stage_start
+		
+		stage_start = time.perf_counter()
+		self.write_plate(file)
+		self.stage_times['serialise'] = time.perf_counter() - stage_start
+		return 0
+	
+	# Points, as floats, whose bounding box covers an entity
+	# Arcs are covered by their whole circle, and bulged polyline segments by their endpoints
+	# pushed out by the bulge's height, so the box can be a touch generous but never too small.
+	def entity_extent_points(self, entity):
+		entity_type = entity.dxftype()
+		
+		if (entity_type == 'LINE'):
+			return [tuple(entity.dxf.start)[:2], tuple(entity.dxf.end)[:2]]
+		
+		elif (entity_type == 'ARC'):
+			center_x, center_y = tuple(entity.dxf.center)[:2]
+			radius = entity.dxf.radius
+			return [(center_x - radius, center_y - radius), (center_x + radius, center_y + radius)]
+		
+		elif (entity_type == 'LWPOLYLINE'):
+			vertices = [(float(point[0]), float(point[1]), float(point[4])) for point in entity.get_points()]
+			points = []
+			for i, (vertex_x, vertex_y, bulge) in enumerate(vertices):
+				next_x, next_y = vertices[(i + 1) % len(vertices)][:2]
+				height = abs(bulge) * math.hypot(next_x - vertex_x, next_y - vertex_y) / 2
+				for point_x, point_y in ((vertex_x, vertex_y), (next_x, next_y)):
+					points += [(point_x - height, point_y - height), (point_x + height, point_y + height)]
+			return points
+		
+		elif (entity_type == 'INSERT'):
+			insert_x, insert_y = tuple(entity.dxf.insert)[:2]
+			rotation = math.radians(entity.dxf.rotation)
+			cos_result = math.cos(rotation)
+			sin_result = math.sin(rotation)
+			points = []
+			for block_entity in self.plate.blocks.get(entity.dxf.name):
+				# Corners of the block entity's box, rotated and moved into place
+				block_points = self.entity_extent_points(block_entity)
+				box_x = [point[0] for point in block_points]
+				box_y = [point[1] for point in block_points]
+				for point_x in (min(box_x), max(box_x)):
+					for point_y in (min(box_y), max(box_y)):
+						points.append((insert_x + point_x * cos_result - point_y * sin_result, insert_y + point_x * sin_result + point_y * cos_result))
+			return points
+		
+		return []
+	
+	# A number as it goes into the modelspace: a float, rounded to the output precision if there is one
+	def output_number(self, value):
+		if (self.output_decimals is None):
+			return float(value)
+		return dxfwriter.round_number(float(value), 10.0 ** self.output_decimals)
+	
+	# Draw a copy of some entities right where they are, and return the copies
+	def copy_entities(self, entities):
+		copies = []
+		for entity in entities:
+			entity_type = entity.dxftype()
+			if (entity_type == 'LINE'):
+				copies.append(self.modelspace.add_line(entity.dxf.start, entity.dxf.end))
+			elif (entity_type == 'ARC'):
+				copies.append(self.modelspace.add_arc(entity.dxf.center, entity.dxf.radius, entity.dxf.start_angle, entity.dxf.end_angle))
+			elif (entity_type == 'LWPOLYLINE'):
+				copies.append(self.modelspace.add_lwpolyline(list(entity.get_points()), dxfattribs={'closed': True}))
+			elif (entity_type == 'INSERT'):
+				copies.append(self.modelspace.add_blockref(entity.dxf.name, entity.dxf.insert, dxfattribs={'rotation': entity.dxf.rotation}))
+		return copies
+	
+	# Move a rendered plate's entities onto the panel
+	# The plate's extents start at (min_x, min_y); on the panel, that corner goes to (x, y),
+	# after turning the plate 90 degrees counter-clockwise if rotated.
+	def move_to_panel(self, entities, min_x, min_y, plate_height, x, y, rotated):
+		
+		def panel_point(point):
+			# Work in Decimal from the shortest repr of each float, so offsets don't add float noise
+			u = (point[0] if isinstance(point[0], Decimal) else Decimal(repr(point[0]))) - min_x
+			v = (point[1] if isinstance(point[1], Decimal) else Decimal(repr(point[1]))) - min_y
+			if (rotated):
+				return (self.output_number(x + plate_height - v), self.output_number(y + u))
+			return (self.output_number(x + u), self.output_number(y + v))
+		
+		quarter_turn = 90 if rotated else 0
+		
+		for entity in entities:
+			entity_type = entity.dxftype()
+			if (entity_type == 'LINE'):
+				entity.dxf.start = panel_point(entity.dxf.start)
+				entity.dxf.end = panel_point(entity.dxf.end)
+			elif (entity_type == 'ARC'):
+				entity.dxf.center = panel_point(entity.dxf.center)
+				entity.dxf.start_angle = self.output_number(entity.dxf.start_angle + quarter_turn)
+				entity.dxf.end_angle = self.output_number(entity.dxf.end_angle + quarter_turn)
+			elif (entity_type == 'LWPOLYLINE'):
+				entity.set_points([panel_point(point) + tuple(point[2:]) for point in entity.get_points()])
+			elif (entity_type == 'INSERT'):
+				entity.dxf.insert = panel_point(entity.dxf.insert)
+				entity.dxf.rotation = self.output_number(entity.dxf.rotation + quarter_turn)
+	
+	# Serialise the plate to stdout, a text stream or a binary stream
+	# Binary streams are fed through a small utf-8 encoding buffer as the DXF is written,
+	# so the whole DXF never has to exist as one big string on top of the bytes.
+	def write_plate(self, file):
+		if (file == "stdout"):
+			self.write_dxf(sys.stdout)
+		elif (isinstance(file, (io.RawIOBase, io.BufferedIOBase))):
+			text_stream = io.TextIOWrapper(file, encoding='utf-8', newline='')
+			self.write_dxf(text_stream)
+			text_stream.flush()
+			text_stream.detach()
+		else:
+			self.write_dxf(file)
+	
+	# Write the DXF to a text stream with the chosen writer
+	def write_dxf(self, stream):
+		self.start_document()
+		if (self.dxf_writer == "native"):
+			dxfwriter.write_dxf(stream, self.modelspace, self.output_decimals)
+		else:
+			self.plate.write(stream)
+	
+	# SVG path data for a cutout outline, centered on the origin
+	# SVG's y axis points down, so y is flipped, and with it the direction each fillet turns.
+	def outline_path(self, outline):
+		
+		commands = ['M' + svg_number(outline[0][0]) + ' ' + svg_number(-outline[0][1])]
+		for i, (vertex_x, vertex_y, bulge) in enumerate(outline):
+			next_x, next_y, next_bulge = outline[(i + 1) % len(outline)]
+			if (bulge == 0):
+				if (i + 1 < len(outline)):
+					commands.append('L' + svg_number(next_x) + ' ' + svg_number(-next_y))
+				continue
+			
+			# Radius from the chord and the bulge, tan(sweep / 4)
+			chord = math.hypot(float(next_x - vertex_x), float(next_y - vertex_y))
+			radius = chord * (1 + bulge * bulge) / (4 * abs(bulge))
+			commands.append('A' + svg_number(radius) + ' ' + svg_number(radius) + ' 0 ' + ('1' if abs(bulge) > 1 else '0') + ' ' + ('0' if bulge > 0 else '1')
+				+ ' ' + svg_number(next_x) + ' ' + svg_number(-next_y))
+		commands.append('Z')
+		
+		return ''.join(commands)
+	
+	# Write the recorded cutouts out as an SVG preview
+	# Each cutout shape is defined once and placed with a <use>, much like the blocks output style.
+	def write_preview(self, file):
+		
+		# The plate, plus anything sticking out past it
+		min_x = min(float(self.max_width), 0.0)
+		max_x = max(float(self.max_width), 0.0)
+		min_y = min(float(self.max_height), 0.0)
+		max_y = max(float(self.max_height), 0.0)
+		
+		definitions = []
+		extents = {}
+		uses = []
+		for group, block_name, profile, x, y, anchor_x, anchor_y, angle in self.placed_cutouts:
+			
+			if (block_name not in extents):
+				outline = self.cutout_outline(block_name, profile)
+				extents[block_name] = max((math.hypot(float(vertex[0]), float(vertex[1])) for vertex in outline), default=None)
+				if (outline):
+					definitions.append('<path id="' + block_name + '" d="' + self.outline_path(outline) + '"/>')
+			if (extents[block_name] is None):
+				continue
+			
+			transform = 'translate(' + svg_number(x) + ' ' + svg_number(-y) + ')'
+			if (angle != 0):
+				transform = 'rotate(' + svg_number(-angle) + ' ' + svg_number(anchor_x) + ' ' + svg_number(-anchor_y) + ') ' + transform
+			uses.append('<use xlink:href="#' + block_name + '" transform="' + transform + '"/>')
+			
+			center_x, center_y = self.rotate_point_around_anchor(x, y, anchor_x, anchor_y, angle)
+			extent = extents[block_name]
+			min_x = min(min_x, float(center_x) - extent)
+			max_x = max(max_x, float(center_x) + extent)
+			min_y = min(min_y, float(center_y) - extent)
+			max_y = max(max_y, float(center_y) + extent)
+		
+		min_x -= SVG_MARGIN
+		min_y -= SVG_MARGIN
+		width = max_x - min_x + SVG_MARGIN
+		height = max_y - min_y + SVG_MARGIN
+		
+		lines = [
+			'<svg xmlns="http://www.w3.org/2000/svg" xmlns:xlink="http://www.w3.org/1999/xlink" viewBox="' + svg_number(min_x) + ' ' + svg_number(-(min_y + height)) + ' ' + svg_number(width) + ' ' + svg_number(height)
+				+ '" width="' + svg_number(width) + 'mm" height="' + svg_number(height) + 'mm">',
+			'<defs>',
+		] + definitions + [
+			'</defs>',
+			'<g fill="none" stroke="#000" stroke-width="' + svg_number(SVG_STROKE_WIDTH) + '">',
+			'<rect x="0" y="' + svg_number(-max(float(self.max_height), 0.0)) + '" width="' + svg_number(abs(self.max_width)) + '" height="' + svg_number(abs(self.max_height)) + '"/>',
+		] + uses + [
+			'</g>',
+			'</svg>',
+			'',
+		]
+		svg = '\n'.join(lines)
+		
+		if (file == "stdout"):
+			sys.stdout.write(svg)
+		elif (isinstance(file, (io.RawIOBase, io.BufferedIOBase))):
+			file.write(svg.encode('utf-8'))
+		else:
+			file.write(svg)
+	
+	# Render a parsed layout into the modelspace
+	def render_layout(self, layout):
+		
+		# Adjust max width/height from units to mm
+		
+		self.max_width = layout.width * self.unit_width
+		self.max_height = layout.height * self.unit_height
+		self.key_count = len(layout.keys)
+		
+		if (not self.preview_only):
+			self.start_document()
+		
+		# Set up each rotated zone's transform once, ahead of its keys
+		for rx, ry, angle in layout.rotation_clusters():
+			if (angle != 0):
+				self.cluster_transform(rx, ry, angle)
+		
+		# Render each one by one. 
+		for group, key in enumerate(layout.keys):
+			self.current_group = group
+			self.render_switch(key)
+		
+		# A preview only needs the recorded cutouts
+		if (self.preview_only):
+			return
+			
+		self.finish_layout()
+	
+	# Draw cutouts placed by another generator, with this generator's own profile for each kind of cutout
+	# placement is (placed cutouts, max width, max height, key count), as left by render_layout on a generator
+	# with the same unit size, stab type and acoustics type. Only the cutout shapes differ from rendering the layout here.
+	def render_placement(self, placement):
+		
+		placed_cutouts, self.max_width, self.max_height, self.key_count = placement
+		self.start_document()
+		
+		profiles = {"SWITCH_CUTOUT": self.switch_profile, "STAB_CUTOUT": self.stab_profile, "ACOUSTIC_CUTOUT": self.acoustic_profile}
+		for group, block_name, profile, x, y, anchor_x, anchor_y, angle in placed_cutouts:
+			profile = profiles[block_name]
+			if (profile is None):
+				continue
+			self.current_group = group
+			self.place_cutout(block_name, profile, x, y, anchor_x, anchor_y, angle)
+		
+		self.finish_layout()
+	
+	# Once every cutout is placed: draw any batched cutouts, explode blocks, and add the outer bounds
+	def finish_layout(self):
+		
+		if (self.pending_cutouts):
+			self.draw_pending_cutouts()
+			
+		if (self.output_style == "blocks-exploded"):
+			self.explode_cutout_blocks()
+
+		self.draw_plate_bounds()
+	
+	# Draw outer bounds - top, bottom, left, right
+	# Returns the lines, so an incremental re-render can replace them if the bounds move.
+	def draw_plate_bounds(self):
+		return [
+			self.modelspace.add_line((0, 0), (self.max_width, 0)),
+			self.modelspace.add_line((0, self.max_height), (self.max_width, self.max_height)),
+			self.modelspace.add_line((0, 0), (0, self.max_height)),
+			self.modelspace.add_line((self.max_width, 0), (self.max_width, self.max_height)),
+		]
+	
+	# Render one key by itself, for incremental re-renders (see platesession.py)
+	# Anything normally left until the whole plate is placed (numpy batches, exploding blocks) is done for just this key.
+	# The key's entities end up at the end of the modelspace; returns the cutouts it placed, which are taken back off placed_cutouts.
+	def render_key(self, key, group):
+		
+		self.start_document()
+		first_cutout = len(self.placed_cutouts)
+		self.current_group = group
+		self.render_switch(key)
+		
+		if (self.pending_cutouts):
+			self.draw_pending_cutouts()
+		if (self.output_style == "blocks-exploded"):
+			self.explode_cutout_blocks()
+		
+		cutouts = self.placed_cutouts[first_cutout:]
+		del self.placed_cutouts[first_cutout:]
+		return cutouts
+			
+		
+# A min_web for validate_cutouts, as a number or a string, in mm
+# Returns it as a float. Raises ValueError unless it's a number from 0 to MAX_MIN_WEB (so never nan or infinite).
+def read_min_web(value):
+	min_web = float(value)
+	if (not (0 <= min_web <= MAX_MIN_WEB)):
+		raise ValueError("min web must be from 0 to " + str(MAX_MIN_WEB) + "mm")
+	return min_web
+
+# Number for SVG output: mm to 4 decimal places, without trailing zeros
+def svg_number(value):
+	text = ('%.4f' % float(value)).rstrip('0').rstrip('.')
+	return '0' if text == '-0' else text
+
+# Human readable one-liner for a validate_cutouts warning
+def describe_warning(warning):
+	cutouts = ' and '.join(cutout['kind'] + ' cutout of key ' + str(cutout['key']) for cutout in warning['cutouts'])
+	position = ' at (' + str(warning['x']) + ', ' + str(warning['y']) + ')'
+	if (warning['type'] == 'overlap'):
+		return 'Overlapping cutouts: ' + cutouts + position
+	return 'Thin web (' + str(warning['gap']) + 'mm): ' + cutouts + position
+
+# Options accepted per job by generate_many, with the same defaults as the CLI
+DEFAULT_OPTIONS = {
+	'cutout_type': 'mx',
+	'cutout_radius': '0.5',
+	'stab_type': 'mx-simple',
+	'stab_radius': '0.5',
+	'acoustics_type': 'none',
+	'acoustics_radius': '0.5',
+	'unit_width': '19.05',
+	'unit_height': '19.05',
+	'output_style': 'entities',
+	'engine': 'decimal',
+	'toolpath_origin': None,
+	'dxf_writer': 'ezdxf',
+	'output_precision': DEFAULT_OUTPUT_PRECISION,
+}
+
+# The PlateGenerator for an options dict, from generators if one was made for the same options already
+# Missing options fall back to DEFAULT_OPTIONS. Raises ValueError for options PlateGenerator won't take.
+def cached_generator(options, generators):
+
+	job_options = dict(DEFAULT_OPTIONS)
+	if (options):
+		job_options.update(options)
+	
+	config = (job_options['cutout_type'], job_options['cutout_radius'], job_options['stab_type'], job_options['stab_radius'], 
+	job_options['acoustics_type'], job_options['acoustics_radius'], job_options['unit_width'], job_options['unit_height'], job_options['output_style'], job_options['engine'], job_options['toolpath_origin'], job_options['dxf_writer'], job_options['output_precision'])
+	
+	gen = generators.get(config)
+	if (gen is None):
+		gen = PlateGenerator(config[0], config[1], config[2], config[3], config[4], config[5], config[6], config[7], False, config[8], config[9], config[10], config[11], config[12])
+		generators[config] = gen
+	return gen
+
+# Generate many plates, reusing one PlateGenerator per distinct set of options
+# jobs is an iterable of (KLE raw data, options dict) pairs; missing options fall back to DEFAULT_OPTIONS.
+# Yields (return code, dxf text) per job in order. The dxf text is None unless the return code is 0.
+# Return code 10 means one of the numeric options could not be read.
+# Pass in a dict as generators to keep the generators around between calls.
+def generate_many(jobs, generators=None):
+
+	if (generators is None):
+		generators = {}
+	
+	for input_data, options in jobs:
+	
+		try:
+			gen = cached_generator(options, generators)
+		except(ValueError):
+			yield (10, None)
+			continue
+		
+		output_data = io.StringIO()
+		out_code = gen.generate_plate(output_data, input_data)
+		if (out_code != 0):
+			yield (out_code, None)
+		else:
+			yield (0, output_data.getvalue())
+		output_data.close()
+	
+# Options that decide where cutouts go. The rest only change the cutout shapes or how they're written out,
+# so a sweep places a layout's cutouts once per distinct combination of these.
+SWEEP_PLACEMENT_OPTIONS = ('stab_type', 'acoustics_type', 'unit_width', 'unit_height')
+
+# Place a parsed layout's cutouts without drawing anything, for render_placement
+# Placed with mx switch cutouts, as every kind of cutout has a shape for mx, so every position is recorded.
+# Returns (return code, placement).
+def place_layout(layout, options):
+
+	gen = PlateGenerator('mx', DEFAULT_OPTIONS['cutout_radius'], options['stab_type'], DEFAULT_OPTIONS['stab_radius'], options['acoustics_type'], DEFAULT_OPTIONS['acoustics_radius'], 
+	options['unit_width'], options['unit_height'], False)
+	with localcontext(gen.decimal_context):
+		out_code = gen.initialize_variables()
+		if (out_code != 0):
+			return (out_code, None)
+		gen.preview_only = True
+		gen.render_layout(layout)
+	return (0, (gen.placed_cutouts, gen.max_width, gen.max_height, gen.key_count))
+
+# Render one parsed layout (from parse_layout) under many option sets
+# The cutouts are placed once per distinct SWEEP_PLACEMENT_OPTIONS, then each option set only draws its own cutout shapes there,
+# so sweeping cutout types, radii, output styles and so on skips all the key placement and rotation maths.
+# option_sets are options dicts as for generate_many. Yields (return code, dxf text) per option set in order,
+# with the same return codes as generate_many. Pass in a dict as generators to keep the generators around between calls;
+# without one, each generator is dropped once its plate is out, so a long sweep of big plates isn't all held in memory at once.
+def generate_sweep(layout, option_sets, generators=None):
+
+	placements = {}
+	
+	for options in option_sets:
+	
+		try:
+			gen = cached_generator(options, generators if generators is not None else {})
+		except(ValueError):
+			yield (10, None)
+			continue
+		
+		job_options = dict(DEFAULT_OPTIONS)
+		if (options):
+			job_options.update(options)
+		placement_key = tuple(job_options[name] for name in SWEEP_PLACEMENT_OPTIONS)
+		
+		if (placement_key not in placements):
+			placements[placement_key] = place_layout(layout, job_options)
+		out_code, placement = placements[placement_key]
+		if (out_code != 0):
+			yield (out_code, None)
+			continue
+		
+		output_data = io.StringIO()
+		out_code = gen.generate_placed_plate(output_data, placement)
+		if (out_code != 0):
+			yield (out_code, None)
+		else:
+			yield (0, output_data.getvalue())
+		output_data.close()
+
+# Every combination of swept option values, on top of the base options
+# sweeps is a list of (option name, values). Returns (name, options) per combination, the name being its values joined by dashes.
+def sweep_option_sets(sweeps, base_options):
+
+	option_sets = [('', dict(base_options))]
+	for option_name, values in sweeps:
+		option_sets = [((name + '-' if name else '') + str(value), dict(options, **{option_name: value})) for name, options in option_sets for value in values]
+	return option_sets
+
+# Render one layout under every combination of swept options, to <combination>.dxf in output_path,
+# or all into one zip archive when output_path ends in .zip
+# Returns the number of failed combinations. Failures are listed on stderr with their return codes.
+def run_sweep(input_data, sweeps, output_path, base_options):
+
+	try:
+		layout = parse_layout(input_data)
+	except(ValueError) as err:
+		print("Invalid KLE data: " + str(err), file=sys.stderr)
+		return 1
+	
+	option_sets = sweep_option_sets(sweeps, base_options)
+	results = generate_sweep(layout, [options for name, options in option_sets])
+	
+	failures = []
+	try:
+		if (output_path.lower().endswith('.zip')):
+			with zipfile.ZipFile(output_path, 'w', zipfile.ZIP_DEFLATED) as archive:
+				for (name, options), (out_code, output_text) in zip(option_sets, results):
+					if (out_code != 0):
+						failures.append((name, out_code))
+					else:
+						archive.writestr(name + '.dxf', output_text)
+		else:
+			os.makedirs(output_path, exist_ok=True)
+			for (name, options), (out_code, output_text) in zip(option_sets, results):
+				if (out_code != 0):
+					failures.append((name, out_code))
+					continue
+				with open(os.path.join(output_path, name + '.dxf'), 'w', encoding='utf-8') as output_file:
+					output_file.write(output_text)
+	except(OSError) as err:
+		print(str(err), file=sys.stderr)
+		return len(option_sets)
+	
+	for name, out_code in failures:
+		print(name + ": failed with return code " + str(out_code), file=sys.stderr)
+	print(str(len(option_sets) - len(failures)) + " of " + str(len(option_sets)) + " plates generated.", file=sys.stderr)
+	
+	return len(failures)
+
+# Generators kept alive inside each batch worker process, so a worker only sets up each option set once
+batch_generators = {}
+
+# Render one batch job: (KLE file path, output dxf path, options)
+# Returns (output dxf path, return code). Return code 11 means the KLE file couldn't be read or the dxf couldn't be written.
+def render_batch_job(job):
+
+	input_path, output_path, options = job
+	
+	try:
+		with open(input_path, 'r', encoding='utf-8') as input_file:
+			input_data = input_file.read()
+	except(OSError) as err:
+		print(str(err), file=sys.stderr)
+		return (output_path, 11)
+	
+	out_code, output_text = next(generate_many([(input_data, options)], batch_generators))
+	if (out_code != 0):
+		return (output_path, out_code)
+	
+	try:
+		with open(output_path, 'w', encoding='utf-8') as output_file:
+			output_file.write(output_text)
+	except(OSError) as err:
+		print(str(err), file=sys.stderr)
+		return (output_path, 11)
+	
+	return (output_path, 0)
+
+# Check a manifest option set, and turn its values into strings as PlateGenerator takes them from the command line
+# json5 numbers go through str(), so 19.05 stays 19.05 rather than becoming the float nearest it,
+# and toolpath_origin may also be given as an [x, y] pair.
+# Raises ValueError for options that don't exist and values that can't be options.
+def manifest_option_set(option_set):
+
+	if (not isinstance(option_set, dict)):
+		raise ValueError("option sets must be objects, not " + json.dumps(option_set))
+	
+	options = {}
+	for option_name, value in option_set.items():
+		if (option_name != 'name' and option_name not in DEFAULT_OPTIONS):
+			raise ValueError("unknown option " + option_name + " in option set " + json.dumps(option_set) + ". Options: " + ", ".join(DEFAULT_OPTIONS))
+		if (option_name == 'toolpath_origin' and value is None):
+			options[option_name] = None
+		elif (option_name == 'toolpath_origin' and isinstance(value, list)):
+			if (len(value) != 2):
+				raise ValueError("toolpath_origin must be an [x, y] pair in option set " + json.dumps(option_set))
+			options[option_name] = ','.join(manifest_option_value(option_set, coordinate) for coordinate in value)
+		else:
+			options[option_name] = manifest_option_value(option_set, value)
+	return options
+
+def manifest_option_value(option_set, value):
+	if (isinstance(value, str)):
+		return value
+	if (isinstance(value, (int, float)) and not isinstance(value, bool)):
+		return str(value)
+	raise ValueError("bad value " + json.dumps(value) + " in option set " + json.dumps(option_set))
+
+# Work out the batch jobs for either a directory of KLE files or a manifest
+# A directory renders every file in it with the base options, to <file name>.dxf in the output directory.
+# A manifest is a json5 file listing layouts and option sets, with paths relative to the manifest:
+#   {layouts: ["full104.txt", "tkl.txt"], option_sets: [{name: "mx"}, {name: "alps", cutout_type: "alps", stab_type: "alps-aek"}]}
+# Every layout is rendered with every option set, to <file name>-<set name or index>.dxf.
+# Option sets use the same names as DEFAULT_OPTIONS and override the base options; see manifest_option_set.
+# Raises ValueError for a bad option set, or if two jobs would write the same output file, e.g. layouts with the same name from different directories.
+def collect_batch_jobs(batch_path, output_dir, base_options):
+
+	if (os.path.isdir(batch_path)):
+		layouts = [os.path.join(batch_path, name) for name in sorted(os.listdir(batch_path)) if os.path.isfile(os.path.join(batch_path, name))]
+		option_sets = [{}]
+	else:
+		with open(batch_path, 'r', encoding='utf-8') as manifest_file:
+			manifest = json5.loads(manifest_file.read())
+		manifest_dir = os.path.dirname(batch_path)
+		layouts = [os.path.join(manifest_dir, path) for path in manifest['layouts']]
+		option_sets = [manifest_option_set(option_set) for option_set in manifest.get('option_sets') or [{}]]
+	
+	jobs = []
+	for layout in layouts:
+		stem = os.path.splitext(os.path.basename(layout))[0]
+		for index, option_set in enumerate(option_sets):
+			
+			options = dict(base_options)
+			options.update(option_set)
+			set_name = options.pop('name', None)
+			
+			if (len(option_sets) == 1):
+				output_name = stem + '.dxf'
+			elif (set_name):
+				output_name = stem + '-' + str(set_name) + '.dxf'
+			else:
+				output_name = stem + '-' + str(index) + '.dxf'
+				
+			jobs.append((layout, os.path.join(output_dir, output_name), options))
+	
+	output_jobs = {}
+	for job in jobs:
+		output_key = os.path.normcase(os.path.abspath(job[1]))
+		if (output_key in output_jobs):
+			raise ValueError(job[1] + " would be written by both " + output_jobs[output_key][0] + " and " + job[0])
+		output_jobs[output_key] = job
+			
+	return jobs
+
+# Render a whole batch across a pool of worker processes (workers = None for one per CPU)
+# Returns the number of failed jobs. Failures are listed on stderr with their return codes.
+# Nothing is rendered for a bad batch: 1 for a bad manifest or clashing output files, 10 for fewer than 1 worker.
+def run_batch(batch_path, output_dir, workers, base_options):
+
+	if (workers is not None and workers < 1):
+		print("Number of jobs must be at least 1.", file=sys.stderr)
+		return 10
+
+	try:
+		jobs = collect_batch_jobs(batch_path, output_dir, base_options)
+	except(OSError, ValueError, KeyError, TypeError) as err:
+		print("Invalid batch: " + str(err), file=sys.stderr)
+		return 1
+	
+	os.makedirs(output_dir, exist_ok=True)
+	
+	if (workers == 1):
+		results = [render_batch_job(job) for job in jobs]
+	else:
+		with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+			results = list(executor.map(render_batch_job, jobs, chunksize=max(1, len(jobs) // (4 * (workers or os.cpu_count() or 1)))))
+	
+	failures = [(output_path, out_code) for output_path, out_code in results if out_code != 0]
+	for output_path, out_code in failures:
+		print(output_path + ": failed with return code " + str(out_code), file=sys.stderr)
+	print(str(len(results) - len(failures)) + " of " + str(len(results)) + " plates generated.", file=sys.stderr)
+	
+	return len(failures)
+	
+if __name__ == "__main__":
+
+	parser = argparse.ArgumentParser(description='Create a plate DXF based on KLE raw data.')
+	
+	# Note: The args will be fed into Decimal(), which takes strings
+	
+	parser.add_argument("-ct", "--cutout-type", help="Switch cutout type. Supported: mx, mx-slightly-wider, alps, alps-skcp, omron; Default: mx", type=str, default='mx')
+	parser.add_argument("-cr", "--cutout-radius", help="Switch cutout fillet radius. Default: 0.5", type=str, default='0.5')
+	parser.add_argument("-st", "--stab-type", help="Stabilizer type. Supported: mx-simple, large-cuts, alps-aek, alps-at101; Default: mx-simple", type=str, default='mx-simple')
+	parser.add_argument("-sr", "--stab-radius", help="Stabilizer cutout fillet radius. Default: 0.5", type=str, default='0.5')
+	parser.add_argument("-at", "--acoustics-type", help="Acoustic cutouts type. Supported: none, typical, extreme; Default: none", type=str, default='none')
+	parser.add_argument("-ar", "--acoustics-radius", help="Acoustic cutouts fillet radius. Default: 0.5", type=str, default='0.5')
+	parser.add_argument("-uw", "--unit-width", help="Key unit width. Default: 19.05", type=str, default='19.05')
+	parser.add_argument("-uh", "--unit-height", help="Key unit height. Default: 19.05", type=str, default='19.05')
+	#parser.add_argument("-om", "--output-method", help="The save method for data. Supported: stdout, file; Default: stdout", type=str, default='stdout')
+	#parser.add_argument("-of", "--output-file", help="Output file name if using file output-method. Default: plate.dxf", type=str, default='plate.dxf')	
+	parser.add_argument("-os", "--output-style", help="DXF output style. Supported: entities, polylines, blocks, blocks-exploded; Default: entities", type=str, default='entities')
+	parser.add_argument("--format", help="Output format. dxf = the plate, svg = a quick preview of the cutouts that skips building the DXF. Default: dxf", type=str, default='dxf')
+	parser.add_argument("--engine", help="Render engine. decimal = exact maths, numpy = fast float maths snapped to a 1e-9mm grid (needs numpy). Default: decimal", type=str, default='decimal')
+	parser.add_argument("--dxf-writer", help="DXF writer. ezdxf = full AC1024 document, native = fast minimal R12 writer that streams the plate out (entities and polylines output styles only). Default: ezdxf", type=str, default='ezdxf')
+	parser.add_argument("--output-precision", help="Round every number in the DXF to this many mm, a power of ten such as 1e-6 or 0.001; 0 writes full float precision. Default: " + DEFAULT_OUTPUT_PRECISION, type=str, default=DEFAULT_OUTPUT_PRECISION)
+	parser.add_argument("--toolpath-origin", help="Order cutouts to cut down on laser head travel, starting from this X,Y point in mm, e.g. 0,0 for the top left corner. Default: KLE order", type=str, default=None)
+	parser.add_argument("--sheet", help="Panel mode: nest the plates onto one sheet of this size in mm, given as WIDTHxHEIGHT, e.g. 600x400.", type=str, default=None)
+	parser.add_argument("--spacing", help="Panel mode: gap between plates and in from the sheet edges, in mm. Default: 5", type=str, default='5')
+	parser.add_argument("--copies", help="Panel mode: number of copies of each layout. Default: 1", type=int, default=1)
+	parser.add_argument("--layouts", help="Panel mode: KLE raw data files to nest. Default: one layout from stdin", type=str, nargs='+', default=None)
+	parser.add_argument("--check", help="Warn on stderr about cutouts that overlap or leave less than --min-web of plate between them.", action="store_true", default=False)
+	parser.add_argument("--min-web", help="Narrowest web of plate between cutouts --check accepts, in mm, from 0 to " + str(MAX_MIN_WEB) + ". Default: 1", type=str, default=str(DEFAULT_MIN_WEB))
+	parser.add_argument("--warnings-json", help="Write --check warnings to this file as JSON. Implies --check.", type=str, default=None)
+	parser.add_argument("--debug-log", help="Spam output with useless info.", action="store_true", default = False)
+	parser.add_argument("--batch", help="Batch mode: a directory of KLE raw data files, or a json5 manifest of layouts and option sets.", type=str, default=None)
+	parser.add_argument("--sweep", help="Sweep mode: render the layout from stdin with each of these values for an option, e.g. cutout_type=mx,alps. Repeat for more options; every combination is rendered.", type=str, action='append', default=None)
+	parser.add_argument("-o", "--output-dir", help="Output directory for batch and sweep mode; for a sweep, a path ending in .zip writes one zip archive instead. Default: current directory", type=str, default='.')
+	parser.add_argument("-j", "--jobs", help="Number of worker processes for batch mode. Default: one per CPU", type=int, default=None)
+	
+	args = parser.parse_args()
+	
+	if (args.format not in ('dxf', 'svg')):
+		print("Unsupported output format.\nSupported: dxf, svg", file=sys.stderr)
+		sys.exit(1)
+	try:
+		read_min_web(args.min_web)
+	except(ValueError):
+		print("--min-web must be a number of mm from 0 to " + str(MAX_MIN_WEB) + ".", file=sys.stderr)
+		sys.exit(1)
+	if (args.format == 'svg' and (args.batch or args.sheet or args.sweep)):
+		print("SVG previews are of a single plate; --batch, --sheet and --sweep only write DXF.", file=sys.stderr)
+		sys.exit(1)
+	
+	if (args.batch or args.sweep):
+		base_options = {
+			'cutout_type': args.cutout_type,
+			'cutout_radius': args.cutout_radius,
+			'stab_type': args.stab_type,
+			'stab_radius': args.stab_radius,
+			'acoustics_type': args.acoustics_type,
+			'acoustics_radius': args.acoustics_radius,
+			'unit_width': args.unit_width,
+			'unit_height': args.unit_height,
+			'output_style': args.output_style,
+			'engine': args.engine,
+			'toolpath_origin': args.toolpath_origin,
+			'dxf_writer': args.dxf_writer,
+			'output_precision': args.output_precision,
+		}
+		if (args.batch):
+			failed_jobs = run_batch(args.batch, args.output_dir, args.jobs, base_options)
+			sys.exit(1 if failed_jobs else 0)
+		
+		sweeps = []
+		for sweep in args.sweep:
+			option_name, separator, values = sweep.partition('=')
+			option_name = option_name.strip().replace('-', '_')
+			if (not separator or option_name not in DEFAULT_OPTIONS or not values):
+				print("Invalid sweep: " + sweep + "\nGive an option and its values, e.g. cutout_type=mx,alps. Options: " + ", ".join(DEFAULT_OPTIONS), file=sys.stderr)
+				sys.exit(1)
+			sweeps.append((option_name, [value.strip() for value in values.split(',')]))
+		failed_plates = run_sweep(sys.stdin.read(), sweeps, args.output_dir, base_options)
+		sys.exit(1 if failed_plates else 0)
+	
+	gen = PlateGenerator(args.cutout_type, args.cutout_radius, args.stab_type, args.stab_radius, args.acoustics_type, args.acoustics_radius, 
+	args.unit_width, args.unit_height, args.debug_log, args.output_style, args.engine, args.toolpath_origin, args.dxf_writer, args.output_precision)
+	
+	if (args.sheet):
+		if (args.layouts):
+			layouts = []
+			for layout_path in args.layouts:
+				with open(layout_path, 'r', encoding='utf-8') as layout_file:
+					layouts.append(layout_file.read())
+		else:
+			layouts = [sys.stdin.read()]
+		
+		sheet_size = args.sheet.lower().split('x')
+		if (len(sheet_size) != 2):
+			sheet_size = ('', '')
+		
+		out_code = gen.generate_panel("stdout", layouts * args.copies, sheet_size[0], sheet_size[1], args.spacing)
+		if (out_code == 1):
+			print("Invalid KLE data: " + str(gen.parse_error), file=sys.stderr)
+		elif (out_code == 13):
+			print("The plates don't all fit on the sheet.", file=sys.stderr)
+		elif (out_code == 14):
+			print("Invalid sheet size or spacing.", file=sys.stderr)
+		sys.exit(0 if out_code == 0 else 1)
 	
 	input_data = sys.stdin.read()
-	gen.generate_plate("stdout", input_data)
+	if (args.format == 'svg'):
+		out_code = gen.generate_preview("stdout", input_data)
+	else:
+		out_code = gen.generate_plate("stdout", input_data)
+	if (out_code == 1):
+		print("Invalid KLE data: " + str(gen.parse_error), file=sys.stderr)
+	elif (out_code == 0 and gen.toolpath_travel is not None):
+		print("Toolpath travel: %.1fmm in KLE order, %.1fmm ordered" % gen.toolpath_travel, file=sys.stderr)
+	
+	if (out_code == 0 and (args.check or args.warnings_json)):
+		warnings = gen.validate_cutouts(args.min_web)
+		for warning in warnings:
+			print("Warning: " + describe_warning(warning), file=sys.stderr)
+		if (args.warnings_json):
+			with open(args.warnings_json, 'w', encoding='utf-8') as warnings_file:
+				json.dump(warnings, warnings_file, indent=1)
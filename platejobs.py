@@ -0,0 +1,223 @@
+#=================================#
+#         Plate Job Queue         #
+#=================================#
+
+# Background rendering for the web service.
+# Instead of holding a request open while a big layout renders, the plate is submitted as a job
+# to a bounded pool of worker processes; the client gets a job id back straight away,
+# polls the job's status and downloads the DXF once it's done.
+
+# - At most max_workers plates render at once, each in its own process
+# - At most max_queue_depth jobs may be waiting or rendering; past that, submissions are turned away
+# - Finished jobs are kept for result_ttl seconds after they finish, then forgotten
+
+#=================================#
+#                                 #
+#=================================#
+
+import concurrent.futures
+import io
+import threading
+import time
+import uuid
+
+import plategen
+
+# Generators kept alive inside each worker process, so a worker only sets up each option set once
+worker_generators = {}
+
+# Render one plate inside a worker process
+# options are the 8 PlateGenerator arguments as given by the form, in constructor order.
+# Returns (return code, DXF bytes or None, error detail or None, plate_stats or None).
+def render_plate_job(kle_data, options):
+
+	gen = worker_generators.get(options)
+	if (gen is None):
+		try:
+			gen = plategen.PlateGenerator(*options, False)
+		except(ValueError):
+			return (10, None, None, None)
+		worker_generators[options] = gen
+
+	output_data = io.BytesIO()
+	out_code = gen.generate_plate(output_data, kle_data)
+	if (out_code != 0):
+		return (out_code, None, str(gen.parse_error) if gen.parse_error else None, None)
+	return (0, output_data.getvalue(), None, plate_stats(gen))
+
+# Metric labels for a plate's switch cutout and stabilizer types
+# Anything plategen doesn't know is labelled unknown, so whatever is typed into the form can't add label values.
+# (Unknown stab types still make a plate, just without stabs.)
+def plate_labels(cutout_type, stab_type):
+	return (cutout_type if cutout_type in plategen.CUTOUT_TYPES else 'unknown', stab_type if stab_type in plategen.STAB_TYPES else 'unknown')
+
+# What went into rendering a plate, for metrics: the options it was labelled by, stage times, key count and entity count
+def plate_stats(gen):
+	cutout_type, stab_type = plate_labels(gen.cutout_type, gen.stab_type)
+	return {
+		'cutout_type': cutout_type,
+		'stab_type': stab_type,
+		'stage_times': dict(gen.stage_times),
+		'keys': gen.key_count,
+		'entities': len(gen.modelspace),
+	}
+
+class PlateJob(object):
+
+	def __init__(self, job_id, cache_key):
+
+		self.job_id = job_id
+
+		# Cache key of the plate being made, so the finished DXF can be cached too
+		self.cache_key = cache_key
+
+		# queued, running, done or failed
+		self.status = 'queued'
+
+		# plategen return code, DXF bytes and any error detail, once finished
+		self.code = None
+		self.data = None
+		self.error = None
+
+		# plate_stats of the render, for jobs rendered by a worker
+		self.stats = None
+
+		self.submitted_at = time.time()
+		self.finished_at = None
+
+		# Worker pool future, for jobs that had to be rendered
+		self.future = None
+
+	def finish(self, code, data, error=None, stats=None):
+		self.code = code
+		self.data = data
+		self.error = error
+		self.stats = stats
+		self.status = 'done' if code == 0 else 'failed'
+		self.finished_at = time.time()
+
+	# Queued jobs report as running once the pool has handed them to a worker
+	def current_status(self):
+		if (self.status == 'queued' and self.future is not None and self.future.running()):
+			return 'running'
+		return self.status
+
+class PlateJobQueue(object):
+
+	def __init__(self, max_workers, max_queue_depth, result_ttl, on_done=None):
+
+		self.max_workers = max_workers
+		self.max_queue_depth = max_queue_depth
+
+		# Seconds a finished job is kept around for status checks and downloads
+		self.result_ttl = result_ttl
+
+		# Called as on_done(job) once a job renders successfully, e.g. to fill the plate cache
+		self.on_done = on_done
+
+		# job id -> PlateJob
+		self.jobs = {}
+
+		# Jobs waiting for or using a worker
+		self.pending_count = 0
+
+		# Started on the first submission, so importing the web app doesn't spawn processes
+		self.executor = None
+
+		self.lock = threading.Lock()
+
+	# Submit a plate for rendering. Returns the new PlateJob, or None if the queue is full.
+	# If the pool can't take the job, e.g. after a worker process died, it's replaced with a fresh one and the job tried once more;
+	# if that fails too the job is returned already failed, rather than left queued for ever.
+	def submit(self, kle_data, options, cache_key=None):
+
+		with self.lock:
+			self.expire_jobs()
+
+			if (self.pending_count >= self.max_queue_depth):
+				return None
+
+			job = PlateJob(uuid.uuid4().hex, cache_key)
+			self.jobs[job.job_id] = job
+			self.pending_count += 1
+
+		for attempt in range(2):
+			executor = self.get_executor()
+			try:
+				job.future = executor.submit(render_plate_job, kle_data, tuple(options))
+			except(concurrent.futures.BrokenExecutor, RuntimeError) as error:
+				self.drop_executor(executor)
+				submit_error = error
+				continue
+			job.future.add_done_callback(lambda future: self.job_finished(job, future))
+			return job
+
+		job.finish(-1, None, "Couldn't start rendering: " + (str(submit_error) or type(submit_error).__name__))
+		with self.lock:
+			self.pending_count -= 1
+		return job
+
+	# The worker pool, started on first use
+	def get_executor(self):
+		with self.lock:
+			if (self.executor is None):
+				self.executor = concurrent.futures.ProcessPoolExecutor(max_workers=self.max_workers)
+			return self.executor
+
+	# Stop using a pool that's broken or shut down, so the next submission starts a fresh one
+	def drop_executor(self, executor):
+		with self.lock:
+			if (self.executor is executor):
+				self.executor = None
+		try:
+			executor.shutdown(wait=False)
+		except(Exception):
+			pass
+
+	# Add an already rendered plate as a finished job, e.g. one served from the plate cache
+	def add_finished(self, data, cache_key=None):
+
+		job = PlateJob(uuid.uuid4().hex, cache_key)
+		job.finish(0, data)
+
+		with self.lock:
+			self.expire_jobs()
+			self.jobs[job.job_id] = job
+
+		return job
+
+	def job_finished(self, job, future):
+
+		try:
+			code, data, error, stats = future.result()
+		except(Exception):
+			# A worker process died or the pool was shut down
+			# A dead worker breaks the whole pool; the next submission finds that out and starts a new one.
+			code, data, error, stats = (-1, None, None, None)
+
+		job.finish(code, data, error, stats)
+
+		with self.lock:
+			self.pending_count -= 1
+
+		if (code == 0 and self.on_done is not None):
+			self.on_done(job)
+
+	# Look up a job by id. Returns None for unknown or expired jobs.
+	def get(self, job_id):
+
+		with self.lock:
+			self.expire_jobs()
+			return self.jobs.get(job_id)
+
+	# Forget finished jobs older than the TTL. Call with the lock held.
+	def expire_jobs(self):
+
+		cutoff = time.time() - self.result_ttl
+		expired = [job_id for job_id, job in self.jobs.items() if job.finished_at is not None and job.finished_at < cutoff]
+		for job_id in expired:
+			del self.jobs[job_id]
+
+	def shutdown(self):
+		if (self.executor is not None):
+			self.executor.shutdown(wait=True)
@@ -0,0 +1,116 @@
+#=================================#
+#          Plate Metrics          #
+#=================================#
+
+# Counters and histograms for the web service, served in the Prometheus text format.
+# Kept dependency free and cheap: recording a value is a dict lookup, a bisect and a few additions under a lock.
+
+# Each metric has a fixed set of label names; label values are given as a tuple in the same order.
+# Keep label values to small, known sets (option names, route names), never raw user input.
+
+#=================================#
+#                                 #
+#=================================#
+
+import bisect
+import threading
+
+# Bucket upper bounds for durations in seconds, sizes in keys or entities, and output sizes in bytes
+TIME_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+COUNT_BUCKETS = (10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 25000, 50000)
+BYTE_BUCKETS = (16 * 1024, 64 * 1024, 256 * 1024, 1024 * 1024, 4 * 1024 * 1024, 16 * 1024 * 1024, 64 * 1024 * 1024)
+
+# Label value as it goes in the exposition text
+def escape_label_value(value):
+	return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def format_labels(label_names, label_values, extra=()):
+	pairs = list(zip(label_names, label_values)) + list(extra)
+	if (not pairs):
+		return ''
+	return '{' + ','.join(name + '="' + escape_label_value(value) + '"' for name, value in pairs) + '}'
+
+def format_value(value):
+	if (value == float('inf')):
+		return '+Inf'
+	if (isinstance(value, float) and value.is_integer() and abs(value) < 1e15):
+		return str(int(value))
+	return repr(value)
+
+class Counter(object):
+
+	def __init__(self, name, description, label_names, lock):
+		self.name = name
+		self.description = description
+		self.label_names = tuple(label_names)
+		self.lock = lock
+
+		# label values -> count
+		self.values = {}
+
+	def inc(self, label_values=(), amount=1):
+		with self.lock:
+			self.values[label_values] = self.values.get(label_values, 0) + amount
+
+	def render(self):
+		lines = ['# HELP ' + self.name + ' ' + self.description, '# TYPE ' + self.name + ' counter']
+		for label_values, value in sorted(self.values.items()):
+			lines.append(self.name + format_labels(self.label_names, label_values) + ' ' + format_value(value))
+		return lines
+
+class Histogram(object):
+
+	def __init__(self, name, description, label_names, buckets, lock):
+		self.name = name
+		self.description = description
+		self.label_names = tuple(label_names)
+		self.buckets = tuple(sorted(buckets))
+		self.lock = lock
+
+		# label values -> [counts per bucket, with one more for +Inf], sum
+		self.values = {}
+
+	def observe(self, label_values, value):
+		index = bisect.bisect_left(self.buckets, value)
+		with self.lock:
+			entry = self.values.get(label_values)
+			if (entry is None):
+				entry = [[0] * (len(self.buckets) + 1), 0]
+				self.values[label_values] = entry
+			entry[0][index] += 1
+			entry[1] += value
+
+	def render(self):
+		lines = ['# HELP ' + self.name + ' ' + self.description, '# TYPE ' + self.name + ' histogram']
+		for label_values, (counts, total) in sorted(self.values.items()):
+			cumulative = 0
+			for bound, count in zip(self.buckets + (float('inf'),), counts):
+				cumulative += count
+				lines.append(self.name + '_bucket' + format_labels(self.label_names, label_values, [('le', format_value(float(bound)))]) + ' ' + str(cumulative))
+			lines.append(self.name + '_sum' + format_labels(self.label_names, label_values) + ' ' + format_value(total))
+			lines.append(self.name + '_count' + format_labels(self.label_names, label_values) + ' ' + str(cumulative))
+		return lines
+
+class MetricsRegistry(object):
+
+	def __init__(self):
+		self.metrics = []
+		self.lock = threading.Lock()
+
+	def counter(self, name, description, label_names=()):
+		metric = Counter(name, description, label_names, self.lock)
+		self.metrics.append(metric)
+		return metric
+
+	def histogram(self, name, description, label_names=(), buckets=TIME_BUCKETS):
+		metric = Histogram(name, description, label_names, buckets, self.lock)
+		self.metrics.append(metric)
+		return metric
+
+	# Every metric in the text exposition format
+	def render(self):
+		with self.lock:
+			lines = []
+			for metric in self.metrics:
+				lines += metric.render()
+		return '\n'.join(lines) + '\n'
@@ -0,0 +1,249 @@
+#=================================#
+#      Incremental Re-render      #
+#=================================#
+
+# Editing sessions for iterating on one layout.
+# A session keeps the plate from the last edit: the parsed keys, and the DXF entities and cutouts each key drew.
+# Each new edit is parsed in full (parsing is cheap), then diffed against the previous keys:
+# - keys identical to a previous key keep their entities as they are
+# - keys that are gone have their entities deleted
+# - new or changed keys are rendered on their own and their entities added
+# Each key's rotated corners are kept with it, and the plate bounds are only redrawn when the plate's extent actually changes.
+# When more than half the keys change, e.g. after moving the first row, the plate is simply rendered again from scratch.
+
+# Keys are matched by value, not position, so inserting a key or a row doesn't re-render everything after it.
+# Entities of kept keys stay where they were in the modelspace and new ones go at the end, so the DXF
+# holds the same geometry as a fresh render, though not necessarily in the same order.
+# Toolpath ordering works on the whole plate at once, so sessions don't do it.
+
+#=================================#
+#                                 #
+#=================================#
+
+import threading
+import time
+import uuid
+from decimal import Decimal, localcontext
+
+import plategen
+
+class PlateSession(object):
+
+	# options are the 8 PlateGenerator arguments as given by the form, in constructor order.
+	# Raises ValueError for options PlateGenerator won't take.
+	def __init__(self, options, output_style='entities', engine='decimal'):
+
+		self.options = tuple(options)
+		self.generator = plategen.PlateGenerator(*self.options, False, output_style, engine)
+
+		# Keys of the current plate, and (entities, cutouts, extent) drawn for each of them
+		# extent is how far right and down the key's rotated corners reach in mm, as render_switch widens the plate for them.
+		self.keys = []
+		self.rendered = []
+
+		# Outer bound lines, and the plate size in mm they were drawn for
+		self.bounds = []
+		self.plate_size = None
+
+		# What the last successful update did: how many keys were kept, rendered and removed
+		self.last_changes = None
+
+		# Seconds spent parsing and rendering in the last update
+		self.stage_times = {}
+
+		self.started = False
+
+		# Updates and writes from different threads take turns
+		self.lock = threading.Lock()
+
+	# Bring the plate up to date with new KLE data
+	# Returns the same codes as PlateGenerator.generate_plate. Data that won't parse leaves the previous plate as it was;
+	# a key that fails part way through rendering (say a width of Infinity) leaves the session to start over on the next update.
+	def update(self, input_data):
+		with self.lock:
+			with localcontext(self.generator.decimal_context):
+				return self.update_in_context(input_data)
+
+	def update_in_context(self, input_data):
+
+		gen = self.generator
+		if (gen.init_code is None):
+			gen.init_code = gen.initialize_variables()
+		if (gen.init_code != 0):
+			return gen.init_code
+
+		stage_start = time.perf_counter()
+		gen.parse_error = None
+		try:
+			layout = plategen.parse_layout(input_data, gen.debug_log)
+		except(ValueError, ArithmeticError) as error:
+			gen.parse_error = error
+			return 1
+		self.stage_times['parse'] = time.perf_counter() - stage_start
+
+		stage_start = time.perf_counter()
+		try:
+			self.render_update(layout)
+		except(ValueError, ArithmeticError) as error:
+			# The modelspace is now somewhere between the two plates
+			self.restart()
+			gen.parse_error = error
+			return 1
+		self.stage_times['render'] = time.perf_counter() - stage_start
+		return 0
+
+	# Forget the current plate, so the next update renders from scratch
+	def restart(self):
+		self.keys = []
+		self.rendered = []
+		self.bounds = []
+		self.plate_size = None
+		self.started = False
+
+	# Diff a parsed layout against the current plate and render what changed, as described at the top
+	def render_update(self, layout):
+
+		gen = self.generator
+
+		# Pair each new key off with an identical previous one
+		previous = {}
+		for key, rendered in zip(self.keys, self.rendered):
+			previous.setdefault(key, []).append(rendered)
+
+		rendered = [None] * len(layout.keys)
+		changed = []
+		for index, key in enumerate(layout.keys):
+			matches = previous.get(key)
+			if (matches):
+				rendered[index] = matches.pop()
+			else:
+				changed.append(index)
+
+		if (not self.started or len(changed) * 2 > len(layout.keys)):
+			# With most of the plate changing, starting over beats picking it apart entity by entity
+			gen.reset_plate()
+			gen.start_document()
+			self.bounds = []
+			self.plate_size = None
+			removed_count = len(self.keys)
+			rendered = [None] * len(layout.keys)
+			changed = list(range(len(layout.keys)))
+			self.started = True
+		else:
+			# Whatever wasn't paired off is no longer in the layout
+			removed_count = 0
+			for matches in previous.values():
+				for entities, cutouts, extent in matches:
+					for entity in entities:
+						gen.modelspace.delete_entity(entity)
+					removed_count += 1
+
+		gen.key_count = len(layout.keys)
+
+		# Render the new keys one after another, noting where each one's entities end,
+		# then pick them all up in one pass over the new end of the modelspace
+		# Each key starts from an empty extent, so render_switch leaves just that key's rotated corners in max_width and max_height.
+		first_entity = len(gen.modelspace)
+		entity_ends = []
+		for index in changed:
+			gen.max_width = Decimal('-Infinity')
+			gen.max_height = Decimal('Infinity')
+			cutouts = gen.render_key(layout.keys[index], index)
+			entity_ends.append((index, len(gen.modelspace), cutouts, (gen.max_width, gen.max_height)))
+
+		if (changed):
+			entities = list(gen.modelspace)[first_entity:]
+			start = 0
+			for index, end, cutouts, extent in entity_ends:
+				rendered[index] = (entities[start:end - first_entity], cutouts, extent)
+				start = end - first_entity
+
+		# The plate is the layout's size in units, widened for any rotated key poking out of it, as in a fresh render
+		gen.max_width = max([layout.width * gen.unit_width] + [extent[0] for entities, cutouts, extent in rendered])
+		gen.max_height = min([layout.height * gen.unit_height] + [extent[1] for entities, cutouts, extent in rendered])
+
+		if (self.plate_size != (gen.max_width, gen.max_height)):
+			for entity in self.bounds:
+				gen.modelspace.delete_entity(entity)
+			self.bounds = gen.draw_plate_bounds()
+			self.plate_size = (gen.max_width, gen.max_height)
+
+		# Cutouts in key order, with their key indices brought up to date, for validation and previews
+		gen.placed_cutouts = [(index,) + cutout[1:] for index, (entities, cutouts, extent) in enumerate(rendered) for cutout in cutouts]
+
+		self.keys = layout.keys
+		self.rendered = rendered
+		self.last_changes = {'kept': len(layout.keys) - len(changed), 'rendered': len(changed), 'removed': removed_count}
+
+	# Write the current plate as DXF, to the same kinds of file as PlateGenerator.write_plate
+	def write_plate(self, file):
+		with self.lock:
+			self.generator.write_plate(file)
+
+	# Write the current plate as an SVG preview
+	def write_preview(self, file):
+		with self.lock:
+			with localcontext(self.generator.decimal_context):
+				self.generator.write_preview(file)
+
+	# Overlap and thin web warnings for the current plate, as PlateGenerator.validate_cutouts
+	def validate_cutouts(self, min_web=plategen.DEFAULT_MIN_WEB):
+		with self.lock:
+			with localcontext(self.generator.decimal_context):
+				return self.generator.validate_cutouts(min_web)
+
+# Sessions for the web service, by id
+# - At most max_sessions are kept; past that, the least recently used one is dropped
+# - Sessions unused for ttl seconds are forgotten
+class PlateSessionStore(object):
+
+	def __init__(self, max_sessions, ttl):
+
+		self.max_sessions = max_sessions
+		self.ttl = ttl
+
+		# session id -> (PlateSession, last used time)
+		self.sessions = {}
+
+		self.lock = threading.Lock()
+
+	# Find a session to render with these options
+	# An unknown or expired id, or a session made with different options, gets a fresh session.
+	# Returns (session id, PlateSession). Raises ValueError for options PlateGenerator won't take.
+	def get(self, session_id, options):
+
+		options = tuple(options)
+		with self.lock:
+			self.expire_sessions()
+
+			entry = self.sessions.get(session_id) if session_id else None
+			if (entry is not None and entry[0].options == options):
+				session = entry[0]
+			else:
+				session = PlateSession(options)
+				if (entry is None):
+					session_id = uuid.uuid4().hex
+
+			self.sessions[session_id] = (session, time.time())
+
+			if (len(self.sessions) > self.max_sessions):
+				oldest = min(self.sessions, key=lambda key: self.sessions[key][1])
+				del self.sessions[oldest]
+
+			return (session_id, session)
+
+	# Look up a session by id without touching it. Returns None for unknown or expired sessions.
+	def find(self, session_id):
+
+		with self.lock:
+			self.expire_sessions()
+			entry = self.sessions.get(session_id)
+			return entry[0] if entry is not None else None
+
+	# Forget sessions unused for longer than the TTL. Call with the lock held.
+	def expire_sessions(self):
+
+		cutoff = time.time() - self.ttl
+		expired = [session_id for session_id, (session, last_used) in self.sessions.items() if last_used < cutoff]
+		for session_id in expired:
+			del self.sessions[session_id]
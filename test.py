@@ -1,9 +1,1004 @@
 #!/usr/bin/env python3
 
+import concurrent.futures
+import decimal
+import io
+import json
+import math
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import ezdxf
+import json5
+import mpmath
+
+import cutoutcheck
+import kleparse
 import plategen
+import platecache
+import platejobs
+import platemetrics
+import platesession
+
+# Skip the rest of a test: shows up as a skip under pytest, and is just noted when this file is run directly
+def skip_test(reason):
+	if ('pytest' in sys.modules):
+		sys.modules['pytest'].skip(reason)
+	print("Skipped: " + reason)
+
+# Smoke test: a full size board renders without complaint
+def test_full104():
+	filename = 'test-data/test-full104'
+	gen = plategen.PlateGenerator('mx', '0.5', 'mx-simple', '0.5', 'none', '0.5', '19.05', '19.05', False)
+	with open(filename, 'r') as input_file:
+		input_data = input_file.read()
+		assert gen.generate_plate(io.StringIO(), input_data) == 0
+
+# Geometry of every LINE and ARC in a generator's modelspace, as plain floats
+def modelspace_geometry(gen):
+	return entity_geometry(gen.modelspace)
+
+def entity_geometry(entities):
+	geometry = []
+	for entity in entities:
+		if (entity.dxftype() == 'LINE'):
+			geometry.append(('LINE', tuple(entity.dxf.start)[:2] + tuple(entity.dxf.end)[:2]))
+		elif (entity.dxftype() == 'ARC'):
+			geometry.append(('ARC', tuple(entity.dxf.center)[:2] + (entity.dxf.radius, entity.dxf.start_angle % 360, entity.dxf.end_angle % 360)))
+	return geometry
+
+# The numpy engine must draw the same plate as the exact decimal engine, to within float tolerance
+def test_numpy_engine_matches_decimal():
+	if (plategen.numpy is None):
+		skip_test("numpy not installed")
+		return
+
+	option_sets = [
+		('mx', '0.5', 'mx-simple', '0.5', 'extreme', '0.5', '19.05', '19.05'),
+		('alps', '0.3', 'alps-aek', '0.25', 'typical', '0.5', '19.05', '19.05'),
+		('kailh-choc-CPG1350', '0', 'large-cuts', '1', 'none', '0.5', '18', '17'),
+	]
+
+	for filename in sorted(os.listdir('test-data')):
+		with open(os.path.join('test-data', filename), 'r') as input_file:
+			input_data = input_file.read()
+
+		for options in option_sets:
+			decimal_gen = plategen.PlateGenerator(*options, False, 'entities', 'decimal', None, 'ezdxf', '0')
+			numpy_gen = plategen.PlateGenerator(*options, False, 'entities', 'numpy', None, 'ezdxf', '0')
+			assert decimal_gen.generate_plate(io.StringIO(), input_data) == 0
+			assert numpy_gen.generate_plate(io.StringIO(), input_data) == 0
+
+			decimal_geometry = modelspace_geometry(decimal_gen)
+			numpy_geometry = modelspace_geometry(numpy_gen)
+			assert len(decimal_geometry) == len(numpy_geometry), filename
+
+			for (decimal_type, decimal_values), (numpy_type, numpy_values) in zip(decimal_geometry, numpy_geometry):
+				assert decimal_type == numpy_type, filename
+				for decimal_value, numpy_value in zip(decimal_values, numpy_values):
+					assert abs(decimal_value - numpy_value) < 1e-6, (filename, options, decimal_values, numpy_values)
+
+# Keys are grouped by rotated zone, and a zone's shared transform puts points where rotating them one by one would
+def test_rotation_clusters():
+	gen = plategen.PlateGenerator('mx', '0.5', 'mx-simple', '0.5', 'none', '0.5', '19.05', '19.05', False)
+	assert gen.initialize_variables() == 0
+
+	for filename in ['test-data/rotated-blocks', 'test-data/test-ergo']:
+		with open(filename, 'r') as input_file:
+			layout = plategen.parse_layout(input_file.read())
+
+		clusters = layout.rotation_clusters()
+		assert sorted(index for indices in clusters.values() for index in indices) == list(range(len(layout.keys)))
+
+		with decimal.localcontext(gen.decimal_context):
+			for (rx, ry, angle), indices in clusters.items():
+				transform = gen.cluster_transform(rx, ry, angle)
+				for index in indices:
+					key = layout.keys[index]
+					x = key.x * gen.unit_width
+					y = key.y * gen.unit_height
+					expected = gen.rotate_point_around_anchor(x, y, rx * gen.unit_width, -(ry * gen.unit_height), angle)
+					actual = gen.apply_transform(transform, x, y)
+					assert abs(expected[0] - actual[0]) < decimal.Decimal('1e-40') and abs(expected[1] - actual[1]) < decimal.Decimal('1e-40'), (filename, key)
+
+				# Unrotated points only move, so they stay exact
+				if (angle == 0):
+					assert gen.apply_transform(transform, decimal.Decimal('14'), decimal.Decimal('-7')) == (decimal.Decimal('14'), decimal.Decimal('-7'))
+
+	# rotated-blocks has a whole block of keys sharing one rotated zone
+	with open('test-data/rotated-blocks', 'r') as input_file:
+		clusters = plategen.parse_layout(input_file.read()).rotation_clusters()
+	assert max(len(indices) for cluster, indices in clusters.items() if cluster[2] != 0) == 19
+
+# The native writer's R12 DXF must read back with the same geometry the ezdxf writer's AC1024 DXF has
+def test_native_writer_matches_ezdxf():
+	options = ('mx', '0.5', 'mx-simple', '0.5', 'extreme', '0.5', '19.05', '19.05')
+
+	for filename in ['test-data/test-full104', 'test-data/rotated-blocks']:
+		with open(filename, 'r') as input_file:
+			input_data = input_file.read()
+
+		for output_style in ['entities', 'polylines']:
+			documents = []
+			for writer in ['ezdxf', 'native']:
+				gen = plategen.PlateGenerator(*options, False, output_style, 'decimal', None, writer)
+				output_data = io.StringIO()
+				assert gen.generate_plate(output_data, input_data) == 0
+				documents.append(ezdxf.read(io.StringIO(output_data.getvalue())))
+
+			ezdxf_document, native_document = documents
+			assert native_document.dxfversion == 'AC1009'
+
+			# R12 has no LWPOLYLINE, so polylines come back as closed POLYLINEs with the same vertices and bulges
+			ezdxf_polylines = [[(point[0], point[1], point[4]) for point in entity.get_points()] for entity in ezdxf_document.modelspace() if entity.dxftype() == 'LWPOLYLINE']
+			native_polylines = [[(vertex.dxf.location[0], vertex.dxf.location[1], vertex.dxf.bulge) for vertex in entity.vertices()] for entity in native_document.modelspace() if entity.dxftype() == 'POLYLINE']
+			assert all(entity.is_closed for entity in native_document.modelspace() if entity.dxftype() == 'POLYLINE')
+			assert ezdxf_polylines == native_polylines, (filename, output_style)
+
+			ezdxf_geometry = entity_geometry(ezdxf_document.modelspace())
+			native_geometry = entity_geometry(native_document.modelspace())
+			assert ezdxf_geometry == native_geometry, (filename, output_style)
+
+# Numbers the plate put in a DXF, by group code: those in the ENTITIES section and the cutout blocks
+# (ezdxf's template has blocks of its own, such as dimension arrows, which aren't the generator's to round)
+def dxf_numbers(dxf_text):
+	lines = dxf_text.splitlines()
+	numbers = []
+	section = None
+	block = None
+	for i in range(0, len(lines) - 1, 2):
+		code = int(lines[i])
+		value = lines[i + 1].strip()
+		if (code == 2 and lines[i - 1].strip() == 'SECTION'):
+			section = value
+		elif (code == 0 and value == 'BLOCK'):
+			block = None
+		elif (code == 2 and section == 'BLOCKS' and block is None):
+			block = value
+		elif ((section == 'ENTITIES' or block in plategen.CUTOUT_KINDS) and 10 <= code <= 59):
+			numbers.append((code, value))
+	return numbers
+
+# Every number in every plate from test-data is rounded to the default 1e-6mm and written short:
+# no 13.99999 or 14.00001, no float noise, no trailing zeros past what ezdxf insists on
+def test_output_precision():
+	options = ('mx', '0.5', 'mx-simple', '0.5', 'extreme', '0.5', '19.05', '19.05')
+	noisy_digits = re.compile(r'\.\d*(9999|0000)')
+
+	for filename in sorted(os.listdir('test-data')):
+		with open(os.path.join('test-data', filename), 'r') as input_file:
+			input_data = input_file.read()
+
+		for output_style, writer in [('entities', 'ezdxf'), ('polylines', 'ezdxf'), ('blocks', 'ezdxf'), ('entities', 'native'), ('polylines', 'native')]:
+			gen = plategen.PlateGenerator(*options, False, output_style, 'decimal', None, writer)
+			output_data = io.StringIO()
+			assert gen.generate_plate(output_data, input_data) == 0
+
+			numbers = dxf_numbers(output_data.getvalue())
+			assert numbers, (filename, output_style, writer)
+			for code, value in numbers:
+				float(value)
+				decimals = value.split('.')[1] if '.' in value else ''
+				if (writer == 'native'):
+					assert not decimals.endswith('0'), (filename, output_style, writer, code, value)
+				assert len(decimals) <= 6, (filename, output_style, writer, code, value)
+				assert not noisy_digits.search(value), (filename, output_style, writer, code, value)
+
+		# Rounding happens once, so each number is within half a unit of the full precision one
+		full_gen = plategen.PlateGenerator(*options, False, 'entities', 'decimal', None, 'ezdxf', '0')
+		rounded_gen = plategen.PlateGenerator(*options, False, 'entities', 'decimal')
+		assert full_gen.generate_plate(io.StringIO(), input_data) == 0
+		assert rounded_gen.generate_plate(io.StringIO(), input_data) == 0
+		for (full_type, full_values), (rounded_type, rounded_values) in zip(modelspace_geometry(full_gen), modelspace_geometry(rounded_gen)):
+			assert full_type == rounded_type
+			for full_value, rounded_value in zip(full_values, rounded_values):
+				assert abs(full_value - rounded_value) <= 5.000001e-7 or abs(abs(full_value - rounded_value) - 360) <= 5.000001e-7, (filename, full_values, rounded_values)
+
+# A point as floats rounded to 1e-6mm, for comparing geometry between output styles
+def rounded_point(x, y):
+	return (round(float(x), 6), round(float(y), 6))
+
+# The polylines output style draws each cutout as one closed polyline through the same points as the entities style's lines
+def test_polylines_match_entities():
+	options = ('mx', '0.5', 'mx-simple', '0.5', 'extreme', '0.5', '19.05', '19.05')
+
+	for filename in sorted(os.listdir('test-data')):
+		with open(os.path.join('test-data', filename), 'r') as input_file:
+			input_data = input_file.read()
+
+		entities_gen = plategen.PlateGenerator(*options, False, 'entities')
+		polylines_gen = plategen.PlateGenerator(*options, False, 'polylines')
+		assert entities_gen.generate_plate(io.StringIO(), input_data) == 0
+		assert polylines_gen.generate_plate(io.StringIO(), input_data) == 0
+
+		entity_points = set()
+		line_count = 0
+		for entity in entities_gen.modelspace:
+			if (entity.dxftype() == 'LINE'):
+				line_count += 1
+				entity_points.add(rounded_point(*entity.dxf.start[:2]))
+				entity_points.add(rounded_point(*entity.dxf.end[:2]))
+
+		polyline_points = set()
+		polyline_count = 0
+		for entity in polylines_gen.modelspace:
+			if (entity.dxftype() == 'LWPOLYLINE'):
+				polyline_count += 1
+				assert entity.closed, filename
+				for point in entity.get_points():
+					polyline_points.add(rounded_point(point[0], point[1]))
+			elif (entity.dxftype() == 'LINE'):
+				polyline_points.add(rounded_point(*entity.dxf.start[:2]))
+				polyline_points.add(rounded_point(*entity.dxf.end[:2]))
+
+		# 4 lines per cutout, plus the 4 plate edges
+		assert polyline_count == (line_count - 4) // 4, filename
+		assert polyline_points == entity_points, filename
+
+# Geometry of a DXF's modelspace with every INSERT replaced by its block's LINEs and ARCs, moved and rotated into place
+def exploded_geometry(document):
+	geometry = []
+	for entity in document.modelspace():
+		if (entity.dxftype() != 'INSERT'):
+			geometry.extend(entity_geometry([entity]))
+			continue
+		insert_x, insert_y = tuple(entity.dxf.insert)[:2]
+		rotation = entity.dxf.rotation
+		cos_angle = math.cos(math.radians(rotation))
+		sin_angle = math.sin(math.radians(rotation))
+		def place(x, y):
+			return (insert_x + x * cos_angle - y * sin_angle, insert_y + x * sin_angle + y * cos_angle)
+		for kind, values in entity_geometry(document.blocks.get(entity.dxf.name)):
+			if (kind == 'LINE'):
+				geometry.append((kind, place(*values[0:2]) + place(*values[2:4])))
+			else:
+				geometry.append((kind, place(*values[0:2]) + (values[2], (values[3] + rotation) % 360, (values[4] + rotation) % 360)))
+	return geometry
+
+# Stamped blocks, exploded by hand, must land where the entities output style draws each cutout, rotated keys included
+def test_blocks_match_entities():
+	options = ('mx', '0.5', 'mx-simple', '0.5', 'extreme', '0.5', '19.05', '19.05')
+
+	for filename in ['test-data/test-rotated-keys', 'test-data/rotated-blocks']:
+		with open(filename, 'r') as input_file:
+			input_data = input_file.read()
+
+		documents = []
+		for output_style in ['entities', 'blocks']:
+			gen = plategen.PlateGenerator(*options, False, output_style)
+			output_data = io.StringIO()
+			assert gen.generate_plate(output_data, input_data) == 0
+			documents.append(ezdxf.read(io.StringIO(output_data.getvalue())))
+
+		entities_document, blocks_document = documents
+		assert any(entity.dxftype() == 'INSERT' and entity.dxf.rotation != 0 for entity in blocks_document.modelspace()), filename
+		expected = entity_geometry(entities_document.modelspace())
+		actual = exploded_geometry(blocks_document)
+		assert len(actual) == len(expected), filename
+
+		# Pair each exploded entity off with a matching drawn one; angles are compared round the circle
+		for kind, values in actual:
+			for index, (expected_kind, expected_values) in enumerate(expected):
+				if (expected_kind == kind and all(abs((value - expected_value + 180) % 360 - 180) < 1e-6 if (kind == 'ARC' and position > 2) else abs(value - expected_value) < 1e-6
+					for position, (value, expected_value) in enumerate(zip(values, expected_values)))):
+					del expected[index]
+					break
+			else:
+				assert False, (filename, kind, values)
+
+# Toolpath ordering only changes the order cutouts are drawn in, and never adds travel
+def test_toolpath_ordering():
+	options = ('mx', '0.5', 'mx-simple', '0.5', 'extreme', '0.5', '19.05', '19.05')
+
+	for filename in sorted(os.listdir('test-data')):
+		with open(os.path.join('test-data', filename), 'r') as input_file:
+			input_data = input_file.read()
+
+		for origin in ('0,0', '400,-150'):
+			plain_gen = plategen.PlateGenerator(*options, False)
+			ordered_gen = plategen.PlateGenerator(*options, False, 'entities', 'decimal', origin)
+			assert plain_gen.generate_plate(io.StringIO(), input_data) == 0
+			assert ordered_gen.generate_plate(io.StringIO(), input_data) == 0
+
+			assert sorted(modelspace_geometry(plain_gen)) == sorted(modelspace_geometry(ordered_gen)), filename
+			travel_before, travel_after = ordered_gen.toolpath_travel
+			assert travel_after <= travel_before, (filename, origin)
+
+# Panels: every plate lands on the sheet, clear of the others, with all its geometry moved along with it
+def test_panel_nesting():
+	layouts = []
+	for filename in ('test-tkl', 'test-numpad', 'test-full104', 'test-ergo'):
+		with open(os.path.join('test-data', filename), 'r') as input_file:
+			layouts.append(input_file.read())
+	layouts = layouts * 3
+
+	gen = plategen.PlateGenerator('mx', '0.5', 'mx-simple', '0.5', 'extreme', '0.5', '19.05', '19.05', False, 'polylines')
+	assert gen.generate_panel(io.StringIO(), layouts, '1200', '1000', '5') == 0
+
+	# Each plate's extents, as drawn on its own
+	rectangles = []
+	entity_count = 0
+	for input_data, (x, y, rotated) in zip(layouts, gen.panel_placements):
+		plate_gen = plategen.PlateGenerator('mx', '0.5', 'mx-simple', '0.5', 'extreme', '0.5', '19.05', '19.05', False, 'polylines')
+		assert plate_gen.generate_plate(io.StringIO(), input_data) == 0
+		entity_count += len(plate_gen.modelspace)
+		points = [point for entity in plate_gen.modelspace for point in plate_gen.entity_extent_points(entity)]
+		width = max(point[0] for point in points) - min(point[0] for point in points)
+		height = max(point[1] for point in points) - min(point[1] for point in points)
+		if (rotated):
+			width, height = height, width
+		rectangles.append((float(x), float(y), float(x) + width, float(y) + height))
+
+	for i, (left, bottom, right, top) in enumerate(rectangles):
+		assert left >= 5 - 1e-9 and bottom >= 5 - 1e-9 and right <= 1195 + 1e-9 and top <= 995 + 1e-9
+		for other_left, other_bottom, other_right, other_top in rectangles[i + 1:]:
+			assert (right + 5 <= other_left + 1e-9 or other_right + 5 <= left + 1e-9 or top + 5 <= other_bottom + 1e-9 or other_top + 5 <= bottom + 1e-9)
+
+	# Repeated plates are copied whole, nothing more and nothing less
+	assert len(gen.modelspace) == entity_count
+
+	# Every line end and polyline vertex sits on some plate
+	points = []
+	for entity in gen.modelspace:
+		if (entity.dxftype() == 'LINE'):
+			points += [entity.dxf.start, entity.dxf.end]
+		elif (entity.dxftype() == 'LWPOLYLINE'):
+			points += list(entity.get_points())
+	for point in points:
+		assert any(left - 1e-6 <= float(point[0]) <= right + 1e-6 and bottom - 1e-6 <= float(point[1]) <= top + 1e-6 for left, bottom, right, top in rectangles), point
+
+	assert gen.generate_panel(io.StringIO(), layouts, '300', '300', '5') == 13
+
+def test_cutout_validation():
+	row = '["1","2","3"]'
+
+	# 14mm switch cutouts 19.05mm apart leave plenty of plate between them
+	gen = plategen.PlateGenerator('mx', '0.5', 'mx-simple', '0.5', 'none', '0.5', '19.05', '19.05', False)
+	assert gen.generate_plate(None, row) == 0
+	assert gen.validate_cutouts() == []
+
+	# 14.5mm apart leaves a 0.5mm web between neighbours
+	gen = plategen.PlateGenerator('mx', '0.5', 'mx-simple', '0.5', 'none', '0.5', '14.5', '19.05', False)
+	assert gen.generate_plate(None, row) == 0
+	warnings = gen.validate_cutouts()
+	assert [(warning['type'], [cutout['key'] for cutout in warning['cutouts']]) for warning in warnings] == [('thin-web', [0, 1]), ('thin-web', [1, 2])]
+	assert abs(warnings[0]['gap'] - 0.5) < 1e-6
+	assert abs(warnings[0]['x'] - 14.5) < 1e-6
+	assert gen.validate_cutouts(0.4) == []
+
+	# 13.5mm apart and they overlap
+	gen = plategen.PlateGenerator('mx', '0.5', 'mx-simple', '0.5', 'none', '0.5', '13.5', '19.05', False)
+	assert gen.generate_plate(None, row) == 0
+	assert [warning['type'] for warning in gen.validate_cutouts()] == ['overlap', 'overlap']
+
+	# The grid finds the same pairs as checking every pair against every other
+	with open('test-data/rotated-blocks', 'r') as input_file:
+		input_data = input_file.read()
+	gen = plategen.PlateGenerator('mx', '0.5', 'mx-simple', '0.5', 'extreme', '0.5', '19.05', '19.05', False)
+	assert gen.generate_plate(None, input_data) == 0
+	shapes = [gen.cutout_shape(profile, x, y, anchor_x, anchor_y, angle) for group, block_name, profile, x, y, anchor_x, anchor_y, angle in gen.placed_cutouts]
+	expected = []
+	for i in range(len(shapes)):
+		for j in range(i + 1, len(shapes)):
+			gap, position = cutoutcheck.cutout_gap(shapes[i], shapes[j])
+			if (gap < 1):
+				expected.append((i, j, gap, position))
+	assert expected
+	assert cutoutcheck.find_thin_webs(shapes, 1.0) == expected
+
+	# Only numbers from 0 to MAX_MIN_WEB; the thread's own decimal settings don't come into it
+	warnings = gen.validate_cutouts()
+	for min_web in ['nan', 'inf', '-inf', -0.5, '1e9', 'x', None]:
+		try:
+			gen.validate_cutouts(min_web)
+			assert False, min_web
+		except(ValueError, TypeError):
+			pass
+	assert gen.validate_cutouts('1') == warnings
+	with decimal.localcontext() as context:
+		context.prec = 3
+		assert gen.validate_cutouts(1) == warnings
+
+def test_validate_route_min_web():
+	import web
+
+	form = {'kle-data': '["Q","W"]', 'cutout-type': 'mx', 'cutout-radius': '0.5', 'stab-type': 'mx-simple', 'stab-radius': '0.5',
+		'acoustic-type': 'none', 'acoustic-radius': '0.5', 'unit-width': '19.05', 'unit-height': '19.05'}
+	client = web.app.test_client()
+	assert client.post('/plategen/validate', data=form).get_json() == {'warnings': []}
+	assert client.post('/plategen/validate', data=dict(form, **{'min-web': '6'})).get_json()['warnings'][0]['type'] == 'thin-web'
+	for min_web in ['nan', 'inf', '-1', '1e9', 'wide', '']:
+		response = client.post('/plategen/validate', data=dict(form, **{'min-web': min_web}))
+		assert response.status_code == 400 and 'Minimum web' in response.get_json()['error'], min_web
+
+# Corners of every cutout in an SVG preview, placed and flipped back to DXF coordinates
+def svg_cutout_points(svg):
+	paths = {}
+	for path_id, path_data in re.findall(r'<path id="(\w+)" d="([^"]*)"/>', svg):
+		points = []
+		for command, arguments in re.findall(r'([MLAZ])([^MLAZ]*)', path_data):
+			numbers = [float(number) for number in arguments.split()]
+			if (numbers):
+				points.append((numbers[-2], numbers[-1]))
+		paths[path_id] = points
+
+	cutouts = []
+	for path_id, transform in re.findall(r'<use xlink:href="#(\w+)" transform="([^"]*)"/>', svg):
+		angle, center_x, center_y = 0.0, 0.0, 0.0
+		rotation = re.search(r'rotate\(([-\d.]+) ([-\d.]+) ([-\d.]+)\)', transform)
+		if (rotation):
+			angle, center_x, center_y = (float(value) for value in rotation.groups())
+		offset_x, offset_y = (float(value) for value in re.search(r'translate\(([-\d.]+) ([-\d.]+)\)', transform).groups())
+		cos_angle = math.cos(math.radians(angle))
+		sin_angle = math.sin(math.radians(angle))
+		points = []
+		for x, y in paths[path_id]:
+			x, y = x + offset_x - center_x, y + offset_y - center_y
+			points.append(rounded_point(center_x + x * cos_angle - y * sin_angle, -(center_y + x * sin_angle + y * cos_angle)))
+		cutouts.append(sorted(points))
+	return sorted(cutouts)
+
+def test_svg_preview_matches_plate():
+	options = ('mx', '0.5', 'mx-simple', '0.5', 'extreme', '0.5', '19.05', '19.05')
+	for filename in ('test-full104', 'test-rotated-keys', 'test-numpad-rs-flag'):
+		with open(os.path.join('test-data', filename), 'r') as input_file:
+			input_data = input_file.read()
+
+		gen = plategen.PlateGenerator(*options, False, 'polylines')
+		assert gen.generate_plate(io.StringIO(), input_data) == 0
+		expected = sorted(sorted(rounded_point(point[0], point[1]) for point in entity.get_points()) for entity in gen.modelspace if entity.dxftype() == 'LWPOLYLINE')
+
+		preview_gen = plategen.PlateGenerator(*options, False, 'polylines')
+		preview = io.StringIO()
+		assert preview_gen.generate_preview(preview, input_data) == 0
+		actual = svg_cutout_points(preview.getvalue())
+
+		assert len(actual) == len(expected)
+		for actual_points, expected_points in zip(actual, expected):
+			for actual_point, expected_point in zip(actual_points, expected_points):
+				assert abs(actual_point[0] - expected_point[0]) < 1e-3 and abs(actual_point[1] - expected_point[1]) < 1e-3, (filename, actual_point, expected_point)
+
+		# No DXF document was made just for a preview
+		assert preview_gen.plate is None and preview_gen.modelspace is None
+
+	# Empty KLE data is a bad layout, not a server error
+	assert plategen.PlateGenerator(*options, False).generate_preview(io.StringIO(), '') == 1
+	import web
+	form = {'kle-data': '', 'cutout-type': 'mx', 'cutout-radius': '0.5', 'stab-type': 'mx-simple', 'stab-radius': '0.5',
+		'acoustic-type': 'none', 'acoustic-radius': '0.5', 'unit-width': '19.05', 'unit-height': '19.05'}
+	assert web.app.test_client().post('/preview', data=form).status_code == 400
+
+# Rounded geometry, ignoring entity order
+def geometry_multiset(gen):
+	return sorted((kind, tuple(round(float(value), 6) for value in values)) for kind, values in modelspace_geometry(gen))
+
+def test_session_matches_fresh_render():
+	options = ('mx', '0.5', 'mx-simple', '0.5', 'extreme', '0.5', '19.05', '19.05')
+	with open('test-data/test-tkl', 'r') as input_file:
+		base = input_file.read()
+
+	# (edited layout, keys expected to be re-rendered)
+	check_session_edits(options, [
+		(base, 87),
+		(base.replace('{w:6.25}', '{w:6.25,_rs:180}'), 1),
+		(base.replace('{w:2},""', '{w:2.25},""'), 5),
+		(base.replace('[{w:1.5},"","",', '[{w:1.5},"",'), 6),
+		(base.split('\n', 1)[1], 71),
+		(base, 87),
+	])
+
+	# Rotated keys reaching past the layout's own bounds must keep widening the plate while they're kept
+	with open('test-data/test-ergo', 'r') as input_file:
+		base = input_file.read()
+	last_rotated_key = base.rindex(',\n')
+	check_session_edits(options, [
+		(base, 65),
+		(base[:last_rotated_key], 0),
+		(base, 1),
+		('["Extra","Row"],\n' + base, 18),
+		(base.replace('{r:60,', '{r:45,'), 17),
+	])
+
+	with open('test-data/rotated-blocks', 'r') as input_file:
+		base = input_file.read()
+	check_session_edits(options, [
+		(base, 61),
+		(base.replace('"#\\n3"]', '"#\\n3","$"]'), 1),
+		(base.replace('{x:-1.25,a:7,w:6.25},""', '{x:-1.25,a:7,w:7},""'), 1),
+		(base.replace('{r:15,', '{r:20,'), 19),
+		(base, 19),
+	])
+
+# Feed a session one edit after another, checking each against a fresh render of the same data
+# edits are (edited layout, keys expected to be re-rendered)
+def check_session_edits(options, edits):
+	session = platesession.PlateSession(options)
+	for input_data, rendered_count in edits:
+		assert session.update(input_data) == 0
+		assert session.last_changes['rendered'] == rendered_count
+
+		gen = plategen.PlateGenerator(*options, False)
+		assert gen.generate_plate(None, input_data) == 0
+		assert geometry_multiset(session.generator) == geometry_multiset(gen)
+		assert session.validate_cutouts() == gen.validate_cutouts()
+
+	# Bad data leaves the plate as it was
+	assert session.update('[,') == 1
+	assert geometry_multiset(session.generator) == geometry_multiset(gen)
+
+	# A key that fails part way through rendering can't leave half a plate behind for the next edit
+	assert session.update(input_data.replace('"', '{w:"Infinity"},"', 1)) == 1
+	assert not session.started
+	assert session.update(input_data) == 0
+	assert geometry_multiset(session.generator) == geometry_multiset(gen)
+	assert session.validate_cutouts() == gen.validate_cutouts()
+
+# Plates are cached under their options exactly as given, and both tiers stay within their byte budgets, least recently used out first
+def test_plate_cache():
+	options = ('mx', '0.5', 'mx-simple', '0.5', 'none', '0.5', '19.05', '19.05')
+	key = platecache.make_cache_key('[\n  ["Q","W"]\n]\n', options)
+	assert key == platecache.make_cache_key('[\r\n["Q","W"]\r\n]', options)
+	assert key != platecache.make_cache_key('[["Q","W"]]', (' mx ',) + options[1:])
+	assert key != platecache.make_cache_key('[["Q","E"]]', options)
+
+	# Memory tier
+	cache = platecache.PlateCache(10)
+	assert cache.get('a') is None
+	cache.put('a', b'aaaa')
+	cache.put('b', b'bbbb')
+	assert cache.get('a') == b'aaaa'
+	cache.put('c', b'cccc')
+	assert cache.get('b') is None
+	assert cache.get('a') == b'aaaa' and cache.get('c') == b'cccc'
+	assert cache.current_bytes == 8
+	cache.put('d', b'd' * 11)
+	assert cache.get('d') is None and cache.current_bytes == 8
+
+	# Disk tier: kept across restarts, pruned least recently used first
+	with tempfile.TemporaryDirectory() as cache_dir:
+		cache = platecache.PlateCache(100, cache_dir, 10)
+		cache.put('a', b'aaaa')
+		cache.put('b', b'bbbb')
+		os.utime(os.path.join(cache_dir, 'a.dxf'), (time.time() - 60, time.time() - 60))
+		os.utime(os.path.join(cache_dir, 'b.dxf'), (time.time() - 30, time.time() - 30))
+
+		cache = platecache.PlateCache(100, cache_dir, 10)
+		assert cache.disk_bytes == 8
+		assert cache.get('a') == b'aaaa'
+		cache.put('c', b'cccc')
+		assert sorted(os.listdir(cache_dir)) == ['a.dxf', 'c.dxf']
+		assert cache.disk_bytes == 8
+		cache.put('d', b'd' * 11)
+		assert sorted(os.listdir(cache_dir)) == ['a.dxf', 'c.dxf']
+
+		# A smaller budget after a restart prunes straight away
+		cache = platecache.PlateCache(100, cache_dir, 4)
+		assert sorted(os.listdir(cache_dir)) == ['c.dxf'] and cache.disk_bytes == 4
+
+		# Files pruned by another process are just misses
+		os.remove(os.path.join(cache_dir, 'c.dxf'))
+		assert cache.get('c') is None and cache.disk_bytes == 0
+
+	# Metric labels only ever take types plategen knows
+	assert platejobs.plate_labels('mx', 'large-cuts') == ('mx', 'large-cuts')
+	assert platejobs.plate_labels(' mx ', 'anything') == ('unknown', 'unknown')
+
+# Poll a background job until it's finished
+def wait_for_job(job, timeout=60):
+	deadline = time.time() + timeout
+	while (job.status == 'queued'):
+		assert time.time() < deadline
+		time.sleep(0.01)
+
+# A pool whose submit always fails, as a ProcessPoolExecutor does after one of its workers has died
+class BrokenPool(object):
+	def submit(self, *args):
+		raise concurrent.futures.process.BrokenProcessPool('A child process terminated abruptly')
+	def shutdown(self, wait=True):
+		pass
+
+# A pool that holds on to its jobs until they're run by hand, in this process
+class HeldPool(object):
+	def __init__(self):
+		self.jobs = []
+	def submit(self, function, *args):
+		future = concurrent.futures.Future()
+		self.jobs.append((future, function, args))
+		return future
+	def run_jobs(self):
+		for future, function, args in self.jobs:
+			future.set_running_or_notify_cancel()
+			future.set_result(function(*args))
+	def shutdown(self, wait=True):
+		pass
+
+def test_plate_job_queue():
+	options = ('mx', '0.5', 'mx-simple', '0.5', 'none', '0.5', '19.05', '19.05')
+	finished = []
+	queue = platejobs.PlateJobQueue(1, 2, 60, on_done=finished.append)
+	try:
+		held_pool = HeldPool()
+		queue.executor = held_pool
+		job = queue.submit('["Q","W"]', options, 'key')
+		bad_job = queue.submit('[,', options)
+		assert queue.submit('["Q"]', options) is None
+		assert job.status == 'queued' and queue.pending_count == 2
+
+		held_pool.run_jobs()
+		assert job.status == 'done' and job.data.startswith(b'  0\nSECTION') and job.stats['keys'] == 2
+		assert bad_job.status == 'failed' and bad_job.code == 1 and bad_job.error
+		assert finished == [job] and queue.pending_count == 0
+		assert queue.get(job.job_id) is job
+
+		# Rendered in a worker process
+		queue.executor = None
+		job = queue.submit('["Q","W"]', options)
+		wait_for_job(job)
+		assert job.status == 'done' and job.stats['keys'] == 2
+
+		# A broken or shut down pool is replaced rather than failing every job from then on
+		queue.executor = BrokenPool()
+		job = queue.submit('["Q"]', options)
+		wait_for_job(job)
+		assert job.status == 'done' and queue.pending_count == 0
+
+		queue.executor.shutdown()
+		job = queue.submit('["Q"]', options)
+		wait_for_job(job)
+		assert job.status == 'done' and queue.pending_count == 0
+
+		# When no pool will take the job, it fails straight away and frees its place in the queue
+		old_pool_class = platejobs.concurrent.futures.ProcessPoolExecutor
+		platejobs.concurrent.futures.ProcessPoolExecutor = lambda max_workers: BrokenPool()
+		try:
+			queue.executor = None
+			job = queue.submit('["Q"]', options)
+		finally:
+			platejobs.concurrent.futures.ProcessPoolExecutor = old_pool_class
+		assert job.status == 'failed' and queue.pending_count == 0
+		assert queue.get(job.job_id) is job
+	finally:
+		queue.shutdown()
+
+def test_plate_job_routes():
+	import web
+
+	form = {'kle-data': '["Q","W"]', 'cutout-type': 'mx', 'cutout-radius': '0.5', 'stab-type': 'mx-simple', 'stab-radius': '0.5',
+		'acoustic-type': 'none', 'acoustic-radius': '0.5', 'unit-width': '19.05', 'unit-height': '19.05'}
+	client = web.app.test_client()
+	old_jobs, old_cache = web.plate_jobs, web.plate_cache
+	web.plate_jobs = platejobs.PlateJobQueue(1, 4, 60, on_done=web.plate_job_done)
+	web.plate_cache = platecache.PlateCache(1024 * 1024)
+	try:
+		response = client.post('/plategen/jobs', data=form)
+		assert response.status_code == 202
+		status = response.get_json()
+		wait_for_job(web.plate_jobs.get(status['job_id']))
+		status = client.get(status['status_url']).get_json()
+		assert status['status'] == 'done'
+		plate = client.get(status['download_url'])
+		assert plate.status_code == 200 and plate.data.startswith(b'  0\nSECTION')
+
+		# The same plate again comes straight from the cache
+		status = client.post('/plategen/jobs', data=form).get_json()
+		assert status['status'] == 'done' and client.get(status['download_url']).data == plate.data
+
+		status = client.post('/plategen/jobs', data=dict(form, **{'kle-data': '[,'})).get_json()
+		wait_for_job(web.plate_jobs.get(status['job_id']))
+		status = client.get(status['status_url']).get_json()
+		assert status['status'] == 'failed' and status['error'].startswith('Invalid KLE data.')
+		assert client.get(status['status_url'] + '/dxf').status_code == 409
+
+		assert client.post('/plategen/jobs', data=dict(form, **{'cutout-type': ' mx '})).status_code == 400
+		assert client.post('/plategen/jobs', data=dict(form, **{'unit-width': 'wide'})).status_code == 400
+		assert client.get('/plategen/jobs/nope').status_code == 404
+
+		web.plate_jobs.shutdown()
+		web.plate_jobs = platejobs.PlateJobQueue(1, 0, 60)
+		response = client.post('/plategen/jobs', data=dict(form, **{'kle-data': '["E"]'}))
+		assert response.status_code == 503 and response.headers['Retry-After'] == '5'
+	finally:
+		web.plate_jobs.shutdown()
+		web.plate_jobs, web.plate_cache = old_jobs, old_cache
+
+# Run plategen.py as from the command line. Returns (exit code, stderr).
+def run_plategen(*args):
+	result = subprocess.run([sys.executable, 'plategen.py'] + list(args), stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+	return (result.returncode, result.stderr)
+
+def test_batch_cli():
+	with tempfile.TemporaryDirectory() as work_dir:
+		layout_dir = os.path.join(work_dir, 'layouts')
+		os.makedirs(layout_dir)
+		shutil.copy('test-data/test-numpad', os.path.join(layout_dir, 'numpad.txt'))
+		shutil.copy('test-data/test-numpad-rs-flag', os.path.join(layout_dir, 'rs-flag.txt'))
+		with open(os.path.join(layout_dir, 'broken.txt'), 'w') as layout_file:
+			layout_file.write('[,')
+		with open('test-data/test-numpad', 'r') as input_file:
+			numpad = input_file.read()
+
+		# A directory: every file with the base options, one failing
+		output_dir = os.path.join(work_dir, 'plates')
+		exit_code, errors = run_plategen('--batch', layout_dir, '-o', output_dir, '-j', '2', '-ct', 'alps')
+		assert exit_code == 1
+		assert 'broken.dxf: failed with return code 1' in errors and '2 of 3 plates generated.' in errors
+		assert sorted(os.listdir(output_dir)) == ['numpad.dxf', 'rs-flag.dxf']
+		with open(os.path.join(output_dir, 'numpad.dxf'), 'r') as output_file:
+			expected = next(plategen.generate_many([(numpad, {'cutout_type': 'alps'})]))[1]
+			assert normalise_dxf(output_file.read()) == normalise_dxf(expected)
+
+		# A manifest: every layout with every option set, one set failing
+		manifest_path = os.path.join(work_dir, 'manifest.json5')
+		with open(manifest_path, 'w') as manifest_file:
+			manifest_file.write('{layouts: ["layouts/numpad.txt", "layouts/rs-flag.txt"], option_sets: [{name: "mx"}, {name: "alps", cutout_type: "alps", stab_type: "alps-aek"}, {cutout_type: "cherry"}]}')
+		output_dir = os.path.join(work_dir, 'manifest-plates')
+		exit_code, errors = run_plategen('--batch', manifest_path, '-o', output_dir, '-j', '1')
+		assert exit_code == 1
+		assert 'numpad-2.dxf: failed with return code 3' in errors and '4 of 6 plates generated.' in errors
+		assert sorted(os.listdir(output_dir)) == ['numpad-alps.dxf', 'numpad-mx.dxf', 'rs-flag-alps.dxf', 'rs-flag-mx.dxf']
+		with open(os.path.join(output_dir, 'numpad-alps.dxf'), 'r') as output_file:
+			expected = next(plategen.generate_many([(numpad, {'cutout_type': 'alps', 'stab_type': 'alps-aek'})]))[1]
+			assert normalise_dxf(output_file.read()) == normalise_dxf(expected)
+
+		# Jobs that would overwrite each other's output are turned away before anything is rendered
+		os.makedirs(os.path.join(work_dir, 'more'))
+		shutil.copy('test-data/test-tkl', os.path.join(work_dir, 'more', 'numpad.txt'))
+		for manifest in ['{layouts: ["layouts/numpad.txt", "more/numpad.txt"]}', '{layouts: ["layouts/numpad.txt"], option_sets: [{name: "1"}, {cutout_type: "alps"}]}']:
+			with open(manifest_path, 'w') as manifest_file:
+				manifest_file.write(manifest)
+			output_dir = os.path.join(work_dir, 'clashing-plates')
+			exit_code, errors = run_plategen('--batch', manifest_path, '-o', output_dir)
+			assert exit_code == 1 and 'Invalid batch' in errors and 'would be written by both' in errors
+			assert not os.path.exists(output_dir)
+
+		# Manifest values come in as they would from the command line; anything else turns the batch away
+		with open(manifest_path, 'w') as manifest_file:
+			manifest_file.write('{layouts: ["layouts/numpad.txt"], option_sets: [{unit_width: 19.05, cutout_radius: 1, toolpath_origin: [0, 2.5]}]}')
+		output_dir = os.path.join(work_dir, 'number-plates')
+		exit_code, errors = run_plategen('--batch', manifest_path, '-o', output_dir)
+		assert exit_code == 0 and 'Traceback' not in errors
+		with open(os.path.join(output_dir, 'numpad.dxf'), 'r') as output_file:
+			expected = next(plategen.generate_many([(numpad, {'unit_width': '19.05', 'cutout_radius': '1', 'toolpath_origin': '0,2.5'})]))[1]
+			assert normalise_dxf(output_file.read()) == normalise_dxf(expected)
+
+		for option_set, error in [('{writer: "native"}', 'unknown option writer'), ('{toolpath_origin: [0]}', 'toolpath_origin must be'),
+			('{unit_width: true}', 'bad value true'), ('{stab_type: ["mx-simple"]}', 'bad value'), ('"mx"', 'option sets must be objects')]:
+			with open(manifest_path, 'w') as manifest_file:
+				manifest_file.write('{layouts: ["layouts/numpad.txt"], option_sets: [' + option_set + ']}')
+			output_dir = os.path.join(work_dir, 'bad-plates')
+			exit_code, errors = run_plategen('--batch', manifest_path, '-o', output_dir)
+			assert exit_code == 1 and 'Invalid batch' in errors and error in errors and 'Traceback' not in errors, option_set
+			assert not os.path.exists(output_dir)
+
+		for jobs in ['0', '-2']:
+			exit_code, errors = run_plategen('--batch', layout_dir, '-o', os.path.join(work_dir, 'no-plates'), '-j', jobs)
+			assert exit_code == 1 and 'Number of jobs must be at least 1.' in errors and 'Traceback' not in errors
+			assert not os.path.exists(os.path.join(work_dir, 'no-plates'))
+
+# Layouts survive a trip through their plain data form, and through JSON, unchanged
+def test_layout_data_round_trip():
+	for filename in sorted(os.listdir('test-data')):
+		with open(os.path.join('test-data', filename), 'r') as input_file:
+			layout = plategen.parse_layout(input_file.read())
+
+		restored = plategen.Layout.from_data(json.loads(json.dumps(layout.to_data())))
+		assert restored.keys == layout.keys, filename
+		assert [key.as_tuple() for key in restored.keys] == [key.as_tuple() for key in layout.keys]
+		assert (restored.width, restored.height) == (layout.width, layout.height)
+		assert restored.to_data() == layout.to_data()
+		assert restored.digest() == layout.digest() and restored == layout and hash(restored) == hash(layout)
+
+		clusters = layout.rotation_clusters()
+		assert list(restored.rotation_clusters().items()) == list(clusters.items())
+		assert sorted(index for indices in clusters.values() for index in indices) == list(range(len(layout.keys)))
+
+		# Any change to a key changes the digest
+		changed = plategen.Layout.from_data(layout.to_data())
+		changed.keys[-1].angle += 1
+		assert changed.digest() != layout.digest() and changed != layout
+
+	# Rotation clusters group keys by anchor and angle, in KLE order
+	with open('test-data/rotated-blocks', 'r') as input_file:
+		clusters = plategen.parse_layout(input_file.read()).rotation_clusters()
+	assert [(str(rx), str(ry), str(angle), len(indices)) for (rx, ry, angle), indices in clusters.items()] == [('0', '0', '0', 42), ('5', '3', '-15', 19)]
+
+# Counts the trig calls made through an mpmath context
+class CountingMP(object):
+	def __init__(self, mp):
+		self.mp = mp
+		self.calls = 0
+	def __getattr__(self, name):
+		return getattr(self.mp, name)
+	def cos(self, value):
+		self.calls += 1
+		return self.mp.cos(value)
+	def sin(self, value):
+		self.calls += 1
+		return self.mp.sin(value)
+
+# Multiples of 90 degrees get exact factors without any trig; anything else goes through mpmath
+def test_quarter_turn_rotation_factors():
+	gen = plategen.PlateGenerator('mx', '0.5', 'mx-simple', '0.5', 'none', '0.5', '19.05', '19.05', False)
+	counting_mp = CountingMP(gen.mp)
+	gen.mp = counting_mp
+	with decimal.localcontext(gen.decimal_context):
+		expected = {'0': (1, 0), '90': (0, 1), '180': (-1, 0), '270': (0, -1), '-90': (0, -1), '-180': (-1, 0), '-270': (0, 1), '450': (0, 1), '-450': (0, -1), '720': (1, 0), '90.0': (0, 1)}
+		for angle, factors in expected.items():
+			cos, sin = gen.get_rotation_factors(decimal.Decimal(angle))
+			assert (cos, sin) == factors, angle
+			assert isinstance(cos, decimal.Decimal) and isinstance(sin, decimal.Decimal)
+		assert counting_mp.calls == 0
+
+		# Points turned a quarter at a time land exactly
+		assert gen.rotate_point_around_anchor(decimal.Decimal('7'), decimal.Decimal('-3.5'), decimal.Decimal('1'), decimal.Decimal('1'), decimal.Decimal('-90')) == (decimal.Decimal('-3.5'), decimal.Decimal('-5'))
+
+		for angle in ['15', '-60', '89.999', '90.001', '135']:
+			cos, sin = gen.get_rotation_factors(decimal.Decimal(angle))
+			radians = mpmath.radians(mpmath.mpf(angle))
+			assert abs(cos - decimal.Decimal(str(mpmath.cos(radians)))) < decimal.Decimal('1e-14'), angle
+			assert abs(sin - decimal.Decimal(str(mpmath.sin(radians)))) < decimal.Decimal('1e-14'), angle
+			assert cos != 0 and sin != 0
+		assert counting_mp.calls == 10
+
+		# Each angle is only worked out once
+		gen.get_rotation_factors(decimal.Decimal('15'))
+		assert counting_mp.calls == 10
+
+def test_metrics_text_format():
+	metrics = platemetrics.MetricsRegistry()
+	seconds = metrics.histogram('test_seconds', 'Test durations.', ('route',), (0.1, 1))
+	lookups = metrics.counter('test_total', 'Test lookups.', ('result',))
+	for value in (0.05, 0.5, 0.5, 5):
+		seconds.observe(('a"b',), value)
+	lookups.inc(('hit',))
+	lookups.inc(('hit',), 2)
+
+	lines = metrics.render().splitlines()
+	assert lines == [
+		'# HELP test_seconds Test durations.',
+		'# TYPE test_seconds histogram',
+		'test_seconds_bucket{route="a\\"b",le="0.1"} 1',
+		'test_seconds_bucket{route="a\\"b",le="1"} 3',
+		'test_seconds_bucket{route="a\\"b",le="+Inf"} 4',
+		'test_seconds_sum{route="a\\"b"} 6.05',
+		'test_seconds_count{route="a\\"b"} 4',
+		'# HELP test_total Test lookups.',
+		'# TYPE test_total counter',
+		'test_total{result="hit"} 3',
+	]
+
+# Values with their types, so 1 and 1.0 don't compare equal
+def typed_values(value):
+	if (isinstance(value, list)):
+		return [typed_values(item) for item in value]
+	if (isinstance(value, dict)):
+		return {key: typed_values(item) for key, item in value.items()}
+	return (type(value), value)
+
+# The fast KLE parser must read exactly what json5 reads, and point at the right place when it can't
+def test_kle_parser_matches_json5():
+	for filename in sorted(os.listdir('test-data')):
+		with open(os.path.join('test-data', filename), 'r') as input_file:
+			input_data = input_file.read()
+		assert typed_values(kleparse.FastParser(input_data).parse()) == typed_values(json5.loads('[' + input_data + ']')), filename
+
+	# json5 only syntax still works through the fallback
+	assert kleparse.loads("[{x:.5},'A'] // comment") == [[{'x': 0.5}, 'A']]
+
+	try:
+		kleparse.loads('["Esc", "F1"],\n[{w:1.5} "Tab"]')
+		assert False, "invalid KLE data was accepted"
+	except(kleparse.KLEParseError) as error:
+		assert (error.line, error.column) == (2, 10)
+
+# DXF header variables that change on every run: creation/update timestamps and GUIDs
+VOLATILE_HEADER_VARS = ('$TDCREATE', '$TDUPDATE', '$FINGERPRINTGUID', '$VERSIONGUID')
+
+# Blank out the volatile header values, so two renders of the same plate compare byte for byte
+def normalise_dxf(dxf_text):
+	lines = dxf_text.split('\n')
+	for i, line in enumerate(lines):
+		if (line.strip() in VOLATILE_HEADER_VARS):
+			lines[i + 2] = ''
+	return '\n'.join(lines)
+
+def render_normalised(options, input_data):
+	gen = plategen.PlateGenerator(*options, False)
+	output_data = io.StringIO()
+	assert gen.generate_plate(output_data, input_data) == 0
+	return normalise_dxf(output_data.getvalue())
+
+# Different plates generated at once on many threads must come out identical to serial runs,
+# even when the threads' own decimal and mpmath settings have been messed with
+def test_parallel_generation_matches_serial():
+	option_sets = [
+		('mx', '0.5', 'mx-simple', '0.5', 'extreme', '0.5', '19.05', '19.05'),
+		('alps', '0.3', 'alps-aek', '0.25', 'typical', '0.5', '19.05', '19.05'),
+		('kailh-choc-CPG1350', '0', 'large-cuts', '1', 'none', '0.5', '18', '17'),
+	]
+
+	jobs = []
+	for filename in sorted(os.listdir('test-data')):
+		with open(os.path.join('test-data', filename), 'r') as input_file:
+			input_data = input_file.read()
+		for options in option_sets:
+			jobs.append((options, input_data))
+
+	serial_outputs = [render_normalised(options, input_data) for options, input_data in jobs]
+
+	def render_with_hostile_context(job):
+		decimal.getcontext().prec = 6
+		return render_normalised(*job)
+
+	old_dps = mpmath.mp.dps
+	mpmath.mp.dps = 6
+	try:
+		with concurrent.futures.ThreadPoolExecutor(max_workers=8) as executor:
+			parallel_outputs = list(executor.map(render_with_hostile_context, jobs * 3))
+	finally:
+		mpmath.mp.dps = old_dps
+
+	for i, output in enumerate(parallel_outputs):
+		assert output == serial_outputs[i % len(jobs)], jobs[i % len(jobs)][0]
+
+# A sweep must give each option set the same plate as rendering it on its own
+def test_sweep_matches_single_plates():
+	sweeps = [
+		('cutout_type', ['mx', 'mx-slightly-wider', 'alps', 'kailh-choc-CPG1350']),
+		('stab_type', ['mx-simple', 'large-cuts', 'alps-aek']),
+		('acoustics_type', ['none', 'extreme']),
+	]
+	option_sets = [options for name, options in plategen.sweep_option_sets(sweeps, {'output_precision': '0'})]
+	option_sets += [
+		{'cutout_type': 'alps', 'cutout_radius': '1', 'output_style': 'blocks-exploded'},
+		{'output_style': 'polylines', 'toolpath_origin': '0,0'},
+		{'unit_width': '19', 'unit_height': '19', 'dxf_writer': 'native'},
+		{'cutout_type': 'cherry'},
+		{'cutout_radius': 'x'},
+	]
+	assert len(option_sets) == 29
+
+	for filename in ['test-full104', 'test-rotated-keys', 'test-ergo']:
+		with open(os.path.join('test-data', filename), 'r') as input_file:
+			input_data = input_file.read()
+
+		layout = plategen.parse_layout(input_data)
+		swept = list(plategen.generate_sweep(layout, option_sets))
+		single = list(plategen.generate_many((input_data, options) for options in option_sets))
+
+		assert [out_code for out_code, output_text in swept] == [0] * 27 + [3, 10]
+		for options, (swept_code, swept_text), (single_code, single_text) in zip(option_sets, swept, single):
+			assert swept_code == single_code, (filename, options)
+			if (swept_code == 0):
+				assert normalise_dxf(swept_text) == normalise_dxf(single_text), (filename, options)
 
-filename = 'test-data/test-full104'
-gen = plategen.PlateGenerator('mx', '0.5', 'mx-simple', '0.5', 'none', '0.5', '19.05', '19.05', 'stdout', 'plate.dxf', False)
-with open(filename, 'r') as input_file:
-    input_data = input_file.read()
-    gen.generate_plate(input_data)
+if __name__ == "__main__":
+	test_full104()
+	test_numpy_engine_matches_decimal()
+	test_rotation_clusters()
+	test_native_writer_matches_ezdxf()
+	test_output_precision()
+	test_polylines_match_entities()
+	test_blocks_match_entities()
+	test_toolpath_ordering()
+	test_panel_nesting()
+	test_cutout_validation()
+	test_svg_preview_matches_plate()
+	test_session_matches_fresh_render()
+	test_layout_data_round_trip()
+	test_quarter_turn_rotation_factors()
+	test_validate_route_min_web()
+	test_plate_cache()
+	test_plate_job_queue()
+	test_plate_job_routes()
+	test_batch_cli()
+	test_metrics_text_format()
+	test_kle_parser_matches_json5()
+	test_parallel_generation_matches_serial()
+	test_sweep_matches_single_plates()
+	print("All tests passed.")
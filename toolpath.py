@@ -0,0 +1,160 @@
+#=================================#
+#        Toolpath Ordering        #
+#=================================#
+
+# Orders cutouts to cut down on how far a laser head travels between them.
+# CAM software generally cuts contours in the order they appear in the DXF,
+# so drawing the cutouts in a sensible order saves rapid travel on every plate.
+
+# Cutouts come in groups, one per switch: the switch cutout with its stabs and acoustic cuts.
+# Groups are kept together and ordered by their centers: greedy nearest neighbour from the origin,
+# then improved with 2-opt. Within each group, cutouts are visited nearest first.
+
+# Points are (x, y) floats in mm. Travel is measured point to point from the origin,
+# using each cutout's center as where the head goes to cut it.
+
+#=================================#
+#                                 #
+#=================================#
+
+import math
+
+# 2-opt only tries reversing runs of up to this many groups, which keeps big layouts quick
+# while still catching the usual row-end zig-zags.
+TWO_OPT_WINDOW = 64
+
+# Give up on 2-opt after this many passes over the path, improving or not
+TWO_OPT_MAX_PASSES = 20
+
+def distance(a, b):
+	return math.hypot(a[0] - b[0], a[1] - b[1])
+
+# Total distance travelled visiting points in order, starting from origin
+def travel_distance(points, origin):
+	total = 0.0
+	position = origin
+	for point in points:
+		total += distance(position, point)
+		position = point
+	return total
+
+# Visit order for points by always going to the closest point not yet visited
+# Points are bucketed into a grid, so each step only looks at nearby cells.
+def nearest_neighbour_order(points, origin):
+
+	if (not points):
+		return []
+
+	min_x = min(point[0] for point in points)
+	min_y = min(point[1] for point in points)
+	max_x = max(point[0] for point in points)
+	max_y = max(point[1] for point in points)
+
+	# Roughly one point per cell
+	cell_size = max(math.sqrt(max((max_x - min_x) * (max_y - min_y), 1e-9) / len(points)), 1e-3)
+
+	def cell_of(point):
+		return (int(math.floor((point[0] - min_x) / cell_size)), int(math.floor((point[1] - min_y) / cell_size)))
+
+	grid = {}
+	for i, point in enumerate(points):
+		grid.setdefault(cell_of(point), set()).add(i)
+	max_cell_x, max_cell_y = cell_of((max_x, max_y))
+
+	order = []
+	position = origin
+	while (grid):
+		center_x, center_y = cell_of(position)
+
+		# Furthest ring that can still hold points
+		max_ring = max(abs(center_x), abs(center_x - max_cell_x), abs(center_y), abs(center_y - max_cell_y))
+
+		best = None
+		best_distance = None
+		ring = 0
+		while (ring <= max_ring):
+			for cell_x in range(center_x - ring, center_x + ring + 1):
+				for cell_y in range(center_y - ring, center_y + ring + 1):
+					if (max(abs(cell_x - center_x), abs(cell_y - center_y)) != ring):
+						continue
+					for i in grid.get((cell_x, cell_y), ()):
+						point_distance = distance(position, points[i])
+						if (best is None or point_distance < best_distance or (point_distance == best_distance and i < best)):
+							best = i
+							best_distance = point_distance
+
+			# Everything past the next ring is at least this far away
+			if (best is not None and best_distance <= ring * cell_size):
+				break
+			ring += 1
+
+		cell = cell_of(points[best])
+		grid[cell].discard(best)
+		if (not grid[cell]):
+			del grid[cell]
+
+		order.append(best)
+		position = points[best]
+
+	return order
+
+# Improve a visit order with 2-opt: reverse any run of the path whose reversal shortens it
+# The path starts at origin and ends wherever its last point is; the origin stays put.
+def two_opt(order, points, origin):
+
+	path = [origin] + [points[i] for i in order]
+	indices = [None] + list(order)
+	length = len(path)
+
+	for i in range(TWO_OPT_MAX_PASSES):
+		improved = False
+
+		for start in range(1, length - 1):
+			for end in range(start + 1, min(length, start + TWO_OPT_WINDOW)):
+				before_start = path[start - 1]
+				after_end = path[end + 1] if end + 1 < length else None
+
+				old_length = distance(before_start, path[start])
+				new_length = distance(before_start, path[end])
+				if (after_end is not None):
+					old_length += distance(path[end], after_end)
+					new_length += distance(path[start], after_end)
+
+				if (new_length < old_length - 1e-9):
+					path[start:end + 1] = path[start:end + 1][::-1]
+					indices[start:end + 1] = indices[start:end + 1][::-1]
+					improved = True
+
+		if (not improved):
+			break
+
+	return indices[1:]
+
+# Order groups of cutout points for cutting
+# groups is a list of lists of points, one list per switch.
+# Returns [(group index, [point indices within the group]), ...] in cutting order.
+def order_groups(groups, origin):
+
+	non_empty = [i for i, group in enumerate(groups) if group]
+	centers = [(sum(point[0] for point in groups[i]) / len(groups[i]), sum(point[1] for point in groups[i]) / len(groups[i])) for i in non_empty]
+
+	group_order = two_opt(nearest_neighbour_order(centers, origin), centers, origin)
+
+	ordered = []
+	position = origin
+	for center_index in group_order:
+		group_index = non_empty[center_index]
+		group = groups[group_index]
+
+		# Within a switch, just take the closest cutout next
+		remaining = list(range(len(group)))
+		point_order = []
+		while (remaining):
+			closest = min(remaining, key=lambda i: distance(position, group[i]))
+			remaining.remove(closest)
+			point_order.append(closest)
+			position = group[closest]
+
+		ordered.append((group_index, point_order))
+
+	return ordered
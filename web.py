@@ -1,15 +1,125 @@
-from flask import Flask, render_template, flash, request, send_from_directory, send_file
+from flask import Flask, render_template, flash, request, send_from_directory, send_file, jsonify, url_for, g
 
 import datetime
 import plategen
+import platecache
+import platejobs
+import platesession
+import platemetrics
 import io
+import os
+import time
 
 # App config.
 DEBUG = True
 app = Flask(__name__)
 app.config.from_object(__name__)
 app.config['SECRET_KEY'] = 'change me'.encode('utf8')
+
+# Generated plates are cached by KLE data + options, so pressing Generate again is instant.
+# PLATE_CACHE_BYTES bounds the in-memory cache; set PLATE_CACHE_DIR to also keep plates on disk, up to PLATE_CACHE_DISK_BYTES.
+app.config['PLATE_CACHE_BYTES'] = 64 * 1024 * 1024
+app.config['PLATE_CACHE_DIR'] = None
+app.config['PLATE_CACHE_DISK_BYTES'] = 1024 * 1024 * 1024
+
+plate_cache = platecache.PlateCache(app.config['PLATE_CACHE_BYTES'], app.config['PLATE_CACHE_DIR'], app.config['PLATE_CACHE_DISK_BYTES'])
+
+# Plates submitted to /plategen/jobs render in the background on a pool of worker processes.
+# PLATE_JOB_WORKERS bounds how many render at once, PLATE_JOB_QUEUE_DEPTH how many may be waiting or rendering,
+# and finished plates stay downloadable for PLATE_JOB_TTL seconds.
+app.config['PLATE_JOB_WORKERS'] = min(4, os.cpu_count() or 1)
+app.config['PLATE_JOB_QUEUE_DEPTH'] = 32
+app.config['PLATE_JOB_TTL'] = 600
+
+# Request latencies, render stage times and plate sizes, served at /metrics in the Prometheus text format.
+# Everything plate related is labelled by switch cutout and stabilizer type.
+metrics = platemetrics.MetricsRegistry()
+request_seconds = metrics.histogram('plategen_request_duration_seconds', 'Time taken to answer requests, by route.', ('route', 'cutout_type', 'stab_type'))
+stage_seconds = metrics.histogram('plategen_stage_duration_seconds', 'Time spent in each stage of rendering a plate: parse, render, serialise.', ('stage', 'cutout_type', 'stab_type'))
+plate_keys = metrics.histogram('plategen_plate_keys', 'Keys per rendered plate.', ('cutout_type', 'stab_type'), platemetrics.COUNT_BUCKETS)
+plate_entities = metrics.histogram('plategen_plate_entities', 'DXF entities per rendered plate.', ('cutout_type', 'stab_type'), platemetrics.COUNT_BUCKETS)
+output_bytes = metrics.histogram('plategen_output_bytes', 'Size of each rendered DXF.', ('cutout_type', 'stab_type'), platemetrics.BYTE_BUCKETS)
+cache_lookups = metrics.counter('plategen_cache_lookups_total', 'Plate cache lookups, by whether the plate was cached.', ('result',))
+
+# Record a freshly rendered plate: stats from platejobs.plate_stats, and the DXF size
+def record_plate_metrics(stats, output_size):
+	labels = (stats['cutout_type'], stats['stab_type'])
+	for stage, seconds in stats['stage_times'].items():
+		stage_seconds.observe((stage,) + labels, seconds)
+	plate_keys.observe(labels, stats['keys'])
+	plate_entities.observe(labels, stats['entities'])
+	output_bytes.observe(labels, output_size)
+
+# Background jobs land in the plate cache and the metrics once they're done
+def plate_job_done(job):
+	plate_cache.put(job.cache_key, job.data)
+	if (job.stats is not None):
+		record_plate_metrics(job.stats, len(job.data))
+
+plate_jobs = platejobs.PlateJobQueue(app.config['PLATE_JOB_WORKERS'], app.config['PLATE_JOB_QUEUE_DEPTH'], app.config['PLATE_JOB_TTL'],
+	on_done=plate_job_done)
+
+# Editing sessions at /plategen/session re-render only the keys that changed since the last edit.
+# At most PLATE_SESSION_LIMIT sessions are kept, each for PLATE_SESSION_TTL seconds after it was last used.
+app.config['PLATE_SESSION_LIMIT'] = 64
+app.config['PLATE_SESSION_TTL'] = 1800
+
+plate_sessions = platesession.PlateSessionStore(app.config['PLATE_SESSION_LIMIT'], app.config['PLATE_SESSION_TTL'])
+
+# User facing messages for plategen return codes
+plate_error_messages = {
+	1: "Invalid KLE data.",
+	2: "Unsupported stabilizer cutout type.",
+	3: "Unsupported switch cutout type.",
+	4: "Switch fillet radius must be between 0 and half the cutout width/height.",
+	5: "Unit size must be between 0 and 1000mm.",
+	6: "Stablizer fillet radius must be between 0 and 5.",
+	7: "Acoustic cutout fillet radius must be between 0 and 5.",
+	8: "Unsupported stabilizer type.",
+	10: "Enter valid integer arguments.",
+}
+
+# detail, if given, is appended, e.g. where in the KLE data parsing failed
+def plate_error_message(code, detail=None):
+	message = plate_error_messages.get(code, "Unspecified error.")
+	if (detail):
+		message += " (" + str(detail) + ")"
+	return message
+
+# Read the plate form: returns (KLE data, PlateGenerator options in constructor order)
+def read_plate_form():
+	options = (
+		request.form['cutout-type'],
+		request.form['cutout-radius'],
+		request.form['stab-type'],
+		request.form['stab-radius'],
+		request.form['acoustic-type'],
+		request.form['acoustic-radius'],
+		request.form['unit-width'],
+		request.form['unit-height'],
+	)
+	return (request.form['kle-data'], options)
  
+# Plate labels for the request's latency, once the options are known to be good
+# Until then requests are labelled unknown, so bad input can't add label values.
+def label_request(gen):
+	g.plate_labels = platejobs.plate_labels(gen.cutout_type, gen.stab_type)
+
+@app.before_request
+def start_request_timer():
+	g.request_start = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+	if (request.endpoint is not None and not request.endpoint.startswith('static') and request.endpoint != 'metrics_route'):
+		cutout_type, stab_type = g.get('plate_labels', ('unknown', 'unknown'))
+		request_seconds.observe((request.endpoint, cutout_type, stab_type), time.perf_counter() - g.request_start)
+	return response
+
+@app.route("/metrics", methods=['GET'])
+def metrics_route():
+	return metrics.render(), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+
 @app.route('/img/<path:path>')
 def static_img(path):
     return send_from_directory('img', path)
@@ -30,61 +140,208 @@ def default_route():
 @app.route("/plategen", methods=['POST'])
 def receive_data():
 	
-	cutout_type = request.form['cutout-type']
-	cutout_radius = request.form['cutout-radius']
-	stab_type = request.form['stab-type']
-	stab_radius = request.form['stab-radius']
-	acoustic_type = request.form['acoustic-type']
-	acoustic_radius = request.form['acoustic-radius']
-	unit_width = request.form['unit-width']
-	unit_height = request.form['unit-height']
-	kle_input = request.form['kle-data']
+	kle_input, options = read_plate_form()
 	
-	output_data = io.StringIO()
+	# Serve repeat requests straight from the cache
+	cache_key = platecache.make_cache_key(kle_input, options)
+	cached_plate = plate_cache.get(cache_key)
+	if (cached_plate is not None):
+		cache_lookups.inc(('hit',))
+		# Only plates made with good options get cached, and they're cached under the options exactly as given
+		g.plate_labels = platejobs.plate_labels(options[0], options[2])
+		return send_plate(cached_plate)
+	cache_lookups.inc(('miss',))
+	
+	# The DXF is encoded straight into this buffer as it's written
+	output_data = io.BytesIO()
 	
 	try:
-		gen = plategen.PlateGenerator(cutout_type, cutout_radius, stab_type, stab_radius, acoustic_type, acoustic_radius, 
-		unit_width, unit_height, False)
+		gen = plategen.PlateGenerator(*options, False)
 	except(ValueError):
-		flash("Enter valid integer arguments.")
+		flash(plate_error_message(10))
 		return render_template('base.html')
 	
 	out_code = gen.generate_plate(output_data, kle_input)
-	if (out_code == 1):
-		flash("Invalid KLE data.")
-		return render_template('base.html')
-	elif (out_code == 2):
-		flash("Unsupported stabilizer cutout type.")
-		return render_template('base.html')
-	elif (out_code == 3):
-		flash("Unsupported switch cutout type.")
-		return render_template('base.html')
-	elif (out_code == 4):
-		flash("Switch fillet radius must be between 0 and half the cutout width/height.")
-		return render_template('base.html')
-	elif (out_code == 5):
-		flash("Unit size must be between 0 and 1000mm.")
-		return render_template('base.html')
-	elif (out_code == 6):
-		flash("Stablizer fillet radius must be between 0 and 5.")
-		return render_template('base.html')
-	elif (out_code == 7):
-		flash("Acoustic cutout fillet radius must be between 0 and 5.")
-		return render_template('base.html')
-	elif (out_code == 8):
-		flash("Unsupported stabilizer type.")
-		return render_template('base.html')
-	elif (out_code != 0):
-		flash("Unspecified error.")
+	if (out_code != 0):
+		flash(plate_error_message(out_code, gen.parse_error))
 		return render_template('base.html')
 	
-	# Convert StringIO to BytesIO
-	output_file = io.BytesIO()
-	output_file.write(output_data.getvalue().encode('utf-8'))
-	# seeking was necessary. Python 3.5.2, Flask 0.12.2
-	output_file.seek(0)
+	plate_data = output_data.getvalue()
 	output_data.close()
 	
+	label_request(gen)
+	record_plate_metrics(platejobs.plate_stats(gen), len(plate_data))
+	plate_cache.put(cache_key, plate_data)
+	
+	return send_plate(plate_data)
+
+# SVG preview of the plate, cheap enough for the form to request as the user types
+# Takes the same form as /plategen. Responds with the SVG, or 400 with the error as plain text.
+@app.route("/preview", methods=['POST'])
+def preview_plate():
+	
+	kle_input, options = read_plate_form()
+	
+	try:
+		gen = plategen.PlateGenerator(*options, False)
+	except(ValueError):
+		return plate_error_message(10), 400, {'Content-Type': 'text/plain; charset=utf-8'}
+	
+	output_data = io.StringIO()
+	out_code = gen.generate_preview(output_data, kle_input)
+	if (out_code != 0):
+		return plate_error_message(out_code, gen.parse_error), 400, {'Content-Type': 'text/plain; charset=utf-8'}
+	
+	label_request(gen)
+	return output_data.getvalue(), 200, {'Content-Type': 'image/svg+xml'}
+
+# Update an editing session with the latest KLE data
+# Takes the same form as /plategen, plus the session-id from the previous answer (leave it out to start a session).
+# Responds with the session id, what changed and where to get the plate, or 400 with an error.
+@app.route("/plategen/session", methods=['POST'])
+def update_session():
+	
+	kle_input, options = read_plate_form()
+	
+	try:
+		session_id, session = plate_sessions.get(request.form.get('session-id'), options)
+	except(ValueError):
+		return jsonify(error=plate_error_message(10)), 400
+	
+	out_code = session.update(kle_input)
+	if (out_code != 0):
+		return jsonify(session_id=session_id, error=plate_error_message(out_code, session.generator.parse_error)), 400
+	
+	label_request(session.generator)
+	status = {
+		'session_id': session_id,
+		'keys': len(session.keys),
+		'download_url': url_for('session_download_route', session_id=session_id),
+		'preview_url': url_for('session_preview_route', session_id=session_id),
+	}
+	status.update(session.last_changes)
+	return jsonify(status)
+
+@app.route("/plategen/session/<session_id>/dxf", methods=['GET'])
+def session_download_route(session_id):
+	
+	session = plate_sessions.find(session_id)
+	if (session is None or not session.started):
+		return jsonify(error="Unknown or expired session."), 404
+	
+	output_data = io.BytesIO()
+	session.write_plate(output_data)
+	return send_plate(output_data.getvalue())
+
+@app.route("/plategen/session/<session_id>/preview", methods=['GET'])
+def session_preview_route(session_id):
+	
+	session = plate_sessions.find(session_id)
+	if (session is None or not session.started):
+		return jsonify(error="Unknown or expired session."), 404
+	
+	output_data = io.StringIO()
+	session.write_preview(output_data)
+	return output_data.getvalue(), 200, {'Content-Type': 'image/svg+xml'}
+
+# Check a plate's cutouts for overlaps and thin webs without making the DXF
+# Takes the same form as /plategen, plus an optional min-web in mm.
+# Responds with {"warnings": [...]} as returned by PlateGenerator.validate_cutouts, or 400 with an error.
+@app.route("/plategen/validate", methods=['POST'])
+def validate_plate():
+	
+	kle_input, options = read_plate_form()
+	
+	try:
+		gen = plategen.PlateGenerator(*options, False)
+	except(ValueError):
+		return jsonify(error=plate_error_message(10)), 400
+	
+	try:
+		min_web = plategen.read_min_web(request.form.get('min-web', plategen.DEFAULT_MIN_WEB))
+	except(ValueError):
+		return jsonify(error="Minimum web must be a number of mm from 0 to " + str(plategen.MAX_MIN_WEB) + "."), 400
+	
+	out_code = gen.generate_plate(None, kle_input)
+	if (out_code != 0):
+		return jsonify(error=plate_error_message(out_code, gen.parse_error)), 400
+	
+	label_request(gen)
+	return jsonify(warnings=gen.validate_cutouts(min_web))
+
+# Submit a plate to be rendered in the background
+# Takes the same form as /plategen. Options are checked straight away; the KLE data is checked by the worker.
+# Responds 202 with the job id and where to poll, 400 on bad options, or 503 if the queue is full.
+@app.route("/plategen/jobs", methods=['POST'])
+def submit_job():
+	
+	kle_input, options = read_plate_form()
+	cache_key = platecache.make_cache_key(kle_input, options)
+	
+	cached_plate = plate_cache.get(cache_key)
+	if (cached_plate is not None):
+		g.plate_labels = platejobs.plate_labels(options[0], options[2])
+		job = plate_jobs.add_finished(cached_plate, cache_key)
+	else:
+		try:
+			gen = plategen.PlateGenerator(*options, False)
+		except(ValueError):
+			return jsonify(error=plate_error_message(10)), 400
+		
+		init_code = gen.initialize_variables()
+		if (init_code != 0):
+			return jsonify(error=plate_error_message(init_code)), 400
+		label_request(gen)
+		
+		job = plate_jobs.submit(kle_input, options, cache_key)
+		if (job is None):
+			response = jsonify(error="Too many plates are being generated right now. Try again shortly.")
+			response.headers['Retry-After'] = '5'
+			return response, 503
+	
+	response = jsonify(job_status(job))
+	response.headers['Location'] = url_for('job_status_route', job_id=job.job_id)
+	return response, 202
+
+@app.route("/plategen/jobs/<job_id>", methods=['GET'])
+def job_status_route(job_id):
+	
+	job = plate_jobs.get(job_id)
+	if (job is None):
+		return jsonify(error="Unknown or expired job."), 404
+	
+	return jsonify(job_status(job))
+
+@app.route("/plategen/jobs/<job_id>/dxf", methods=['GET'])
+def job_download_route(job_id):
+	
+	job = plate_jobs.get(job_id)
+	if (job is None):
+		return jsonify(error="Unknown or expired job."), 404
+	if (job.status != 'done'):
+		return jsonify(job_status(job)), 409
+	
+	return send_plate(job.data)
+
+# Status of a job as sent to the client
+def job_status(job):
+	status = {
+		'job_id': job.job_id,
+		'status': job.current_status(),
+		'status_url': url_for('job_status_route', job_id=job.job_id),
+	}
+	if (job.status == 'done'):
+		status['download_url'] = url_for('job_download_route', job_id=job.job_id)
+	elif (job.status == 'failed'):
+		status['error'] = plate_error_message(job.code, job.error)
+	return status
+
+# Send finished DXF bytes as a download
+def send_plate(plate_data):
+
+	# The BytesIO shares plate_data rather than copying it, and send_file streams it out in chunks
+	output_file = io.BytesIO(plate_data)
+	
 	# Generate filename
 	date_time = datetime.datetime.now()
 	plate_name = 'plate-' + date_time.strftime("%Y%m%d-%H%M%S") + '.dxf'
@@ -97,4 +354,5 @@ def receive_data():
 	)
  
 if (__name__ == "__main__"):
-    app.run()
\ No newline at end of file
+    # Each request gets its own PlateGenerator with private decimal/mpmath contexts, so requests can be served on parallel threads
+    app.run(threaded=True)
\ No newline at end of file